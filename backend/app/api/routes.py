@@ -1,63 +1,96 @@
-from fastapi import APIRouter, Query, HTTPException, Depends
-from typing import List, Optional
+from fastapi import APIRouter, Query, HTTPException, Depends, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from typing import Any, Callable, Dict, Hashable, Iterator, List, Optional, Tuple
 from datetime import datetime, timedelta
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, func
+from sqlalchemy import func, or_, select
 import logging
 import asyncio
 import threading
 import time
+import numpy as np
+import orjson
 
-from app.db.session import SessionLocal, get_db
-from app.db.models import TrafficFlow, TrafficIncident
-from app.utils.logger import get_logger
+from app.db.session import SessionLocal, get_async_db, pool_status
+from app.db.models import FlowRefresh, FlowRefreshSegment, Road, RoadSegment, TrafficFlowObservation, TrafficIncident
+from app.db.flow_queries import iter_recent_flow, keyframe_window, recent_flow, road_congestion
+from app.db.flow_rollups import RESOLUTIONS, aggregate_flow, drop_expired_rollups
+from app.db.flow_baselines import current_anomalies, iter_scored_flow, score_flow
+from app.db.changes import Changes, ChangeTracker
+from app.db.road_search import get_road_name_index, normalize
+from app.db.tiles import render_tile, valid_tile
+from app.db.pagination import Cursor, decode_cursor, encode_cursor, filters_fingerprint
+from app.db.spatial import incident_bbox_filter
+from app.db.partitions import drop_expired_partitions, ensure_partitions, is_partitioned
+from app.utils.single_flight import SingleFlight
+from app.utils.response_cache import CachedResponse, ResponseCache
+from app.utils.broadcast import Broadcaster, Section, SpatialMessage
+from app.utils.api_client import AsyncHereAPIClient
 from app.scheduler.traffic_flow import TrafficFlowETL
 from app.scheduler.traffic_incidents import TrafficIncidentsETL
+from app.scheduler.tiled_ingestion import TiledIngestion
+from app.scheduler.refresh_scheduler import RefreshScheduler
+from app.config import settings
+from bay_area_cities import BAY_AREA_CITIES
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
 # Global variables for ETL state
 last_etl_time = None
-etl_in_progress = False
-fallback_timer = None
+refresh_timer = None
 cleanup_timer = None
 
+# One in-flight refresh per data source, shared by the API loop, timer threads and /etl/trigger
+coordinator = SingleFlight()
+ETL_KEY = "etl"
+CLEANUP_KEY = "cleanup"
+
+# Rendered GET responses, dropped whenever an ETL or cleanup changes the data
+response_cache = ResponseCache(settings.RESPONSE_CACHE_MB * 1024 * 1024)
+
+# Clients of /stream, and what each ETL run changed for them
+broadcaster = Broadcaster()
+change_tracker = ChangeTracker()
+
 # ETL instances
 flow_etl = TrafficFlowETL()
 incidents_etl = TrafficIncidentsETL()
 
-# San Francisco bounding box ONLY
+# San Francisco bounding box
 SF_BBOX = "-122.52,37.70,-122.35,37.83"
 
+def resolve_ingestion_regions(setting: str) -> Dict[str, str]:
+    """Map the INGESTION_REGIONS setting to {region name: bbox}"""
+    if setting.strip().lower() == "all":
+        return dict(BAY_AREA_CITIES)
+    regions = {}
+    for name in (part.strip() for part in setting.split(",")):
+        if name in BAY_AREA_CITIES:
+            regions[name] = BAY_AREA_CITIES[name]
+        elif name:
+            logger.warning(f"Unknown ingestion region '{name}', skipping")
+    return regions or {"San Francisco": SF_BBOX}
+
+INGESTION_REGIONS = resolve_ingestion_regions(settings.INGESTION_REGIONS)
+tiled_ingestion = TiledIngestion(flow_etl, incidents_etl)
+
+# Decides when each region/endpoint is refreshed within the monthly HERE budget
+refresh_scheduler = RefreshScheduler(INGESTION_REGIONS, settings.HERE_MONTHLY_CALL_BUDGET)
+
 # Configuration
-CACHE_WINDOW_MINUTES = 30  # Cache window for user visits (30 minutes)
-FALLBACK_HOURS = 5  # Fallback timer when no users visit (5 hours)
 CLEANUP_HOURS = 24  # Database cleanup every 24 hours
+DEFAULT_LIMIT = 100  # Rows per JSON response unless `limit` is given
+MAX_JSON_LIMIT = 1000  # Larger results must stream as NDJSON
+STREAM_CHUNK_ROWS = 1000  # Rows fetched from the cursor and sent per NDJSON chunk
+MVT_MEDIA_TYPE = "application/vnd.mapbox-vector-tile"
+STREAM_KEEPALIVE_SECONDS = 15  # Idle /stream connections get a keepalive this often
+STREAM_DEMAND_SECONDS = 60  # An open /stream counts as one request for its bbox this often
 
 def should_run_etl():
-    """Check if ETL should run based on cache window"""
-    global last_etl_time
-    
-    if last_etl_time is None:
-        return True
-    
-    time_since_last_etl = datetime.utcnow() - last_etl_time
-    cache_duration = timedelta(minutes=CACHE_WINDOW_MINUTES)
-    
-    return time_since_last_etl > cache_duration
-
-def should_run_fallback_etl():
-    """Check if fallback ETL should run (5 hours)"""
-    global last_etl_time
-    
-    if last_etl_time is None:
-        return True
-    
-    time_since_last_etl = datetime.utcnow() - last_etl_time
-    fallback_duration = timedelta(hours=FALLBACK_HOURS)
-    
-    return time_since_last_etl > fallback_duration
+    """Check if any region/endpoint is due for a refresh under the API budget"""
+    return bool(refresh_scheduler.due_jobs())
 
 def should_run_cleanup():
     """Check if database cleanup should run (24 hours)"""
@@ -71,63 +104,251 @@ def should_run_cleanup():
     
     return time_since_last_cleanup > cleanup_duration
 
-async def run_etl_async():
-    """Run ETL asynchronously for San Francisco ONLY"""
-    global last_etl_time, etl_in_progress
+def run_etl_sync(force: bool = False):
+    """Refresh the due region/endpoint pairs, or all of them if forced"""
+    global last_etl_time
     
-    if etl_in_progress:
-        logger.info("ETL already in progress, skipping...")
+    jobs = refresh_scheduler.all_jobs() if force else refresh_scheduler.due_jobs()
+    if not jobs:
+        logger.info("No region/endpoint is due for a refresh")
         return
-    
-    etl_in_progress = True
-    logger.info("🚀 Starting on-demand ETL for San Francisco...")
-    logger.info(f"📊 Current cache window: {CACHE_WINDOW_MINUTES} minutes")
-    logger.info(f"⏰ Fallback timer: {FALLBACK_HOURS} hours")
+    logger.info(f"🚀 Starting ETL for {len(jobs)} region/endpoint pairs: {jobs}")
     
     try:
-        # Run flow ETL for San Francisco ONLY
-        logger.info("Running traffic flow ETL for San Francisco...")
-        flow_etl.run(SF_BBOX)
-        
-        # Run incidents ETL for San Francisco ONLY
-        logger.info("Running traffic incidents ETL for San Francisco...")
-        incidents_etl.run(SF_BBOX)
-        
-        last_etl_time = datetime.utcnow()
-        logger.info(f"ETL completed successfully at {last_etl_time}")
-        
+        # Runs on a single-flight worker thread, so it gets its own event loop
+        asyncio.run(run_etl_pipelines(jobs))
     except Exception as e:
         logger.error(f"ETL failed: {e}")
-        raise HTTPException(status_code=500, detail=f"ETL failed: {str(e)}")
+        raise
     finally:
-        etl_in_progress = False
-
-async def run_cleanup_async():
-    """Run database cleanup asynchronously"""
-    global cleanup_in_progress
-    
-    if hasattr(run_cleanup_async, 'cleanup_in_progress') and run_cleanup_async.cleanup_in_progress:
-        logger.info("Cleanup already in progress, skipping...")
-        return
+        # Tiles may have committed even if the run failed
+        response_cache.invalidate()
+        push_changes()
     
-    run_cleanup_async.cleanup_in_progress = True
+    last_etl_time = datetime.utcnow()
+    logger.info(f"ETL completed successfully at {last_etl_time}")
+
+async def run_etl_pipelines(jobs):
+    """Fetch the requested region/endpoint pairs concurrently over one pooled client"""
+    flow_tiles = {region: INGESTION_REGIONS[region] for region, endpoint in jobs if endpoint == "flow"}
+    incident_tiles = {region: INGESTION_REGIONS[region] for region, endpoint in jobs if endpoint == "incidents"}
+    async with AsyncHereAPIClient() as api_client:
+        try:
+            return await tiled_ingestion.run_async(
+                flow_tiles, incident_tiles, api_client, on_tile=refresh_scheduler.observe_tile
+            )
+        finally:
+            refresh_scheduler.record_refresh(jobs)
+            await asyncio.to_thread(refresh_scheduler.record_calls, api_client.calls_made)
+
+def change_message(db: Session, changes: Changes) -> SpatialMessage:
+    """The `delta` event of an ETL run; each item carries its extent for bbox subscriptions"""
+    segments, extents = [], []
+    segment_scores = score_flow(db, [(row.timestamp, row) for row in changes.segments])
+    for row, scores in zip(changes.segments, segment_scores):
+        change = {
+            "segment_id": row.segment_id,
+            "timestamp": row.timestamp.isoformat(),
+            "road_name": row.road_name,
+            "speed": row.speed,
+            "congestion_level": row.congestion_level,
+            **scores
+        }
+        # Clients know the geometry of segments they loaded; only new ones carry it
+        if row.first_seen > changes.since:
+            change.update(latitude=row.lat, longitude=row.lon, geometry=row.geometry)
+        segments.append(orjson.dumps(change))
+        extents.append((
+            row.min_lon if row.min_lon is not None else row.lon,
+            row.min_lat if row.min_lat is not None else row.lat,
+            row.max_lon if row.max_lon is not None else row.lon,
+            row.max_lat if row.max_lat is not None else row.lat
+        ))
+    def points(rows):
+        return np.array([(row.lon, row.lat, row.lon, row.lat) for row in rows], dtype=float).reshape(-1, 4)
+    return SpatialMessage("delta", {
+        "generation": response_cache.generation,
+        "from": changes.since.isoformat(),
+        "to": changes.until.isoformat()
+    }, [
+        Section("segments", segments, np.array(extents, dtype=float).reshape(-1, 4)),
+        Section("incidents", [orjson.dumps(incident_record(row)) for row in changes.incidents], points(changes.incidents)),
+        Section("ended_incidents", [orjson.dumps(row.id) for row in changes.ended], points(changes.ended))
+    ])
+
+def push_changes():
+    """Send what the last ETL run changed to /stream clients; the first call only records the current state"""
+    db = SessionLocal()
+    try:
+        # Collected even without clients, so the first to connect gets only new changes
+        changes = change_tracker.collect(db)
+        if changes is not None and (changes.segments or changes.incidents or changes.ended) and broadcaster.clients:
+            broadcaster.publish(change_message(db, changes))
+    except Exception as e:
+        # Stream clients miss this run's changes; GET responses are unaffected
+        logger.error(f"Pushing ETL changes failed: {e}")
+    finally:
+        db.close()
+
+def restore_refresh_state():
+    """Take the last refresh times from the database, so a restarted worker does not treat stored data as stale"""
+    global last_etl_time
+    db = SessionLocal()
+    try:
+        flow_refreshed = db.query(func.max(FlowRefresh.timestamp)).scalar()
+        incidents_refreshed = db.query(func.max(TrafficIncident.last_seen)).scalar()
+    finally:
+        db.close()
+    for endpoint, refreshed in (("flow", flow_refreshed), ("incidents", incidents_refreshed)):
+        if refreshed:
+            refresh_scheduler.record_refresh([job for job in refresh_scheduler.all_jobs() if job[1] == endpoint], refreshed)
+    refreshed = [when for when in (flow_refreshed, incidents_refreshed) if when]
+    if refreshed and last_etl_time is None:
+        last_etl_time = max(refreshed)
+        logger.info(f"Last ETL run restored from the database: {last_etl_time}")
+
+async def start_change_tracking():
+    """Record the current data for push_changes(), under the ETL key so no run is half-written meanwhile"""
+    await coordinator.run(ETL_KEY, push_changes)
+
+def start_etl(force: bool = False):
+    """Start an ETL refresh, or join the one already in flight"""
+    return coordinator.submit(ETL_KEY, run_etl_sync, force)
+
+async def run_etl_async(timeout: Optional[float] = None, force: bool = False):
+    """Start or join the ETL refresh and await its result (asyncio.TimeoutError on timeout)"""
+    try:
+        await coordinator.run(ETL_KEY, run_etl_sync, force, timeout=timeout)
+    except asyncio.TimeoutError:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"ETL failed: {str(e)}")
+
+def get_refresh_state(due: Optional[bool] = None):
+    """fresh: nothing due; refreshing: ETL running; stale: a refresh is due, idle (due: should_run_etl(), if known)"""
+    if coordinator.in_progress(ETL_KEY):
+        return "refreshing"
+    if due is None:
+        due = should_run_etl()
+    return "stale" if due else "fresh"
+
+async def ensure_fresh_data(response: Response, source: str, bbox: Optional[str] = None):
+    """Record demand, apply the refresh policy for a GET endpoint and set freshness headers"""
+    refresh_scheduler.record_demand(bbox)
+    # The scheduler reads the shared HERE call count from the database, so off the event loop
+    due = await asyncio.to_thread(should_run_etl)
+    if due:
+        if settings.STALE_WHILE_REVALIDATE:
+            logger.info(f"Refresh due - serving stale {source} data, refreshing in background")
+            start_etl()
+        else:
+            logger.info(f"Refresh due - running ETL before serving {source} data")
+            await run_etl_async()
+            due = await asyncio.to_thread(should_run_etl)
+    
+    response.headers["X-Refresh-State"] = get_refresh_state(due)
+    if last_etl_time:
+        data_age = (datetime.utcnow() - last_etl_time).total_seconds()
+        response.headers["X-Data-Age"] = str(int(data_age))
+        response.headers["X-Data-Updated"] = last_etl_time.isoformat()
+
+def parse_bbox(bbox: Optional[str]) -> Optional[Tuple[float, ...]]:
+    """Parse "west,south,east,north"; None if absent or not four values"""
+    if not bbox:
+        return None
+    coords = bbox.split(',')
+    return tuple(map(float, coords)) if len(coords) == 4 else None
+
+def if_none_match(request: Request, etag: str) -> bool:
+    """True if the client's If-None-Match names etag (weak comparison, as RFC 9110 requires)"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
+
+def render_cached(request: Request, response: Response, entry: CachedResponse) -> Response:
+    """The cached body, or 304 Not Modified if the client has it, with the freshness headers"""
+    headers = {name: value for name, value in response.headers.items() if name != "content-length"}
+    headers["ETag"] = entry.etag
+    headers["Cache-Control"] = "no-cache"  # Clients may keep it but must revalidate
+    if if_none_match(request, entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type=entry.media_type, headers=headers)
+
+def cached_response(request: Request, response: Response, key: Hashable) -> Tuple[int, Optional[Response]]:
+    """(cache generation, cached response or None); pass the generation to cache_response"""
+    generation, entry = response_cache.get(key)
+    return generation, render_cached(request, response, entry) if entry is not None else None
+
+def cache_response(
+    request: Request,
+    response: Response,
+    key: Hashable,
+    generation: int,
+    content: Any,
+    media_type: Optional[str] = None
+) -> Response:
+    """Render content as JSON (or send bytes as media_type), cache it for the generation it was read in"""
+    if media_type is None:
+        entry = response_cache.put(key, generation, orjson.dumps(content))
+    else:
+        entry = response_cache.put(key, generation, content, media_type)
+    return render_cached(request, response, entry)
+
+def run_cleanup_sync():
+    """Delete records older than the retention window"""
     logger.info("Starting database cleanup...")
     
+    db = SessionLocal()
     try:
-        db = SessionLocal()
+        # Keep daily partitions created ahead of ingestion (no-op on SQLite)
+        ensure_partitions(db, TrafficFlowObservation.__table__)
+        ensure_partitions(db, FlowRefreshSegment.__table__)
         
         # Calculate cutoff time (24 hours ago)
         cutoff_time = datetime.utcnow() - timedelta(hours=CLEANUP_HOURS)
         
-        # Delete old traffic flow records
-        flow_deleted = db.query(TrafficFlow).filter(TrafficFlow.timestamp < cutoff_time).delete()
-        logger.info(f"Deleted {flow_deleted} old traffic flow records")
+        # Delete old flow refreshes and their observations, then segments nothing
+        # observes anymore. Observations up to a keyframe older than the oldest
+        # kept refresh are still carried forward into it, so they stay.
+        db.query(FlowRefresh).filter(FlowRefresh.timestamp < cutoff_time).delete(synchronize_session=False)
+        reported = FlowRefreshSegment.__table__
+        if is_partitioned(db, reported):
+            drop_expired_partitions(db, reported, cutoff_time)
+        else:
+            db.query(FlowRefreshSegment)\
+                .filter(FlowRefreshSegment.timestamp < cutoff_time)\
+                .delete(synchronize_session=False)
+        flow_cutoff = cutoff_time - keyframe_window()
+        observations = TrafficFlowObservation.__table__
+        if is_partitioned(db, observations):
+            # Postgres: drop whole expired daily partitions, no row deletes
+            dropped = drop_expired_partitions(db, observations, flow_cutoff)
+            logger.info(f"Dropped traffic flow partitions {dropped}")
+        else:
+            flow_deleted = db.query(TrafficFlowObservation)\
+                .filter(TrafficFlowObservation.timestamp < flow_cutoff)\
+                .delete(synchronize_session=False)
+            logger.info(f"Deleted {flow_deleted} old traffic flow records")
+        segments_deleted = db.query(RoadSegment)\
+            .filter(~db.query(TrafficFlowObservation.id)
+                    .filter(TrafficFlowObservation.segment_id == RoadSegment.id)
+                    .exists())\
+            .delete(synchronize_session=False)
+        logger.info(f"Deleted {segments_deleted} road segments without observations")
+        roads_deleted = db.query(Road).filter(Road.last_seen < cutoff_time).delete(synchronize_session=False)
+        logger.info(f"Deleted {roads_deleted} roads not seen since {cutoff_time}")
+        # Rollups have their own, longer retention per resolution
+        rollups_deleted = drop_expired_rollups(db)
+        logger.info(f"Deleted {rollups_deleted} expired flow rollup buckets")
         
         # Delete old traffic incident records
         incidents_deleted = db.query(TrafficIncident).filter(TrafficIncident.timestamp < cutoff_time).delete()
         logger.info(f"Deleted {incidents_deleted} old traffic incident records")
         
         db.commit()
+        response_cache.invalidate()
         
         # Update last cleanup time
         should_run_cleanup.last_cleanup_time = datetime.utcnow()
@@ -138,23 +359,31 @@ async def run_cleanup_async():
         db.rollback()
     finally:
         db.close()
-        run_cleanup_async.cleanup_in_progress = False
 
-def start_fallback_timer():
-    """Start the fallback timer for 5-hour intervals"""
-    global fallback_timer
+async def run_cleanup_async():
+    """Start or join the database cleanup and await it"""
+    await coordinator.run(CLEANUP_KEY, run_cleanup_sync)
+
+def start_refresh_timer():
+    """Start the background thread that runs refreshes when the scheduler says they are due"""
+    global refresh_timer
     
-    def fallback_worker():
+    def refresh_worker():
         while True:
-            time.sleep(60)  # Check every minute
-            if should_run_fallback_etl():
-                logger.info("Fallback timer triggered - running ETL")
-                asyncio.run(run_etl_async())
-    
-    if fallback_timer is None or not fallback_timer.is_alive():
-        fallback_timer = threading.Thread(target=fallback_worker, daemon=True)
-        fallback_timer.start()
-        logger.info("Fallback timer started (5-hour intervals)")
+            # Sleep until the next refresh is due, rechecking at least every
+            # minute so changes in demand and budget are picked up
+            time.sleep(min(max(refresh_scheduler.seconds_until_next_due(), 5), 60))
+            if should_run_etl():
+                logger.info("Refresh timer triggered - running due refreshes")
+                try:
+                    coordinator.run_sync(ETL_KEY, run_etl_sync)
+                except Exception:
+                    pass  # Already logged by run_etl_sync; retry on the next check
+    
+    if refresh_timer is None or not refresh_timer.is_alive():
+        refresh_timer = threading.Thread(target=refresh_worker, daemon=True)
+        refresh_timer.start()
+        logger.info("Refresh timer started (budget-aware scheduling)")
 
 def start_cleanup_timer():
     """Start the cleanup timer for 24-hour intervals"""
@@ -165,7 +394,7 @@ def start_cleanup_timer():
             time.sleep(60)  # Check every minute
             if should_run_cleanup():
                 logger.info("Cleanup timer triggered - running database cleanup")
-                asyncio.run(run_cleanup_async())
+                coordinator.run_sync(CLEANUP_KEY, run_cleanup_sync)
     
     if cleanup_timer is None or not cleanup_timer.is_alive():
         cleanup_timer = threading.Thread(target=cleanup_worker, daemon=True)
@@ -173,7 +402,7 @@ def start_cleanup_timer():
         logger.info("Cleanup timer started (24-hour intervals)")
 
 # Start timers when module loads
-start_fallback_timer()
+start_refresh_timer()
 start_cleanup_timer()
 
 @router.get("/")
@@ -185,178 +414,554 @@ async def health_check():
     """Health check endpoint."""
     return {"status": "healthy", "timestamp": datetime.utcnow().isoformat()}
 
+def flow_record(refreshed_at: datetime, row, scores: Dict[str, Optional[float]]) -> Dict[str, Any]:
+    """A flow row with its anomaly scoring fields (see app.db.flow_baselines)"""
+    return {
+        # One stored observation can stand for several refreshes, so its row id would repeat
+        "id": f"{refreshed_at.isoformat()}/{row.segment_id}",
+        "segment_id": row.segment_id,
+        "timestamp": refreshed_at.isoformat(),
+        "road_name": row.road_name,
+        "speed": row.speed,
+        "congestion_level": row.congestion_level,
+        "latitude": row.lat,
+        "longitude": row.lon,
+        "geometry": row.geometry,
+        **scores
+    }
+
+def incident_record(row) -> Dict[str, Any]:
+    return {
+        "id": row.id,
+        "timestamp": row.timestamp.isoformat(),
+        "type": row.type,
+        "description": row.description,
+        "lat": row.lat,
+        "lon": row.lon,
+        "first_seen": row.first_seen.isoformat(),
+        "last_seen": row.last_seen.isoformat(),
+        "ended_at": row.ended_at.isoformat() if row.ended_at else None
+    }
+
+INCIDENT_COLUMNS = (
+    TrafficIncident.id,
+    TrafficIncident.timestamp,
+    TrafficIncident.type,
+    TrafficIncident.description,
+    TrafficIncident.lat,
+    TrafficIncident.lon,
+    TrafficIncident.first_seen,
+    TrafficIncident.last_seen,
+    TrafficIncident.ended_at,
+)
+
+def incidents_query(
+    db: Session,
+    limit: Optional[int],
+    hours: Optional[int],
+    bounds: Optional[Tuple[float, ...]],
+    incident_type: Optional[str],
+    include_ended: bool,
+    cursor: Optional[Cursor] = None,
+    snapshot: Optional[datetime] = None
+):
+    """Select of INCIDENT_COLUMNS in (timestamp, id) descending keyset order"""
+    query = select(*INCIDENT_COLUMNS)
+    
+    if cursor:
+        # Strictly after the last row of the previous page (which is within the snapshot);
+        # the leading bound lets the (timestamp, id) index seek straight to it
+        query = query.where(
+            TrafficIncident.timestamp <= cursor.timestamp,
+            or_(TrafficIncident.timestamp < cursor.timestamp, TrafficIncident.id < cursor.id)
+        )
+    elif snapshot:
+        query = query.where(TrafficIncident.timestamp <= snapshot)
+    
+    if hours:
+        cutoff_time = (snapshot or datetime.utcnow()) - timedelta(hours=hours)
+        query = query.where(TrafficIncident.timestamp >= cutoff_time)
+    
+    if bounds:
+        query = query.where(incident_bbox_filter(db, bounds))
+    
+    if incident_type:
+        query = query.where(TrafficIncident.type.ilike(f"%{incident_type}%"))
+    
+    if not include_ended:
+        query = query.where(TrafficIncident.ended_at.is_(None))
+    
+    query = query.order_by(TrafficIncident.timestamp.desc(), TrafficIncident.id.desc())
+    return query.limit(limit) if limit is not None else query
+
+def page_cursor(token: Optional[str], filters: str) -> Tuple[Optional[Cursor], datetime]:
+    """(decoded cursor or None, snapshot time of the walk); 400 on a bad cursor"""
+    if not token:
+        return None, datetime.utcnow()
+    try:
+        cursor = decode_cursor(token, filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return cursor, cursor.snapshot
+
+def next_cursor(rows: List[Any], limit: int, snapshot: datetime, filters: str, key) -> Optional[str]:
+    """Cursor after the last row of a full page (key(row) -> (timestamp, id)), else None"""
+    if len(rows) < limit:
+        return None
+    timestamp, row_id = key(rows[-1])
+    return encode_cursor(Cursor(snapshot, timestamp, row_id, filters))
+
+def json_limit(limit: Optional[int]) -> int:
+    """Default and cap of `limit` for buffered JSON responses; NDJSON streams are uncapped"""
+    if limit is None:
+        return DEFAULT_LIMIT
+    if limit > MAX_JSON_LIMIT:
+        raise HTTPException(status_code=422, detail=f"limit above {MAX_JSON_LIMIT} needs format=ndjson")
+    return limit
+
+def stream_ndjson(response: Response, records: Callable[[Session], Iterator[Dict[str, Any]]]) -> StreamingResponse:
+    """
+    Stream records(db) as newline-delimited JSON.
+    
+    The stream runs after the endpoint returns, so it opens its own session
+    rather than using the request's; rows are encoded and sent in chunks.
+    """
+    def generate():
+        db = SessionLocal()
+        try:
+            lines = []
+            for record in records(db):
+                lines.append(orjson.dumps(record))
+                if len(lines) >= STREAM_CHUNK_ROWS:
+                    yield b"\n".join(lines) + b"\n"
+                    lines = []
+            if lines:
+                yield b"\n".join(lines) + b"\n"
+        finally:
+            db.close()
+    
+    headers = {name: value for name, value in response.headers.items() if name != "content-length"}
+    return StreamingResponse(generate(), media_type="application/x-ndjson", headers=headers)
+
 @router.get("/traffic/flow")
 async def get_traffic_flow(
-    limit: int = Query(100, ge=1, le=1000),
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, description="Default 100, at most 1000 unless format=ndjson"),
     hours: Optional[int] = Query(None, ge=1, le=168),
     bbox: Optional[str] = Query(None),
     road_name: Optional[str] = Query(None),
-    db: Session = Depends(get_db)
+    output: str = Query("json", alias="format", pattern="^(json|ndjson)$"),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Get traffic flow data with on-demand ETL"""
-    # Check if we need to run ETL
-    if should_run_etl():
-        logger.info("Cache expired - running ETL before serving traffic flow data")
-        await run_etl_async()
-    
-    # Build query
-    query = db.query(TrafficFlow)
-    
-    if hours:
-        cutoff_time = datetime.utcnow() - timedelta(hours=hours)
-        query = query.filter(TrafficFlow.timestamp >= cutoff_time)
-    
-    if bbox:
-        # Parse bbox: "west,south,east,north"
-        coords = bbox.split(',')
-        if len(coords) == 4:
-            west, south, east, north = map(float, coords)
-            query = query.filter(
-                TrafficFlow.lon >= west,
-                TrafficFlow.lon <= east,
-                TrafficFlow.lat >= south,
-                TrafficFlow.lat <= north
-            )
-    
-    if road_name:
-        query = query.filter(TrafficFlow.road_name.ilike(f"%{road_name}%"))
+    """Get traffic flow data with on-demand ETL (format=ndjson streams every matching row)"""
+    # Serve cached data, refreshing per the cache policy
+    await ensure_fresh_data(response, "traffic flow", bbox)
+    
+    bounds = parse_bbox(bbox)
+    filters = filters_fingerprint("flow", hours, bounds, normalize(road_name) if road_name else None)
+    page, snapshot = page_cursor(cursor, filters)
+    since = snapshot - timedelta(hours=hours) if hours else None
+    after = (page.timestamp, page.id) if page else None
+    
+    if output == "ndjson":
+        return stream_ndjson(response, lambda stream_db: (
+            flow_record(refreshed_at, row, scores)
+            for refreshed_at, row, scores in iter_scored_flow(stream_db, iter_recent_flow(
+                stream_db, limit, since=since, bounds=bounds, road_name=road_name, yield_per=STREAM_CHUNK_ROWS,
+                until=snapshot, after=after
+            ), STREAM_CHUNK_ROWS)
+        ))
+    limit = json_limit(limit)
+    
+    # Rendered once per ETL generation; polling clients revalidate with If-None-Match
+    key = ("flow", limit, filters, cursor)
+    generation, cached = cached_response(request, response, key)
+    if cached is not None:
+        return cached
+    
+    # Rebuild each refresh's values from change-only storage, newest first
+    results = await db.run_sync(
+        recent_flow, limit, since=since, bounds=bounds, road_name=road_name, until=snapshot, after=after
+    )
+    # One primary-key lookup per record into the day-of-week / hour baselines
+    scores = await db.run_sync(score_flow, results)
+    
+    return cache_response(request, response, key, generation, {
+        "data": [flow_record(refreshed_at, row, score) for (refreshed_at, row), score in zip(results, scores)],
+        "total": len(results),
+        "next_cursor": next_cursor(results, limit, snapshot, filters, lambda item: (item[0], item[1].id)),
+        "timestamp": datetime.utcnow().isoformat()
+    })
+
+@router.get("/traffic/flow/aggregate")
+async def get_flow_aggregate(
+    request: Request,
+    response: Response,
+    road_name: Optional[str] = Query(None, description="Roads whose name contains this; all roads if omitted"),
+    segment_id: Optional[str] = Query(None, description="One segment instead of roads"),
+    hours: int = Query(6, ge=1, le=2160),
+    resolution: Optional[str] = Query(None, pattern="^(5m|1h)$", description="Default 5m for roads up to 24 hours, else 1h"),
+    percentiles: str = Query("50,90,95", pattern=r"^\d{1,2}(\.\d+)?(,\d{1,2}(\.\d+)?)*$"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Speed and jamFactor statistics over the last `hours` from the flow rollups, per bucket and overall"""
+    await ensure_fresh_data(response, "flow aggregate")
+    
+    if segment_id and resolution == "5m":
+        raise HTTPException(status_code=422, detail="Segment rollups are hourly")
+    resolution = resolution or ("5m" if hours <= 24 and not segment_id else "1h")
+    levels = tuple(sorted({float(value) for value in percentiles.split(",")}))
+    key = ("flow_aggregate", normalize(road_name) if road_name else None, segment_id, hours, resolution, levels)
+    generation, cached = cached_response(request, response, key)
+    if cached is not None:
+        return cached
+    
+    now = datetime.utcnow()
+    since = now - timedelta(hours=hours)
+    # A few hundred rollup rows per road and window, whatever the raw volume
+    result = await db.run_sync(
+        aggregate_flow, RESOLUTIONS[resolution], since,
+        road_name=road_name, segment_id=segment_id, percentiles=levels
+    )
+    
+    return cache_response(request, response, key, generation, {
+        "road_name": road_name,
+        "segment_id": segment_id,
+        "resolution": resolution,
+        "from": since.isoformat(),
+        "to": now.isoformat(),
+        "summary": result["summary"],
+        "buckets": [dict(bucket, bucket=bucket["bucket"].isoformat()) for bucket in result["buckets"]],
+        "timestamp": now.isoformat()
+    })
+
+@router.get("/traffic/flow/anomalies")
+async def get_flow_anomalies(
+    request: Request,
+    response: Response,
+    min_score: float = Query(2.0, description="Lowest anomaly_score returned, in standard deviations"),
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_JSON_LIMIT),
+    bbox: Optional[str] = Query(None),
+    road_name: Optional[str] = Query(None),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Segments whose current congestion is unusual for the local day of week and hour, most unusual first"""
+    await ensure_fresh_data(response, "flow anomalies", bbox)
     
-    # Order by timestamp and limit
-    query = query.order_by(TrafficFlow.timestamp.desc()).limit(limit)
+    bounds = parse_bbox(bbox)
+    key = ("flow_anomalies", min_score, limit, bounds, normalize(road_name) if road_name else None)
+    generation, cached = cached_response(request, response, key)
+    if cached is not None:
+        return cached
     
-    # Execute query
-    results = query.all()
+    results = await db.run_sync(current_anomalies, min_score, bounds=bounds, road_name=road_name, limit=limit)
     
-    return {
-        "data": [
-        {
-            "id": record.id,
-            "timestamp": record.timestamp.isoformat(),
-            "road_name": record.road_name,
-            "speed": record.speed,
-            "congestion_level": record.congestion_level,
-                "latitude": record.lat,
-                "longitude": record.lon,
-                "geometry": record.geometry
-        }
-        for record in results
-        ],
+    return cache_response(request, response, key, generation, {
+        "data": [flow_record(refreshed_at, row, scores) for refreshed_at, row, scores in results],
         "total": len(results),
         "timestamp": datetime.utcnow().isoformat()
-    }
+    })
 
 @router.get("/traffic/incidents")
 async def get_traffic_incidents(
-    limit: int = Query(100, ge=1, le=1000),
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, description="Default 100, at most 1000 unless format=ndjson"),
     hours: Optional[int] = Query(None, ge=1, le=168),
     bbox: Optional[str] = Query(None),
     incident_type: Optional[str] = Query(None),
-    db: Session = Depends(get_db)
+    include_ended: bool = Query(False),
+    output: str = Query("json", alias="format", pattern="^(json|ndjson)$"),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Get traffic incidents data with on-demand ETL"""
-    # Check if we need to run ETL
-    if should_run_etl():
-        logger.info("Cache expired - running ETL before serving traffic incidents data")
-        await run_etl_async()
-    
-    # Build query
-    query = db.query(TrafficIncident)
-    
-    if hours:
-        cutoff_time = datetime.utcnow() - timedelta(hours=hours)
-        query = query.filter(TrafficIncident.timestamp >= cutoff_time)
-    
-    if bbox:
-        # Parse bbox: "west,south,east,north"
-        coords = bbox.split(',')
-        if len(coords) == 4:
-            west, south, east, north = map(float, coords)
-            query = query.filter(
-                TrafficIncident.lon >= west,
-                TrafficIncident.lon <= east,
-                TrafficIncident.lat >= south,
-                TrafficIncident.lat <= north
+    """Get traffic incidents data with on-demand ETL (active incidents unless include_ended)"""
+    # Serve cached data, refreshing per the cache policy
+    await ensure_fresh_data(response, "traffic incidents", bbox)
+    
+    bounds = parse_bbox(bbox)
+    filters = filters_fingerprint("incidents", hours, bounds, incident_type, include_ended)
+    page, snapshot = page_cursor(cursor, filters)
+    
+    if output == "ndjson":
+        return stream_ndjson(response, lambda stream_db: (
+            incident_record(row)
+            for row in stream_db.execute(
+                incidents_query(stream_db, limit, hours, bounds, incident_type, include_ended, page, snapshot)
+                .execution_options(yield_per=STREAM_CHUNK_ROWS)
             )
+        ))
+    limit = json_limit(limit)
     
-    if incident_type:
-        query = query.filter(TrafficIncident.type.ilike(f"%{incident_type}%"))
+    key = ("incidents", limit, filters, cursor)
+    generation, cached = cached_response(request, response, key)
+    if cached is not None:
+        return cached
     
-    # Order by timestamp and limit
-    query = query.order_by(TrafficIncident.timestamp.desc()).limit(limit)
+    results = await db.run_sync(lambda session: session.execute(
+        incidents_query(session, limit, hours, bounds, incident_type, include_ended, page, snapshot)
+    ).all())
     
-    # Execute query
-    results = query.all()
-    
-    return {
-        "data": [
-        {
-            "id": record.id,
-            "timestamp": record.timestamp.isoformat(),
-            "type": record.type,
-            "description": record.description,
-            "lat": record.lat,
-            "lon": record.lon
-        }
-        for record in results
-        ],
+    return cache_response(request, response, key, generation, {
+        "data": [incident_record(row) for row in results],
         "total": len(results),
+        "next_cursor": next_cursor(results, limit, snapshot, filters, lambda row: (row.timestamp, row.id)),
         "timestamp": datetime.utcnow().isoformat()
-    }
+    })
+
+ROAD_SORTS = {
+    "name": (Road.name.asc(),),
+    "congestion": (Road.congestion_level.is_(None), Road.congestion_level.desc(), Road.name.asc()),
+    "recent": (Road.last_seen.desc(), Road.name.asc()),
+}
 
 @router.get("/traffic/roads")
 async def get_unique_roads(
+    request: Request,
+    response: Response,
     hours: int = Query(24, ge=1, le=168),
-    db: Session = Depends(get_db)
+    sort: str = Query("name", pattern="^(name|congestion|recent)$"),
+    limit: Optional[int] = Query(None, ge=1, le=10000),
+    details: bool = Query(False, description="Return catalog entries instead of names"),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Get unique road names with on-demand ETL"""
-    # Check if we need to run ETL
-    if should_run_etl():
-        logger.info("Cache expired - running ETL before serving road names data")
-        await run_etl_async()
+    """Get road names seen in the last `hours` from the road catalog, with on-demand ETL"""
+    # Serve cached data, refreshing per the cache policy
+    await ensure_fresh_data(response, "road names")
+    
+    key = ("roads", hours, sort, limit, details)
+    generation, cached = cached_response(request, response, key)
+    if cached is not None:
+        return cached
     
     cutoff_time = datetime.utcnow() - timedelta(hours=hours)
     
-    roads = db.query(TrafficFlow.road_name)\
-        .filter(TrafficFlow.timestamp >= cutoff_time)\
-        .distinct()\
-        .all()
+    # The ETL keeps one row per road, so this never touches the flow history
+    query = select(Road).where(Road.last_seen >= cutoff_time).order_by(*ROAD_SORTS[sort])
+    if limit:
+        query = query.limit(limit)
+    roads = (await db.execute(query)).scalars().all()
+    
+    if not details:
+        return cache_response(request, response, key, generation, [road.name for road in roads])
+    return cache_response(request, response, key, generation, [
+        {
+            "road_name": road.name,
+            "first_seen": road.first_seen.isoformat(),
+            "last_seen": road.last_seen.isoformat(),
+            "observations": road.observations,
+            "segments": road.segments,
+            "speed": road.speed,
+            "congestion_level": road.congestion_level,
+            "max_congestion_level": road.max_congestion_level
+        }
+        for road in roads
+    ])
+
+@router.get("/traffic/roads/search")
+async def search_roads(
+    request: Request,
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=128),
+    limit: int = Query(10, ge=1, le=50),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Autocomplete road names, with each road's congestion at the latest refresh"""
+    await ensure_fresh_data(response, "road search")
+    
+    key = ("road_search", normalize(q), limit)
+    generation, cached = cached_response(request, response, key)
+    if cached is not None:
+        return cached
+    
+    names = await db.run_sync(lambda session: get_road_name_index(session).search(q, limit))
+    flow = await db.run_sync(road_congestion, names)
     
-    return [road[0] for road in roads]
+    return cache_response(request, response, key, generation, {
+        "data": [
+        {
+            "road_name": name,
+            "segments": flow[name][1] if name in flow else 0,
+            "speed": flow[name][2] if name in flow else None,
+            "congestion_level": flow[name][3] if name in flow else None,
+            "max_congestion_level": flow[name][4] if name in flow else None,
+            "updated": flow[name][0].isoformat() if name in flow else None
+        }
+        for name in names
+        ],
+        "total": len(names),
+        "timestamp": datetime.utcnow().isoformat()
+    })
+
+def render_tile_sync(z: int, x: int, y: int) -> Tuple[bytes, int, int]:
+    db = SessionLocal()
+    try:
+        return render_tile(db, z, x, y)
+    finally:
+        db.close()
+
+@router.get("/traffic/tiles/{z}/{x}/{y}.mvt")
+async def get_traffic_tile(
+    request: Request,
+    response: Response,
+    z: int,
+    x: int,
+    y: int
+):
+    """Current flow and active incidents as a Mapbox Vector Tile (layers: flow, incidents)"""
+    if not valid_tile(z, x, y):
+        raise HTTPException(status_code=404, detail=f"No tile {z}/{x}/{y}")
+    await ensure_fresh_data(response, "traffic tiles")
+    
+    key = ("tile", z, x, y)
+    generation, cached = cached_response(request, response, key)
+    if cached is not None:
+        return cached
+    
+    # Projection and clipping are CPU-bound, so the tile renders off the event loop
+    tile, flow_features, incident_features = await asyncio.to_thread(render_tile_sync, z, x, y)
+    logger.debug(f"Rendered tile {z}/{x}/{y}: {flow_features} segments, {incident_features} incidents, {len(tile)} bytes")
+    return cache_response(request, response, key, generation, tile, media_type=MVT_MEDIA_TYPE)
+
+def stream_hello(bbox: Optional[str]) -> bytes:
+    return orjson.dumps({"type": "hello", "generation": response_cache.generation, "bbox": bbox})
+
+async def next_stream_event(subscriber, bbox: Optional[str], last_demand: float) -> Tuple[Optional[Tuple[str, bytes]], float]:
+    """(next (event, body) for the client, or None after a quiet keepalive interval; updated demand time)"""
+    # Open streams stand in for the polls that used to record demand and start due refreshes;
+    # start_etl() joins a run in flight, so all clients together still start one
+    if time.monotonic() - last_demand >= STREAM_DEMAND_SECONDS:
+        refresh_scheduler.record_demand(bbox)
+        if await asyncio.to_thread(should_run_etl):
+            start_etl()
+        last_demand = time.monotonic()
+    try:
+        return await asyncio.wait_for(subscriber.queue.get(), STREAM_KEEPALIVE_SECONDS), last_demand
+    except asyncio.TimeoutError:
+        return None, last_demand
+
+@router.get("/stream")
+async def stream_changes(bbox: Optional[str] = Query(None, description="Only changes intersecting west,south,east,north")):
+    """
+    Server-sent events: a `delta` event after each ETL run with the changed flow segments, new incidents
+    and ended incident ids in bbox (runs with nothing in bbox send nothing), and `resync` if the client
+    fell behind and should reload from the GET endpoints. Load the initial state from /traffic/flow and
+    /traffic/incidents, then apply deltas by segment_id and incident id.
+    """
+    bounds = parse_bbox(bbox)
+    subscriber = broadcaster.subscribe(bounds)
+    
+    async def events():
+        try:
+            yield b"retry: 5000\nevent: hello\ndata: " + stream_hello(bbox) + b"\n\n"
+            last_demand = 0.0
+            while True:
+                event, last_demand = await next_stream_event(subscriber, bbox, last_demand)
+                if event is None:
+                    yield b": keepalive\n\n"
+                else:
+                    yield b"event: " + event[0].encode() + b"\ndata: " + event[1] + b"\n\n"
+        finally:
+            broadcaster.unsubscribe(subscriber)
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"  # Keep reverse proxies from buffering the stream
+    })
+
+@router.websocket("/stream")
+async def stream_changes_ws(websocket: WebSocket, bbox: Optional[str] = None):
+    """
+    The /stream events over a WebSocket, as JSON text messages with a "type" field. The client
+    changes its subscription by sending {"bbox": "west,south,east,north"} ({"bbox": null} for all),
+    answered by a new `hello`.
+    """
+    await websocket.accept()
+    subscriber = broadcaster.subscribe(parse_bbox(bbox))
+    
+    def reply(event: str, body: bytes):
+        # Only the sender writes to the socket; replies queue behind pending deltas
+        try:
+            subscriber.queue.put_nowait((event, body))
+        except asyncio.QueueFull:
+            pass  # A resync is already queued
+    
+    async def receive_subscriptions():
+        nonlocal bbox
+        while True:
+            text = await websocket.receive_text()
+            try:
+                requested = orjson.loads(text)["bbox"]
+                bounds = parse_bbox(requested)
+            except (AttributeError, KeyError, TypeError, ValueError):
+                reply("error", orjson.dumps({"type": "error", "detail": 'Expected {"bbox": "west,south,east,north"}'}))
+                continue
+            bbox = requested
+            subscriber.bounds = bounds
+            reply("hello", stream_hello(bbox))
+    
+    async def send_events():
+        await websocket.send_text(stream_hello(bbox).decode())
+        last_demand = 0.0
+        while True:
+            event, last_demand = await next_stream_event(subscriber, bbox, last_demand)
+            if event is not None:
+                await websocket.send_text(event[1].decode())
+    
+    tasks = [asyncio.create_task(receive_subscriptions()), asyncio.create_task(send_events())]
+    try:
+        # Either side ending (usually the client disconnecting) closes the stream
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            error = task.exception()
+            if error is not None and not isinstance(error, WebSocketDisconnect):
+                logger.warning(f"Stream connection closed: {error}")
+    finally:
+        for task in tasks:
+            task.cancel()
+        broadcaster.unsubscribe(subscriber)
 
 @router.post("/etl/trigger")
-async def trigger_etl():
-    """Manually trigger ETL"""
-    await run_etl_async()
+async def trigger_etl(
+    response: Response,
+    timeout: Optional[float] = Query(None, gt=0, description="Seconds to wait for the refresh; it keeps running if exceeded")
+):
+    """Manually refresh every region/endpoint, or join the refresh already in flight"""
+    try:
+        await run_etl_async(timeout=timeout, force=True)
+    except asyncio.TimeoutError:
+        response.status_code = 202
+        return {"message": "ETL still running", "timestamp": datetime.utcnow().isoformat()}
     return {"message": "ETL triggered successfully", "timestamp": datetime.utcnow().isoformat()}
 
 @router.get("/etl/status")
 async def get_etl_status():
     """Get ETL status and cache information"""
-    global last_etl_time, etl_in_progress
+    global last_etl_time
     
-    # Calculate time until next ETL
-    time_until_next_etl = None
-    if last_etl_time:
-        next_etl_time = last_etl_time + timedelta(minutes=CACHE_WINDOW_MINUTES)
-        time_until_next_etl = (next_etl_time - datetime.utcnow()).total_seconds() / 60  # minutes
+    # Scheduler calls may read the shared HERE call count from the database
+    time_until_next_etl = await asyncio.to_thread(refresh_scheduler.seconds_until_next_due) / 60  # minutes
+    refresh_state = await asyncio.to_thread(get_refresh_state)
+    scheduler_status = await asyncio.to_thread(refresh_scheduler.status)
     
     status = {
         "last_etl": last_etl_time.isoformat() if last_etl_time else None,
-        "etl_in_progress": etl_in_progress,
-        "cache_window_minutes": CACHE_WINDOW_MINUTES,
-        "fallback_hours": FALLBACK_HOURS,
+        "etl_in_progress": coordinator.in_progress(ETL_KEY),
+        "cleanup_in_progress": coordinator.in_progress(CLEANUP_KEY),
+        "refresh_state": refresh_state,
+        "stale_while_revalidate": settings.STALE_WHILE_REVALIDATE,
         "cleanup_hours": CLEANUP_HOURS,
-        "time_until_next_etl_minutes": round(time_until_next_etl, 1) if time_until_next_etl else None,
-        "next_fallback_check": None,
+        "time_until_next_etl_minutes": round(time_until_next_etl, 1) if time_until_next_etl != float("inf") else None,
         "next_cleanup_check": None,
-        "city": "San Francisco Only",
-        "api_calls_conservation": "✅ Optimized for free tier - 30min cache, 5hr fallback"
+        "regions": list(INGESTION_REGIONS),
+        "scheduler": scheduler_status,
+        "response_cache": response_cache.status(),
+        "database_pools": pool_status(),
+        "stream": broadcaster.status()
     }
     
-    if last_etl_time:
-        next_fallback = last_etl_time + timedelta(hours=FALLBACK_HOURS)
-        status["next_fallback_check"] = next_fallback.isoformat()
-    
     if hasattr(should_run_cleanup, 'last_cleanup_time') and should_run_cleanup.last_cleanup_time:
         next_cleanup = should_run_cleanup.last_cleanup_time + timedelta(hours=CLEANUP_HOURS)
         status["next_cleanup_check"] = next_cleanup.isoformat()
@@ -4,6 +4,20 @@ import os
 class Settings(BaseSettings):
     HERE_API_KEY: str
     DATABASE_URL: str
+    HERE_MAX_CONCURRENCY: int = 8  # Max simultaneous requests from the async HERE client
+    HERE_REQUESTS_PER_SECOND: float = 10.0  # Async client request rate limit (0 disables it)
+    HERE_MONTHLY_CALL_BUDGET: int = 250000  # HERE free tier calls/month
+    STALE_WHILE_REVALIDATE: bool = True  # Serve stored data while a due refresh runs in the background
+    INGESTION_REGIONS: str = "San Francisco"  # Comma-separated BAY_AREA_CITIES names, or "all"
+    FLOW_DELTA_INGESTION: bool = True  # Only store flow observations that changed since the last stored one
+    FLOW_SPEED_DELTA: float = 1.0  # Speed change (m/s) that counts as a change
+    FLOW_JAM_FACTOR_DELTA: float = 0.5  # jamFactor change that counts as a change
+    FLOW_KEYFRAME_MINUTES: int = 60  # Store an unchanged segment again after this long
+    RESPONSE_CACHE_MB: int = 64  # Memory for cached GET responses (0 disables the cache)
+    DB_POOL_SIZE: int = 10  # Connections kept open per engine and worker (API and ETL engines each have one)
+    DB_MAX_OVERFLOW: int = 10  # Extra connections opened under load beyond DB_POOL_SIZE
+    DB_POOL_TIMEOUT: float = 30.0  # Seconds a request waits for a free connection before failing
+    DB_POOL_RECYCLE: int = 1800  # Reopen connections older than this many seconds
 
     class Config:
         env_file = os.path.join(os.path.dirname(__file__), ".env")
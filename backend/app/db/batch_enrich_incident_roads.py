@@ -1,7 +1,6 @@
 import sqlite3
 import json
 import re
-from shapely.geometry import Point
 from road_lookup import RoadLookup
 
 DB_PATH = './backend/test.db'
@@ -14,21 +13,11 @@ cur.execute("SELECT id, lat, lon, description, road_name FROM traffic_incident")
 rows = cur.fetchall()
 
 updated = 0
-for row in rows:
+# Match every incident to its nearest OSM road in one batched query
+_, osm_names, distances = lookup.match_many([row[1] for row in rows], [row[2] for row in rows])
+for row, osm_name, min_dist in zip(rows, osm_names, distances):
     incident_id, lat, lon, description, old_road_name = row
-    pt = Point(lon, lat)
-    nearest = list(lookup.idx.nearest(pt.bounds, 5))
-    min_dist = float('inf')
-    best_road = None
-    best_line = None
-    for i in nearest:
-        candidate_road, candidate_line = lookup.road_geoms[i]
-        dist = candidate_line.distance(pt)
-        if dist < min_dist:
-            min_dist = dist
-            best_road = candidate_road
-            best_line = candidate_line
-    osm_name = best_road['name'] if best_road else 'Unknown Road'
+    osm_name = osm_name or 'Unknown Road'
     here_road_name = None
     intersection = None
     if description:
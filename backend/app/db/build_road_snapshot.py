@@ -0,0 +1,98 @@
+import fcntl
+import json
+import os
+import shutil
+import numpy as np
+from rtree import index
+
+ROADS_FILE = os.path.join(os.path.dirname(__file__), 'sf_roads.json')
+SNAPSHOT_DIR = os.path.join(os.path.dirname(__file__), 'sf_roads_snapshot')
+
+def build_snapshot(roads_file=ROADS_FILE, snapshot_dir=SNAPSHOT_DIR):
+    """
+    Compile sf_roads.json into a memory-mappable road network snapshot.
+
+    Layout of snapshot_dir:
+        coords.npy    float64 (n_vertices, 2) [lon, lat], every road back to back
+        offsets.npy   int64 (n_roads + 1), road i is coords[offsets[i]:offsets[i+1]]
+        name_ids.npy  int32 (n_roads), index into names.json
+        osm_ids.npy   int64 (n_roads)
+        names.json    unique road names
+        rtree.idx/dat on-disk rtree of per-road bounds, keyed by road index
+
+    The snapshot is written to a temporary directory and renamed into place,
+    so readers never see a half-written snapshot.
+    """
+    with open(roads_file) as f:
+        roads = [road for road in json.load(f) if len(road['geometry']) >= 2]
+
+    lengths = np.array([len(road['geometry']) for road in roads], dtype=np.int64)
+    offsets = np.zeros(len(roads) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    coords = np.array([pt for road in roads for pt in road['geometry']], dtype=np.float64).reshape(-1, 2)
+    names = sorted({road['name'] for road in roads})
+    name_lookup = {name: i for i, name in enumerate(names)}
+    name_ids = np.array([name_lookup[road['name']] for road in roads], dtype=np.int32)
+    osm_ids = np.array([road.get('osm_id', -1) for road in roads], dtype=np.int64)
+
+    tmp_dir = f"{snapshot_dir}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    np.save(os.path.join(tmp_dir, 'coords.npy'), coords)
+    np.save(os.path.join(tmp_dir, 'offsets.npy'), offsets)
+    np.save(os.path.join(tmp_dir, 'name_ids.npy'), name_ids)
+    np.save(os.path.join(tmp_dir, 'osm_ids.npy'), osm_ids)
+    with open(os.path.join(tmp_dir, 'names.json'), 'w') as f:
+        json.dump(names, f)
+
+    # Bulk-load the rtree from per-road bounds
+    if len(roads):
+        starts = offsets[:-1]
+        bounds = np.column_stack([
+            np.minimum.reduceat(coords[:, 0], starts),
+            np.minimum.reduceat(coords[:, 1], starts),
+            np.maximum.reduceat(coords[:, 0], starts),
+            np.maximum.reduceat(coords[:, 1], starts),
+        ])
+    else:
+        bounds = np.empty((0, 4))
+    props = index.Property()
+    props.overwrite = True
+    if len(bounds):
+        stream = ((i, tuple(b), None) for i, b in enumerate(bounds.tolist()))
+        idx = index.Index(os.path.join(tmp_dir, 'rtree'), stream, properties=props)
+    else:
+        idx = index.Index(os.path.join(tmp_dir, 'rtree'), properties=props)
+    idx.close()
+
+    shutil.rmtree(snapshot_dir, ignore_errors=True)
+    os.rename(tmp_dir, snapshot_dir)
+    print(f"Wrote snapshot of {len(roads)} roads ({len(coords)} vertices) to {snapshot_dir}")
+    return snapshot_dir
+
+def ensure_snapshot(roads_file=ROADS_FILE, snapshot_dir=SNAPSHOT_DIR):
+    """
+    Build the snapshot if it is missing or older than roads_file.
+
+    An exclusive file lock makes this safe to call from every uvicorn worker
+    at once: the first one builds, the rest wait and then reuse its output.
+    """
+    def is_fresh():
+        marker = os.path.join(snapshot_dir, 'offsets.npy')
+        if not os.path.exists(marker):
+            return False
+        return not os.path.exists(roads_file) or os.path.getmtime(marker) >= os.path.getmtime(roads_file)
+
+    if is_fresh():
+        return snapshot_dir
+    with open(f"{snapshot_dir}.lock", 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            if not is_fresh() and os.path.exists(roads_file):
+                build_snapshot(roads_file, snapshot_dir)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+    return snapshot_dir
+
+if __name__ == '__main__':
+    build_snapshot()
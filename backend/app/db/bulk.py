@@ -0,0 +1,161 @@
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Sequence
+
+from sqlalchemy import Column, MetaData, Table, func, insert, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+BATCH_SIZE = 1000
+
+def is_postgres(db: Session) -> bool:
+    return db.get_bind().dialect.name == "postgresql"
+
+def bulk_insert(db: Session, table: Table, rows: List[Dict[str, Any]], batch_size: int = BATCH_SIZE) -> int:
+    """
+    Insert plain dict rows with Core executemany batches.
+
+    Skips ORM unit-of-work bookkeeping and RETURNING ids; runs inside the
+    session's current transaction, committing is up to the caller.
+    """
+    for start in range(0, len(rows), batch_size):
+        db.execute(insert(table), rows[start:start + batch_size])
+    return len(rows)
+
+def insert_ignore(
+    db: Session,
+    table: Table,
+    rows: List[Dict[str, Any]],
+    index_elements: Sequence[str],
+    batch_size: int = BATCH_SIZE
+) -> int:
+    """
+    Insert rows, skipping any that conflict on index_elements.
+
+    Uses INSERT ... ON CONFLICT DO NOTHING on Postgres and SQLite, so
+    concurrent loaders of the same keys don't fail each other.
+    """
+    dialect = postgresql if is_postgres(db) else sqlite
+    for start in range(0, len(rows), batch_size):
+        statement = dialect.insert(table).on_conflict_do_nothing(index_elements=list(index_elements))
+        db.execute(statement, rows[start:start + batch_size])
+    return len(rows)
+
+def increment(db: Session, table: Table, key: Dict[str, Any], column: str, amount: int) -> int:
+    """
+    Add amount to a counter column of the row at key, inserting the row if missing; returns the new value.
+
+    One INSERT ... ON CONFLICT DO UPDATE ... RETURNING, so concurrent writers
+    (other workers) neither lose each other's increments nor race on the
+    first insert. Committing is up to the caller.
+    """
+    dialect = postgresql if is_postgres(db) else sqlite
+    statement = dialect.insert(table).values(**key, **{column: amount})
+    statement = statement.on_conflict_do_update(
+        index_elements=list(key),
+        set_={column: table.c[column] + statement.excluded[column]}
+    ).returning(table.c[column])
+    return db.execute(statement).scalar_one()
+
+def upsert(
+    db: Session,
+    table: Table,
+    rows: List[Dict[str, Any]],
+    index_elements: Sequence[str],
+    update_columns: Sequence[str],
+    batch_size: int = BATCH_SIZE,
+    increment_columns: Sequence[str] = (),
+    least_columns: Sequence[str] = (),
+    greatest_columns: Sequence[str] = (),
+    use_copy: bool = False
+) -> int:
+    """
+    Insert rows, updating update_columns of rows that conflict on index_elements.
+
+    Uses INSERT ... ON CONFLICT DO UPDATE on Postgres and SQLite; columns not
+    listed (e.g. a first-seen time) keep the value of the original insert.
+    increment_columns are added to the stored value instead (counters);
+    least_columns / greatest_columns keep the smaller / larger of the two
+    (running minimum and maximum; both values must be non-null).
+    
+    With use_copy on Postgres (psycopg2), rows are COPYed into a staging
+    table and merged with one INSERT ... SELECT: SQLAlchemy sends ON
+    CONFLICT executemany one row at a time, which dominates for wide rows.
+    """
+    def conflict_update(statement):
+        # SQLite's min() / max() with several arguments are the scalar LEAST / GREATEST
+        least, greatest = (func.least, func.greatest) if is_postgres(db) else (func.min, func.max)
+        set_ = {column: statement.excluded[column] for column in update_columns}
+        set_.update({column: table.c[column] + statement.excluded[column] for column in increment_columns})
+        set_.update({column: least(table.c[column], statement.excluded[column]) for column in least_columns})
+        set_.update({column: greatest(table.c[column], statement.excluded[column]) for column in greatest_columns})
+        return statement.on_conflict_do_update(index_elements=list(index_elements), set_=set_)
+    
+    if use_copy and rows and is_postgres(db) and db.get_bind().dialect.driver == "psycopg2":
+        columns = [column.name for column in table.columns if column.name in rows[0]]
+        staging = Table(
+            f"{table.name}_staging", MetaData(), *[Column(name, table.c[name].type) for name in columns]
+        )
+        db.execute(text(
+            f"CREATE TEMP TABLE {staging.name} ON COMMIT DROP AS "
+            f"SELECT {', '.join(columns)} FROM {table.name} WITH NO DATA"
+        ))
+        copy_rows(db, staging, rows, columns)
+        # Ordered by key, so concurrent loaders lock rows in the same order
+        source = select(*[staging.c[name] for name in columns])\
+            .order_by(*[staging.c[name] for name in index_elements])
+        db.execute(conflict_update(postgresql.insert(table).from_select(columns, source)))
+        db.execute(text(f"DROP TABLE {staging.name}"))
+        return len(rows)
+    
+    dialect = postgresql if is_postgres(db) else sqlite
+    for start in range(0, len(rows), batch_size):
+        db.execute(conflict_update(dialect.insert(table)), rows[start:start + batch_size])
+    return len(rows)
+
+def _copy_value(value: Any) -> Any:
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (list, dict)):
+        return json.dumps(value)
+    return value
+
+def copy_rows(db: Session, table: Table, rows: List[Dict[str, Any]], columns: Sequence[str]) -> int:
+    """
+    Stream rows into a Postgres table with COPY FROM STDIN (CSV).
+
+    Uses the session's connection, so the COPY is part of its transaction.
+    Requires psycopg2; callers should check is_postgres() first.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([_copy_value(row.get(column)) for column in columns])
+    buffer.seek(0)
+
+    dbapi_connection = db.connection().connection.dbapi_connection
+    with dbapi_connection.cursor() as cursor:
+        cursor.copy_expert(
+            f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+    return len(rows)
+
+def bulk_load(db: Session, table: Table, rows: List[Dict[str, Any]], use_copy: bool = False) -> int:
+    """COPY on Postgres when use_copy is set and psycopg2 supports it, else Core batches."""
+    if not rows:
+        return 0
+    if use_copy and is_postgres(db):
+        if db.get_bind().dialect.driver == "psycopg2":
+            columns = [column.name for column in table.columns if column.name in rows[0]]
+            return copy_rows(db, table, rows, columns)
+        logger.info("COPY needs psycopg2, falling back to batched inserts")
+    return bulk_insert(db, table, rows)
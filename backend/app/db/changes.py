@@ -0,0 +1,93 @@
+"""
+What each ETL run changed, for pushing to stream clients.
+
+After a run, the tracker reads the flow observations and incidents written
+since its previous read:
+- segments whose value differs from the last one pushed; keyframes that
+  only repeat a value are left out;
+- incidents first seen, and incidents ended, in that window.
+All three come from indexed timestamp ranges, so a run's changes cost a
+few small queries however many clients are connected.
+"""
+import threading
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import Row, func, select, true
+from sqlalchemy.orm import Session
+
+from app.db.flow_queries import FLOW_COLUMNS, flow_at
+from app.db.models import FlowRefresh, RoadSegment, TrafficFlowObservation, TrafficIncident
+
+# Flow columns plus the segment's extent (for bbox subscriptions) and age;
+# every changed value was reported at its own timestamp
+CHANGE_COLUMNS = FLOW_COLUMNS + (
+    true().label("reported"),
+    RoadSegment.first_seen,
+    RoadSegment.min_lon,
+    RoadSegment.min_lat,
+    RoadSegment.max_lon,
+    RoadSegment.max_lat,
+)
+
+class Changes(NamedTuple):
+    since: datetime  # Exclusive start of the window
+    until: datetime
+    segments: List[Row]  # CHANGE_COLUMNS, one per changed segment
+    incidents: List[TrafficIncident]  # New and still active
+    ended: List[Row]  # (id, lat, lon)
+
+class ChangeTracker:
+    """
+    Changes since the previous collect(), against the values pushed then.
+
+    The first collect() only records the current state. ETL runs are
+    single-flight, so the rows of one run are all committed before the
+    collect() that follows it and timestamped before the next run's.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._since: Optional[datetime] = None
+        self._values: Dict[str, Tuple[float, float]] = {}
+
+    def _prime(self, db: Session, now: datetime):
+        at = db.query(func.max(FlowRefresh.timestamp)).scalar()
+        rows = flow_at(db, at) if at else []
+        self._values = {row.segment_id: (row.speed, row.congestion_level) for row in rows}
+        self._since = now
+
+    def collect(self, db: Session) -> Optional[Changes]:
+        """Changes since the previous call; None on the first."""
+        with self._lock:
+            now = datetime.utcnow()
+            if self._since is None:
+                self._prime(db, now)
+                return None
+            since = self._since
+            obs = TrafficFlowObservation
+            rows = db.execute(
+                select(*CHANGE_COLUMNS)
+                .join(RoadSegment, obs.segment_id == RoadSegment.id)
+                .where(obs.timestamp > since, obs.timestamp <= now)
+                .order_by(obs.timestamp)
+            ).all()
+            # A run that refreshed a region twice keeps each segment's last value
+            latest = {row.segment_id: row for row in rows}
+            segments = []
+            for segment_id, row in latest.items():
+                value = (row.speed, row.congestion_level)
+                if self._values.get(segment_id) != value:
+                    self._values[segment_id] = value
+                    segments.append(row)
+            incidents = db.query(TrafficIncident).filter(
+                TrafficIncident.timestamp > since,
+                TrafficIncident.first_seen > since,
+                TrafficIncident.ended_at.is_(None)
+            ).all()
+            ended = db.execute(
+                select(TrafficIncident.id, TrafficIncident.lat, TrafficIncident.lon)
+                .where(TrafficIncident.ended_at > since, TrafficIncident.ended_at <= now)
+            ).all()
+            self._since = now
+            return Changes(since, now, segments, incidents, ended)
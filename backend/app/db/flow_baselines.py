@@ -0,0 +1,209 @@
+"""
+Typical congestion per segment by local day of week and hour.
+
+Each flow load adds its reports to segment_baseline, one row per segment
+and hour of the week (168 slots, Pacific time): the report count, the sums
+of speed, jamFactor and jamFactor squared, and the jamFactor histogram the
+rollups use. These are streaming sketches. A load merges into them with
+one INSERT ... ON CONFLICT, and a slot's mean, standard deviation and
+quantiles follow from its row alone, so no query rescans raw history.
+
+A flow record is scored against the baseline of its segment and slot,
+which is a primary-key lookup:
+- anomaly_score: jamFactor minus the slot's mean, in standard deviations;
+- congestion_percentile: the share of the slot's other reports that were
+  less congested.
+The record's own report is taken back out of the sums first; left in, it
+would cap the score of n reports at sqrt(n - 1) and hide outliers while a
+slot is young. Only reports are in the sums: a value carried forward into
+a refresh that did not report its segment is scored against the whole
+slot. Slots with fewer than MIN_SAMPLES other reports are not
+scored. A baseline counts every report since its segment was first seen.
+
+Databases that already hold flow data can build the baselines from the
+stored history with:
+    python -m app.db.flow_baselines
+"""
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy import Row, func, select
+from sqlalchemy.orm import Session
+
+from app.db.bulk import upsert
+from app.db.flow_queries import LOOKUP_CHUNK_SIZE, flow_at, replay_refreshes
+from app.db.flow_rollups import JAM_BIN_WIDTH, JAM_COLUMNS, jam_bin
+from app.db.models import FlowRefresh, SegmentBaseline
+from app.db.spatial import Bounds
+from app.scheduler.refresh_scheduler import LOCAL_TZ
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Slots with fewer reports than this are too thin to score against
+MIN_SAMPLES = 4
+
+# Floor on the standard deviation, so that a segment which has always
+# reported the same jamFactor does not score a one-bin move as extreme
+MIN_STDDEV = JAM_BIN_WIDTH
+
+SUM_COLUMNS = ["samples", "speed_sum", "congestion_sum", "congestion_sq_sum"] + JAM_COLUMNS
+
+UNSCORED = {"congestion_baseline": None, "congestion_percentile": None, "anomaly_score": None}
+
+class Baseline(NamedTuple):
+    samples: int
+    congestion_sum: float
+    congestion_sq_sum: float
+    histogram: List[int]  # JAM_COLUMNS counts
+
+def week_slot(timestamp: datetime) -> int:
+    """Local hour of the week of a naive UTC time; Monday 00:00-01:00 is 0."""
+    local = timestamp.replace(tzinfo=timezone.utc).astimezone(LOCAL_TZ)
+    return local.weekday() * 24 + local.hour
+
+def baseline_rows(observations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Sums per (slot, segment) of a batch, sorted by primary key."""
+    slots = {}
+    rows = {}
+    for observation in observations:
+        slot = slots.get(observation['timestamp'])
+        if slot is None:
+            slot = slots[observation['timestamp']] = week_slot(observation['timestamp'])
+        key = (slot, observation['segment_id'])
+        row = rows.get(key)
+        if row is None:
+            row = rows[key] = {
+                "slot": slot,
+                "segment_id": observation['segment_id'],
+                "samples": 0,
+                "speed_sum": 0.0,
+                "congestion_sum": 0.0,
+                "congestion_sq_sum": 0.0,
+                **dict.fromkeys(JAM_COLUMNS, 0)
+            }
+        congestion = observation['congestion_level']
+        row["samples"] += 1
+        row["speed_sum"] += observation['speed']
+        row["congestion_sum"] += congestion
+        row["congestion_sq_sum"] += congestion * congestion
+        row[JAM_COLUMNS[jam_bin(congestion)]] += 1
+    return [rows[key] for key in sorted(rows)]
+
+def update_flow_baselines(db: Session, observations: List[Dict[str, Any]]) -> int:
+    """Add one flow batch (split_rows output, every reported segment) to the baselines, in the session's transaction."""
+    rows = baseline_rows(observations)
+    upsert(
+        db, SegmentBaseline.__table__, rows, index_elements=["slot", "segment_id"], update_columns=(),
+        increment_columns=SUM_COLUMNS, use_copy=True
+    )
+    return len(rows)
+
+BASELINE_COLUMNS = [
+    SegmentBaseline.slot, SegmentBaseline.segment_id, SegmentBaseline.samples,
+    SegmentBaseline.congestion_sum, SegmentBaseline.congestion_sq_sum
+] + [getattr(SegmentBaseline, column) for column in JAM_COLUMNS]
+
+def load_baselines(db: Session, keys: Iterable[Tuple[int, str]]) -> Dict[Tuple[int, str], Baseline]:
+    """Baselines of the given (slot, segment id) keys that have any reports."""
+    by_slot = {}
+    for slot, segment_id in set(keys):
+        by_slot.setdefault(slot, []).append(segment_id)
+    baselines = {}
+    for slot, segment_ids in by_slot.items():
+        for start in range(0, len(segment_ids), LOOKUP_CHUNK_SIZE):
+            rows = db.execute(
+                select(*BASELINE_COLUMNS)
+                .where(SegmentBaseline.slot == slot, SegmentBaseline.segment_id.in_(segment_ids[start:start + LOOKUP_CHUNK_SIZE]))
+            )
+            for row_slot, segment_id, samples, congestion_sum, congestion_sq_sum, *histogram in rows:
+                baselines[row_slot, segment_id] = Baseline(samples, congestion_sum, congestion_sq_sum, histogram)
+    return baselines
+
+def anomaly(baseline: Optional[Baseline], congestion_level: float, reported: bool = True) -> Dict[str, Optional[float]]:
+    """
+    The scoring fields of a flow record, against its baseline without the
+    record's own report when the baseline holds it (reported in this slot).
+    """
+    own = 1 if reported else 0
+    if baseline is None or baseline.samples - own < MIN_SAMPLES:
+        return dict(UNSCORED)
+    samples = baseline.samples - own
+    mean = (baseline.congestion_sum - own * congestion_level) / samples
+    # Sums of squares of values in 0-10 stay well inside float precision
+    variance = max((baseline.congestion_sq_sum - own * congestion_level * congestion_level) / samples - mean * mean, 0.0)
+    # Reports below the record's bin, plus its bin's other reports pro rata
+    index = jam_bin(congestion_level)
+    within = min(max(congestion_level / JAM_BIN_WIDTH - index, 0.0), 1.0)
+    below = sum(baseline.histogram[:index]) + max(baseline.histogram[index] - own, 0) * within
+    return {
+        "congestion_baseline": round(mean, 2),
+        "congestion_percentile": round(100.0 * below / samples, 1),
+        "anomaly_score": round((congestion_level - mean) / max(variance ** 0.5, MIN_STDDEV), 2)
+    }
+
+def score_flow(db: Session, items: Sequence[Tuple[datetime, Row]]) -> List[Dict[str, Optional[float]]]:
+    """Scoring fields for each (refresh time, flow row with `reported`), in order."""
+    slots = {refreshed_at: week_slot(refreshed_at) for refreshed_at in {item[0] for item in items}}
+    keys = [(slots[refreshed_at], row.segment_id) for refreshed_at, row in items]
+    baselines = load_baselines(db, keys)
+    return [anomaly(baselines.get(key), row.congestion_level, row.reported) for key, (_, row) in zip(keys, items)]
+
+def iter_scored_flow(
+    db: Session,
+    items: Iterable[Tuple[datetime, Row]],
+    chunk_size: int
+) -> Iterator[Tuple[datetime, Row, Dict[str, Optional[float]]]]:
+    """score_flow() over a stream of items, one baseline lookup per chunk."""
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= chunk_size:
+            for (refreshed_at, row), scores in zip(chunk, score_flow(db, chunk)):
+                yield refreshed_at, row, scores
+            chunk = []
+    if chunk:
+        for (refreshed_at, row), scores in zip(chunk, score_flow(db, chunk)):
+            yield refreshed_at, row, scores
+
+def current_anomalies(
+    db: Session,
+    min_score: float,
+    bounds: Optional[Bounds] = None,
+    road_name: Optional[str] = None,
+    limit: int = 100
+) -> List[Tuple[datetime, Row, Dict[str, Optional[float]]]]:
+    """Segments whose latest value scores at least min_score, most unusual first."""
+    at = db.query(func.max(FlowRefresh.timestamp)).scalar()
+    if at is None:
+        return []
+    items = [(at, row) for row in flow_at(db, at, bounds, road_name)]
+    scored = [
+        (refreshed_at, row, scores)
+        for (refreshed_at, row), scores in zip(items, score_flow(db, items))
+        if scores["anomaly_score"] is not None and scores["anomaly_score"] >= min_score
+    ]
+    scored.sort(key=lambda item: item[2]["anomaly_score"], reverse=True)
+    return scored[:limit]
+
+def rebuild_flow_baselines(db: Session) -> int:
+    """Recreate the baselines from every stored refresh, as the ETL received it."""
+    db.query(SegmentBaseline).delete(synchronize_session=False)
+    refreshes = 0
+    for _, _, observations in replay_refreshes(db):
+        update_flow_baselines(db, observations)
+        refreshes += 1
+    logger.info(f"Rebuilt flow baselines from {refreshes} refreshes")
+    return refreshes
+
+if __name__ == "__main__":
+    from app.db.models import Base
+    from app.db.session import SessionLocal, engine
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        count = rebuild_flow_baselines(db)
+        db.commit()
+    finally:
+        db.close()
+    print(f"✅ Flow baselines rebuilt from {count} refreshes.")
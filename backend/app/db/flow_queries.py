@@ -0,0 +1,233 @@
+"""
+Read traffic flow back from change-only storage.
+
+With delta ingestion a segment's observation is only stored when its speed
+or jamFactor changed, or when its last stored row is older than the
+keyframe interval. The value of a segment at time t is therefore its last
+observation at or before t (last observation carried forward), provided
+that observation is younger than the keyframe interval; older ones belong
+to segments HERE stopped reporting.
+
+Refreshes cover one region each, so a value is only carried into the
+history of the refreshes that reported its segment (flow_refresh_segment);
+the current value of a segment is the one of its latest report anywhere.
+"""
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import Row, Select, and_, func, select, true
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.db.models import FlowRefresh, FlowRefreshSegment, RoadSegment, TrafficFlowObservation
+from app.db.road_search import road_name_filter
+from app.db.spatial import Bounds, segment_bbox_filter
+
+LOOKUP_CHUNK_SIZE = 500
+
+def keyframe_window() -> timedelta:
+    return timedelta(minutes=settings.FLOW_KEYFRAME_MINUTES)
+
+def latest_observations(db: Session, segment_ids: Iterable[str]) -> Dict[str, Tuple[datetime, float, float, int]]:
+    """Last stored (timestamp, speed, congestion_level, id) for each of the given segments."""
+    obs = TrafficFlowObservation
+    segment_ids = list(segment_ids)
+    latest = {}
+    for start in range(0, len(segment_ids), LOOKUP_CHUNK_SIZE):
+        chunk = segment_ids[start:start + LOOKUP_CHUNK_SIZE]
+        last = select(obs.segment_id, func.max(obs.timestamp).label("timestamp"))\
+            .where(obs.segment_id.in_(chunk))\
+            .group_by(obs.segment_id)\
+            .subquery()
+        rows = db.execute(
+            select(obs.segment_id, obs.timestamp, obs.speed, obs.congestion_level, obs.id)
+            .join(last, and_(obs.segment_id == last.c.segment_id, obs.timestamp == last.c.timestamp))
+        )
+        for segment_id, timestamp, speed, congestion_level, row_id in rows:
+            latest[segment_id] = (timestamp, speed, congestion_level, row_id)
+    return latest
+
+# Plain columns rather than entities: readers serialize rows straight to
+# JSON, so ORM identity-map hydration is pure overhead
+FLOW_COLUMNS = (
+    TrafficFlowObservation.id,
+    TrafficFlowObservation.segment_id,
+    TrafficFlowObservation.timestamp,
+    TrafficFlowObservation.speed,
+    TrafficFlowObservation.congestion_level,
+    RoadSegment.road_name,
+    RoadSegment.lat,
+    RoadSegment.lon,
+    RoadSegment.geometry,
+)
+
+def flow_at_query(
+    db: Session,
+    at: datetime,
+    bounds: Optional[Bounds] = None,
+    road_name: Optional[str] = None,
+    limit: Optional[int] = None,
+    reported_only: bool = False
+) -> Select:
+    """
+    Select of FLOW_COLUMNS holding each segment's value at time `at`, plus
+    `reported`: whether the refresh at `at` reported the segment (rather
+    than its value being carried forward from an earlier one). With
+    reported_only, only the reported segments are selected, straight from
+    the refresh's flow_refresh_segment rows.
+    """
+    obs = TrafficFlowObservation
+    refreshed = FlowRefreshSegment
+    # The observation in effect at `at` is at most a keyframe old, which also prunes partitions
+    window = and_(obs.timestamp <= at, obs.timestamp > at - keyframe_window())
+    if reported_only:
+        query = select(*FLOW_COLUMNS, true().label("reported"))\
+            .select_from(refreshed)\
+            .join(obs, and_(obs.id == refreshed.observation_id, window))\
+            .where(refreshed.timestamp == at)
+    else:
+        last = select(obs.segment_id, func.max(obs.timestamp).label("timestamp"))\
+            .where(window)\
+            .group_by(obs.segment_id)\
+            .subquery()
+        query = select(*FLOW_COLUMNS, refreshed.segment_id.is_not(None).label("reported"))\
+            .join(last, and_(obs.segment_id == last.c.segment_id, obs.timestamp == last.c.timestamp))\
+            .outerjoin(refreshed, and_(refreshed.timestamp == at, refreshed.segment_id == obs.segment_id))
+    query = query.join(RoadSegment, obs.segment_id == RoadSegment.id)
+    if bounds:
+        # Segments whose extent crosses the bbox, through the spatial index
+        query = query.where(segment_bbox_filter(db, bounds))
+    if road_name:
+        # Names from the in-memory road name index, through the road_name b-tree
+        query = query.where(road_name_filter(db, road_name))
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+def flow_at(
+    db: Session,
+    at: datetime,
+    bounds: Optional[Bounds] = None,
+    road_name: Optional[str] = None,
+    limit: Optional[int] = None,
+    reported_only: bool = False
+) -> List[Row]:
+    """Rows of FLOW_COLUMNS holding each segment's value at time `at` (see flow_at_query)."""
+    return db.execute(flow_at_query(db, at, bounds, road_name, limit, reported_only)).all()
+
+def iter_recent_flow(
+    db: Session,
+    limit: Optional[int] = None,
+    since: Optional[datetime] = None,
+    bounds: Optional[Bounds] = None,
+    road_name: Optional[str] = None,
+    yield_per: Optional[int] = None,
+    until: Optional[datetime] = None,
+    after: Optional[Tuple[datetime, int]] = None
+) -> Iterator[Tuple[datetime, Row]]:
+    """
+    Flow per refresh, newest refresh first, up to `limit` rows (all if None).
+
+    Each item is (refresh time, FLOW_COLUMNS row in effect then) for each
+    segment the refresh reported, i.e. the rows a store-everything
+    ingestion would have written; rows of a refresh come in descending
+    observation id, so (refresh time, id) is a keyset order. `until` leaves
+    out refreshes after a snapshot time and `after` resumes strictly after
+    a (refresh time, id) key. With yield_per, rows
+    are fetched in chunks of that size from a server-side cursor where the
+    driver has one, so exports run in constant memory.
+    """
+    refreshed = FlowRefreshSegment
+    refreshes = db.query(FlowRefresh.timestamp)
+    if since:
+        refreshes = refreshes.filter(FlowRefresh.timestamp >= since)
+    if until:
+        refreshes = refreshes.filter(FlowRefresh.timestamp <= until)
+    if after:
+        refreshes = refreshes.filter(FlowRefresh.timestamp <= after[0])
+    produced = 0
+    for (refreshed_at,) in refreshes.order_by(FlowRefresh.timestamp.desc()).all():
+        # Walks ix_flow_refresh_segment_timestamp_observation, reading only the rows it returns
+        query = flow_at_query(db, refreshed_at, bounds, road_name, reported_only=True)\
+            .order_by(refreshed.observation_id.desc())
+        if after and refreshed_at == after[0]:
+            query = query.where(refreshed.observation_id < after[1])
+        if limit is not None:
+            query = query.limit(limit - produced)
+        if yield_per:
+            query = query.execution_options(yield_per=yield_per)
+        for row in db.execute(query):
+            produced += 1
+            yield refreshed_at, row
+        if limit is not None and produced >= limit:
+            break
+
+def recent_flow(
+    db: Session,
+    limit: int,
+    since: Optional[datetime] = None,
+    bounds: Optional[Bounds] = None,
+    road_name: Optional[str] = None,
+    until: Optional[datetime] = None,
+    after: Optional[Tuple[datetime, int]] = None
+) -> List[Tuple[datetime, Row]]:
+    """iter_recent_flow() as a list."""
+    return list(iter_recent_flow(db, limit, since, bounds, road_name, until=until, after=after))
+
+def road_congestion(
+    db: Session,
+    road_names: Sequence[str],
+    at: Optional[datetime] = None
+) -> Dict[str, Tuple[datetime, int, float, float, float]]:
+    """
+    Current flow per road name, in one query: (refreshed at, segments,
+    mean speed, mean congestion level, worst congestion level).
+
+    Values are those in effect at the latest flow refresh (or `at`); roads
+    with no observed segment in the keyframe window are left out.
+    """
+    if not road_names:
+        return {}
+    if at is None:
+        at = db.query(func.max(FlowRefresh.timestamp)).scalar()
+        if at is None:
+            return {}
+    obs = TrafficFlowObservation
+    last = select(obs.segment_id, func.max(obs.timestamp).label("timestamp"))\
+        .join(RoadSegment, obs.segment_id == RoadSegment.id)\
+        .where(RoadSegment.road_name.in_(road_names), obs.timestamp <= at, obs.timestamp > at - keyframe_window())\
+        .group_by(obs.segment_id)\
+        .subquery()
+    rows = db.execute(
+        select(
+            RoadSegment.road_name,
+            func.count(obs.segment_id),
+            func.avg(obs.speed),
+            func.avg(obs.congestion_level),
+            func.max(obs.congestion_level)
+        )
+        .join(last, and_(obs.segment_id == last.c.segment_id, obs.timestamp == last.c.timestamp))
+        .join(RoadSegment, obs.segment_id == RoadSegment.id)
+        .group_by(RoadSegment.road_name)
+    )
+    return {
+        road_name: (at, segments, speed, congestion, worst)
+        for road_name, segments, speed, congestion, worst in rows
+    }
+
+def replay_refreshes(db: Session) -> Iterator[Tuple[datetime, List[Dict], List[Dict]]]:
+    """
+    Each stored refresh, oldest first, as the ETL received it: (refresh
+    time, segment rows, observation rows) shaped like split_rows() output,
+    with every segment's value carried forward from change-only storage.
+    """
+    refreshes = [timestamp for (timestamp,) in db.query(FlowRefresh.timestamp).order_by(FlowRefresh.timestamp)]
+    for refreshed_at in refreshes:
+        segments, observations = [], []
+        for row in flow_at(db, refreshed_at, reported_only=True):
+            segments.append(dict(id=row.segment_id, road_name=row.road_name))
+            observations.append(dict(
+                segment_id=row.segment_id, timestamp=refreshed_at,
+                speed=row.speed, congestion_level=row.congestion_level
+            ))
+        yield refreshed_at, segments, observations
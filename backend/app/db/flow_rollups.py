@@ -0,0 +1,242 @@
+"""
+Per-road and per-segment flow rollups in 5-minute and hourly buckets.
+
+Questions like "average speed on Market Street over the last 6 hours"
+used to need every raw flow row of the window. The flow ETL now also
+upserts one row per road and bucket, at 5-minute and hourly resolution,
+and one per segment and hourly bucket, for each batch. Each row holds:
+- the sample count and the sum / min / max of speed and jamFactor;
+- a histogram of jamFactor in JAM_BINS bins of 0.5.
+
+Every column merges by sum, min or max, so loads add to a bucket with a
+single INSERT ... ON CONFLICT, and a query merges any range of buckets
+with one GROUP BY. Percentiles come from the summed histogram, to within
+one bin. Rollups count every report received, including those change-only
+storage does not keep. They have their own retention, longer than the raw
+data's.
+
+Databases that already hold flow data can backfill the rollups from the
+stored history with:
+    python -m app.db.flow_rollups
+"""
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.db.bulk import upsert
+from app.db.flow_queries import replay_refreshes
+from app.db.models import JAM_BINS, RoadFlowRollup, SegmentFlowRollup
+from app.db.road_search import road_name_filter
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Bucket lengths in seconds, by the name the API uses
+RESOLUTIONS = {"5m": 300, "1h": 3600}
+
+# Segments report once per refresh, so a 5-minute segment bucket would
+# copy the raw table row for row; segments are only rolled up hourly
+ROAD_RESOLUTIONS = (300, 3600)
+SEGMENT_RESOLUTIONS = (3600,)
+
+# How long buckets of each resolution are kept
+RETENTION = {300: timedelta(days=7), 3600: timedelta(days=90)}
+
+JAM_BIN_WIDTH = 10.0 / JAM_BINS
+JAM_COLUMNS = [f"jam_{index:02d}" for index in range(JAM_BINS)]
+SUM_COLUMNS = ["samples", "speed_sum", "congestion_sum"] + JAM_COLUMNS
+MIN_COLUMNS = ["speed_min", "congestion_min"]
+MAX_COLUMNS = ["speed_max", "congestion_max"]
+
+EPOCH = datetime(1970, 1, 1)
+
+def bucket_start(timestamp: datetime, resolution: int) -> datetime:
+    seconds = int((timestamp - EPOCH).total_seconds())
+    return EPOCH + timedelta(seconds=seconds - seconds % resolution)
+
+def jam_bin(jam_factor: float) -> int:
+    return min(max(int(jam_factor / JAM_BIN_WIDTH), 0), JAM_BINS - 1)
+
+def rollup_rows(
+    observations: List[Dict[str, Any]],
+    key_column: str,
+    key: Callable[[Dict[str, Any]], str],
+    resolutions: Sequence[int]
+) -> List[Dict[str, Any]]:
+    """Aggregate observations per (key, resolution, bucket), sorted by primary key."""
+    groups = {}
+    buckets = {}
+    for observation in observations:
+        speed = observation['speed']
+        congestion = observation['congestion_level']
+        for resolution in resolutions:
+            # A batch shares one timestamp, so bucket_start runs once per resolution
+            bucket = buckets.get((observation['timestamp'], resolution))
+            if bucket is None:
+                bucket = buckets[observation['timestamp'], resolution] = bucket_start(observation['timestamp'], resolution)
+            group_key = (key(observation), resolution, bucket)
+            row = groups.get(group_key)
+            if row is None:
+                row = groups[group_key] = {
+                    key_column: group_key[0],
+                    "resolution": resolution,
+                    "bucket": bucket,
+                    "samples": 0,
+                    "speed_sum": 0.0,
+                    "speed_min": speed,
+                    "speed_max": speed,
+                    "congestion_sum": 0.0,
+                    "congestion_min": congestion,
+                    "congestion_max": congestion,
+                    **dict.fromkeys(JAM_COLUMNS, 0)
+                }
+            row["samples"] += 1
+            row["speed_sum"] += speed
+            row["speed_min"] = min(row["speed_min"], speed)
+            row["speed_max"] = max(row["speed_max"], speed)
+            row["congestion_sum"] += congestion
+            row["congestion_min"] = min(row["congestion_min"], congestion)
+            row["congestion_max"] = max(row["congestion_max"], congestion)
+            row[JAM_COLUMNS[jam_bin(congestion)]] += 1
+    # Sorted, so concurrent loaders lock rollup rows in the same order
+    return [groups[group_key] for group_key in sorted(groups)]
+
+def _merge(db: Session, model, key_column: str, rows: List[Dict[str, Any]]):
+    upsert(
+        db, model.__table__, rows, index_elements=[key_column, "resolution", "bucket"], update_columns=(),
+        increment_columns=SUM_COLUMNS, least_columns=MIN_COLUMNS, greatest_columns=MAX_COLUMNS, use_copy=True
+    )
+
+def update_flow_rollups(db: Session, segments: List[Dict[str, Any]], observations: List[Dict[str, Any]]) -> int:
+    """Add one flow batch (split_rows output, every reported segment) to the rollups, in the session's transaction."""
+    names = {segment['id']: segment['road_name'] for segment in segments}
+    road_rows = rollup_rows(
+        observations, "road_name", lambda observation: names[observation['segment_id']], ROAD_RESOLUTIONS
+    )
+    segment_rows = rollup_rows(
+        observations, "segment_id", lambda observation: observation['segment_id'], SEGMENT_RESOLUTIONS
+    )
+    _merge(db, RoadFlowRollup, "road_name", road_rows)
+    _merge(db, SegmentFlowRollup, "segment_id", segment_rows)
+    return len(road_rows) + len(segment_rows)
+
+def drop_expired_rollups(db: Session, now: Optional[datetime] = None) -> int:
+    """Delete buckets older than their resolution's retention; returns the rows deleted."""
+    now = now or datetime.utcnow()
+    deleted = 0
+    for model in (RoadFlowRollup, SegmentFlowRollup):
+        for resolution, retention in RETENTION.items():
+            deleted += db.query(model)\
+                .filter(model.resolution == resolution, model.bucket < now - retention)\
+                .delete(synchronize_session=False)
+    return deleted
+
+def histogram_percentile(
+    histogram: Sequence[int],
+    percentile: float,
+    low: float = 0.0,
+    high: float = 10.0
+) -> Optional[float]:
+    """
+    jamFactor at the percentile, interpolated linearly within its bin and
+    clamped to [low, high], the observed min and max: a bin's reports may
+    all sit at one end of it.
+    """
+    total = sum(histogram)
+    if not total:
+        return None
+    rank = percentile / 100.0 * total
+    cumulative = 0
+    for index, count in enumerate(histogram):
+        if count and cumulative + count >= rank:
+            value = (index + (rank - cumulative) / count) * JAM_BIN_WIDTH
+            return round(min(max(value, low), high), 2)
+        cumulative += count
+    return high
+
+def summarize(row: Dict[str, Any], percentiles: Sequence[float]) -> Dict[str, Any]:
+    """Merged rollup columns to the figures the API returns."""
+    histogram = [row[column] for column in JAM_COLUMNS]
+    summary = {
+        "samples": row["samples"],
+        "speed_mean": row["speed_sum"] / row["samples"],
+        "speed_min": row["speed_min"],
+        "speed_max": row["speed_max"],
+        "congestion_mean": row["congestion_sum"] / row["samples"],
+        "congestion_min": row["congestion_min"],
+        "congestion_max": row["congestion_max"]
+    }
+    for percentile in percentiles:
+        summary[f"congestion_p{percentile:g}"] = histogram_percentile(
+            histogram, percentile, row["congestion_min"], row["congestion_max"]
+        )
+    return summary
+
+def aggregate_flow(
+    db: Session,
+    resolution: int,
+    since: datetime,
+    until: Optional[datetime] = None,
+    road_name: Optional[str] = None,
+    segment_id: Optional[str] = None,
+    percentiles: Sequence[float] = (50, 90, 95)
+) -> Dict[str, Any]:
+    """
+    Flow statistics over the buckets that overlap [since, until), per
+    bucket and overall. Filters by segment id, else by road names
+    containing road_name; with neither, every road is merged.
+    """
+    if segment_id:
+        model = SegmentFlowRollup
+        key_filter = SegmentFlowRollup.segment_id == segment_id
+    else:
+        model = RoadFlowRollup
+        key_filter = road_name_filter(db, road_name, RoadFlowRollup.road_name) if road_name else None
+    merged = [func.sum(getattr(model, column)).label(column) for column in SUM_COLUMNS]
+    merged += [func.min(getattr(model, column)).label(column) for column in MIN_COLUMNS]
+    merged += [func.max(getattr(model, column)).label(column) for column in MAX_COLUMNS]
+    query = select(model.bucket, *merged)\
+        .where(model.resolution == resolution, model.bucket >= bucket_start(since, resolution))
+    if until:
+        query = query.where(model.bucket < until)
+    if key_filter is not None:
+        query = query.where(key_filter)
+    buckets = [row._asdict() for row in db.execute(query.group_by(model.bucket).order_by(model.bucket))]
+
+    total = None
+    if buckets:
+        total = {column: sum(bucket[column] for bucket in buckets) for column in SUM_COLUMNS}
+        total.update({column: min(bucket[column] for bucket in buckets) for column in MIN_COLUMNS})
+        total.update({column: max(bucket[column] for bucket in buckets) for column in MAX_COLUMNS})
+    return {
+        "summary": summarize(total, percentiles) if total else None,
+        "buckets": [dict(bucket=bucket["bucket"], **summarize(bucket, percentiles)) for bucket in buckets]
+    }
+
+def rebuild_flow_rollups(db: Session) -> int:
+    """
+    Recreate the rollups from stored flow: each refresh's values carried
+    forward from change-only storage, i.e. what the ETL received then.
+    """
+    db.query(RoadFlowRollup).delete(synchronize_session=False)
+    db.query(SegmentFlowRollup).delete(synchronize_session=False)
+    refreshes = 0
+    for _, segments, observations in replay_refreshes(db):
+        update_flow_rollups(db, segments, observations)
+        refreshes += 1
+    logger.info(f"Rebuilt flow rollups from {refreshes} refreshes")
+    return refreshes
+
+if __name__ == "__main__":
+    from app.db.models import Base
+    from app.db.session import SessionLocal, engine
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        count = rebuild_flow_rollups(db)
+        db.commit()
+    finally:
+        db.close()
+    print(f"✅ Flow rollups rebuilt from {count} refreshes.")
@@ -3,12 +3,24 @@ from .session import engine
 from sqlalchemy import text
 
 def init_db():
+    from .spatial import install
     Base.metadata.create_all(bind=engine)
+    # create_all skips tables that exist, so add indexes introduced since
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+    install(engine)
 
 def clear_db():
     from .session import SessionLocal
     db = SessionLocal()
-    db.execute(text('DELETE FROM traffic_flow;'))
+    db.execute(text('DELETE FROM traffic_flow_observation;'))
+    db.execute(text('DELETE FROM flow_refresh_segment;'))
+    db.execute(text('DELETE FROM road_segment;'))
+    db.execute(text('DELETE FROM road;'))
+    db.execute(text('DELETE FROM road_flow_rollup;'))
+    db.execute(text('DELETE FROM segment_flow_rollup;'))
+    db.execute(text('DELETE FROM segment_baseline;'))
     db.execute(text('DELETE FROM traffic_incident;'))
     db.commit()
     db.close()
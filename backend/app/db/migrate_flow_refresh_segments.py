@@ -0,0 +1,68 @@
+"""
+Fill flow_refresh_segment for flow refreshes stored without it.
+
+/traffic/flow reads each refresh from flow_refresh_segment: the segments
+it reported and the observation in effect for each, walked in (refresh
+time, observation id) order through its composite index. Databases from
+before the table have none of these rows, or a table without the
+observation_id column, which is dropped and rebuilt here with its index.
+
+Which segments an older refresh reported was not recorded, so each one
+gets every segment with an observation in its keyframe window, as reads
+used to assume. Running it again only fills refreshes that still have no
+rows.
+
+Usage:
+    python -m app.db.migrate_flow_refresh_segments
+"""
+from datetime import timedelta
+
+from sqlalchemy import inspect, select, text
+
+from app.db.bulk import insert_ignore
+from app.db.flow_queries import flow_at
+from app.db.models import Base, FlowRefresh, FlowRefreshSegment
+from app.db.partitions import DAYS_AHEAD, create_partitions, is_partitioned
+from app.db.session import SessionLocal, engine
+
+def migrate() -> int:
+    table = FlowRefreshSegment.__table__
+    inspector = inspect(engine)
+    rebuild = inspector.has_table(table.name) and \
+        "observation_id" not in {column["name"] for column in inspector.get_columns(table.name)}
+
+    db = SessionLocal()
+    try:
+        if rebuild:
+            db.execute(text(f"DROP TABLE {table.name}"))
+            table.create(db.connection())
+            print(f"Recreated {table.name} with observation_id.")
+        else:
+            Base.metadata.create_all(bind=db.connection(), tables=[table])
+
+        known = select(FlowRefreshSegment.timestamp).where(FlowRefreshSegment.timestamp == FlowRefresh.timestamp)
+        refreshes = [
+            timestamp for (timestamp,) in
+            db.query(FlowRefresh.timestamp).filter(~known.exists()).order_by(FlowRefresh.timestamp)
+        ]
+        if refreshes and is_partitioned(db, table):
+            span = (refreshes[-1].date() - refreshes[0].date()).days + DAYS_AHEAD + 1
+            create_partitions(db, table, [refreshes[0].date() + timedelta(days=n) for n in range(span)])
+        filled = 0
+        for refreshed_at in refreshes:
+            filled += insert_ignore(db, table, [
+                dict(timestamp=refreshed_at, segment_id=row.segment_id, observation_id=row.id)
+                for row in flow_at(db, refreshed_at)
+            ], index_elements=['timestamp', 'segment_id'])
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    print(f"✅ Filled {filled} {table.name} rows for {len(refreshes)} refreshes.")
+    return len(refreshes)
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,123 @@
+"""
+Migrate the legacy traffic_flow table to road_segment + traffic_flow_observation.
+
+Every legacy row carried its segment's full geometry and name. The migration
+stores each distinct segment once in road_segment, keyed by the fingerprint
+of its geometry, and copies the speed/jamFactor readings into
+traffic_flow_observation. Legacy geometry
+may already be OSM-extended, so migrated segments can get different ids
+from the same segments fetched after the migration; both are kept.
+Legacy timestamps are truncated to the minute and every minute becomes a
+flow_refresh reporting the segments read in it, so /traffic/flow can
+rebuild the migrated history.
+
+The legacy table is renamed to traffic_flow_legacy afterwards (or dropped
+with --drop). Running it again when no traffic_flow table exists is a no-op.
+
+Usage:
+    python -m app.db.migrate_flow_segments [--drop]
+"""
+import sys
+from datetime import timedelta
+
+from sqlalchemy import MetaData, Table, func, insert, inspect, select, text
+
+from app.db.bulk import bulk_insert, insert_ignore
+from app.db.models import Base, FlowRefresh, FlowRefreshSegment, RoadSegment, TrafficFlowObservation
+from app.db.partitions import create_partitions, is_partitioned
+from app.db.session import SessionLocal, engine
+from app.utils.geo import geometry_bounds, shape_fingerprint
+
+LEGACY_TABLE = "traffic_flow"
+BATCH_SIZE = 5000
+
+def legacy_segment_id(geometry, lat: float, lon: float) -> str:
+    """Fingerprint a legacy row's geometry ([lon, lat] pairs), or its point if it has none."""
+    points = [{'lat': pt[1], 'lng': pt[0]} for pt in geometry] if geometry else [{'lat': lat, 'lng': lon}]
+    return shape_fingerprint({'shape': {'links': [{'points': points}]}})
+
+def migrate(drop: bool = False) -> int:
+    Base.metadata.create_all(bind=engine)
+    if not inspect(engine).has_table(LEGACY_TABLE):
+        print(f"No {LEGACY_TABLE} table, nothing to migrate.")
+        return 0
+
+    legacy = Table(LEGACY_TABLE, MetaData(), autoload_with=engine)
+    migrated = 0
+    last_id = 0
+    db = SessionLocal()
+    try:
+        if is_partitioned(db, TrafficFlowObservation.__table__):
+            first, last = db.execute(select(func.min(legacy.c.timestamp), func.max(legacy.c.timestamp))).one()
+            if first is not None:
+                days = [first.date() + timedelta(days=n) for n in range((last.date() - first.date()).days + 1)]
+                create_partitions(db, TrafficFlowObservation.__table__, days)
+                create_partitions(db, FlowRefreshSegment.__table__, days)
+        while True:
+            rows = db.execute(
+                select(legacy).where(legacy.c.id > last_id).order_by(legacy.c.id).limit(BATCH_SIZE)
+            ).mappings().all()
+            if not rows:
+                break
+            segments = {}
+            observations = {}
+            for row in rows:
+                segment_id = legacy_segment_id(row['geometry'], row['lat'], row['lon'])
+                # Legacy rows of one ETL run carry slightly different timestamps
+                timestamp = row['timestamp'].replace(second=0, microsecond=0)
+                if segment_id not in segments:
+                    min_lon, min_lat, max_lon, max_lat = geometry_bounds(row['geometry'], row['lat'], row['lon'])
+                    segments[segment_id] = dict(
+                        id=segment_id,
+                        road_name=row['road_name'],
+                        lat=row['lat'],
+                        lon=row['lon'],
+                        geometry=row['geometry'],
+                        min_lon=min_lon,
+                        min_lat=min_lat,
+                        max_lon=max_lon,
+                        max_lat=max_lat,
+                        first_seen=timestamp
+                    )
+                observations[(segment_id, timestamp)] = dict(
+                    segment_id=segment_id,
+                    timestamp=timestamp,
+                    speed=row['speed'],
+                    congestion_level=row['congestion_level']
+                )
+            insert_ignore(db, RoadSegment.__table__, list(segments.values()), index_elements=['id'])
+            bulk_insert(db, TrafficFlowObservation.__table__, list(observations.values()))
+            migrated += len(rows)
+            last_id = rows[-1]['id']
+            print(f"  migrated {migrated} rows...")
+
+        obs = TrafficFlowObservation
+        known = select(FlowRefresh.timestamp)
+        # Legacy storage kept every reading, so each one is a report
+        db.execute(insert(FlowRefreshSegment).from_select(
+            ['timestamp', 'segment_id', 'observation_id'],
+            select(obs.timestamp, obs.segment_id, obs.id).where(obs.timestamp.not_in(known))
+        ))
+        db.execute(insert(FlowRefresh).from_select(
+            ['timestamp', 'segments', 'written'],
+            select(obs.timestamp, func.count(), func.count())
+            .where(obs.timestamp.not_in(known))
+            .group_by(obs.timestamp)
+        ))
+
+        if drop:
+            db.execute(text(f"DROP TABLE {LEGACY_TABLE}"))
+        else:
+            db.execute(text(f"ALTER TABLE {LEGACY_TABLE} RENAME TO {LEGACY_TABLE}_legacy"))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    print(f"✅ Migrated {migrated} traffic flow rows into road_segment / traffic_flow_observation.")
+    return migrated
+
+if __name__ == "__main__":
+    migrate(drop="--drop" in sys.argv[1:])
@@ -0,0 +1,83 @@
+"""
+Add HERE incident identity columns to an existing traffic_incident table.
+
+Older databases stored a new traffic_incident row on every refresh and kept
+no HERE incident id. This adds here_id, first_seen, last_seen and ended_at,
+collapses rows with the same type, description and position into one
+(keeping the newest row, with first/last seen spanning the group), and
+creates the unique index the ETL upserts against.
+
+The HERE id of legacy incidents is unknown, so they get a 'legacy:' key and
+are marked ended at their last sighting; incidents still in the feed are
+inserted again under their real id by the next refresh.
+
+Usage:
+    python -m app.db.migrate_incident_identity
+"""
+import hashlib
+from collections import defaultdict
+
+from sqlalchemy import inspect, text
+
+from app.db.models import Base
+from app.db.session import SessionLocal, engine
+
+def legacy_incident_id(type_: str, description: str, lat: float, lon: float) -> str:
+    key = f"{type_}|{description}|{round(lat, 5)}|{round(lon, 5)}"
+    return "legacy:" + hashlib.sha1(key.encode()).hexdigest()
+
+def migrate() -> int:
+    Base.metadata.create_all(bind=engine)
+    columns = {column['name'] for column in inspect(engine).get_columns("traffic_incident")}
+    if "here_id" in columns:
+        print("traffic_incident already has here_id, nothing to migrate.")
+        return 0
+
+    db = SessionLocal()
+    try:
+        for column, type_ in (("here_id", "VARCHAR(128)"), ("first_seen", "TIMESTAMP"),
+                              ("last_seen", "TIMESTAMP"), ("ended_at", "TIMESTAMP")):
+            db.execute(text(f"ALTER TABLE traffic_incident ADD COLUMN {column} {type_}"))
+
+        groups = defaultdict(list)
+        rows = db.execute(text("SELECT id, timestamp, type, description, lat, lon FROM traffic_incident"))
+        for id_, timestamp, type_, description, lat, lon in rows:
+            groups[legacy_incident_id(type_, description, lat, lon)].append((id_, timestamp))
+
+        keep = []
+        duplicates = []
+        for here_id, members in groups.items():
+            members.sort(key=lambda member: (member[1], member[0]))
+            keep.append(dict(
+                row_id=members[-1][0],
+                here_id=here_id,
+                first_seen=members[0][1],
+                last_seen=members[-1][1]
+            ))
+            duplicates.extend(dict(row_id=member[0]) for member in members[:-1])
+
+        if duplicates:
+            db.execute(text("DELETE FROM traffic_incident WHERE id = :row_id"), duplicates)
+        if keep:
+            db.execute(
+                text(
+                    "UPDATE traffic_incident SET here_id = :here_id, first_seen = :first_seen, "
+                    "last_seen = :last_seen, timestamp = :last_seen, ended_at = :last_seen "
+                    "WHERE id = :row_id"
+                ),
+                keep
+            )
+        db.execute(text("CREATE UNIQUE INDEX ix_traffic_incident_here_id ON traffic_incident (here_id)"))
+        db.execute(text("CREATE INDEX ix_traffic_incident_ended_at ON traffic_incident (ended_at)"))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    print(f"✅ Collapsed traffic_incident into {len(keep)} incidents ({len(duplicates)} duplicate rows removed).")
+    return len(keep)
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,73 @@
+"""
+Convert an existing traffic_flow_observation table to daily partitions (Postgres).
+
+Databases created before partitioning have a plain traffic_flow_observation
+table. This renames it aside, creates the partitioned table and one
+partition per day of existing data, copies the rows across (keeping their
+ids) and drops the old table, all in one transaction. The copy holds
+a lock on the table, so run it while the API is stopped.
+
+SQLite has no partitioning; there the script does nothing.
+
+Usage:
+    python -m app.db.migrate_partitions
+"""
+from datetime import timedelta
+
+from sqlalchemy import inspect, text
+
+from app.db.models import Base, TrafficFlowObservation
+from app.db.partitions import DAYS_AHEAD, create_partitions, is_partitioned
+from app.db.session import SessionLocal, engine
+
+OLD_TABLE = "traffic_flow_observation_unpartitioned"
+
+def migrate() -> int:
+    table = TrafficFlowObservation.__table__
+    if engine.dialect.name != "postgresql":
+        print("Partitioning needs Postgres; SQLite keeps the plain table.")
+        return 0
+    if not inspect(engine).has_table(table.name):
+        Base.metadata.create_all(bind=engine)
+        print(f"✅ Created partitioned {table.name}.")
+        return 0
+
+    db = SessionLocal()
+    try:
+        if is_partitioned(db, table):
+            print(f"{table.name} is already partitioned, nothing to migrate.")
+            return 0
+
+        # Move the old table and its index/constraint names out of the way
+        db.execute(text(f"ALTER TABLE {table.name} RENAME TO {OLD_TABLE}"))
+        db.execute(text(f"ALTER TABLE {OLD_TABLE} RENAME CONSTRAINT {table.name}_pkey TO {OLD_TABLE}_pkey"))
+        for index in inspect(db.connection()).get_indexes(OLD_TABLE):
+            db.execute(text(f"DROP INDEX {index['name']}"))
+        table.create(db.connection())
+
+        first, last = db.execute(text(f"SELECT min(timestamp), max(timestamp) FROM {OLD_TABLE}")).one()
+        if first is not None:
+            span = (last.date() - first.date()).days + DAYS_AHEAD + 1
+            create_partitions(db, table, [first.date() + timedelta(days=n) for n in range(span)])
+
+        copied = db.execute(text(
+            f"INSERT INTO {table.name} (id, segment_id, timestamp, speed, congestion_level) "
+            f"SELECT id, segment_id, timestamp, speed, congestion_level FROM {OLD_TABLE}"
+        )).rowcount
+        db.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+            f"(SELECT COALESCE(MAX(id), 0) + 1 FROM {table.name}), false)"
+        ))
+        db.execute(text(f"DROP TABLE {OLD_TABLE}"))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    print(f"✅ Moved {copied} rows into partitioned {table.name}.")
+    return copied
+
+if __name__ == "__main__":
+    migrate()
@@ -1,28 +1,150 @@
-from sqlalchemy import Column, Integer, Float, String, DateTime, JSON
+from sqlalchemy import Column, Integer, Float, String, DateTime, JSON, ForeignKey, Index, PrimaryKeyConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
 
+import app.db.partitions  # noqa: F401 - renders PARTITION BY for tables with info['partition_by']
+
 Base = declarative_base()
 
-class TrafficFlow(Base):
-    __tablename__ = "traffic_flow"
+class RoadSegment(Base):
+    __tablename__ = "road_segment"
     
-    id = Column(Integer, primary_key=True, index=True)
-    timestamp = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+    id = Column(String(40), primary_key=True)  # shape_fingerprint of the HERE shape
     road_name = Column(String(128), nullable=False, index=True)
-    speed = Column(Float, nullable=False)
-    congestion_level = Column(Float, nullable=False)
     lat = Column(Float, nullable=False)
     lon = Column(Float, nullable=False)
     geometry = Column(JSON, nullable=True)  # Store as list of [lon, lat] pairs or GeoJSON
+    # Extent of the geometry, spatially indexed for bbox queries (see app.db.spatial)
+    min_lon = Column(Float, nullable=True)
+    min_lat = Column(Float, nullable=True)
+    max_lon = Column(Float, nullable=True)
+    max_lat = Column(Float, nullable=True)
+    first_seen = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+class TrafficFlowObservation(Base):
+    __tablename__ = "traffic_flow_observation"
+    __table_args__ = (
+        Index("ix_traffic_flow_observation_segment_timestamp", "segment_id", "timestamp"),
+        {"info": {"partition_by": "timestamp"}},  # Daily partitions on Postgres
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    segment_id = Column(String(40), ForeignKey("road_segment.id", ondelete="CASCADE"), nullable=False)
+    timestamp = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+    speed = Column(Float, nullable=False)
+    congestion_level = Column(Float, nullable=False)
+
+class FlowRefresh(Base):
+    __tablename__ = "flow_refresh"
+    
+    timestamp = Column(DateTime, primary_key=True)  # One row per loaded flow batch
+    segments = Column(Integer, nullable=False)  # Segments reported by the batch
+    written = Column(Integer, nullable=False)  # Observations actually stored
+
+class FlowRefreshSegment(Base):
+    __tablename__ = "flow_refresh_segment"
+    __table_args__ = (
+        # Keyset order of /traffic/flow: refresh time, then observation id
+        Index("ix_flow_refresh_segment_timestamp_observation", "timestamp", "observation_id"),
+        {"info": {"partition_by": "timestamp"}},  # Daily partitions on Postgres
+    )
+    
+    # Segments each flow batch reported, changed or not, with the observation
+    # in effect then: history carries a segment's value forward only into the
+    # refreshes that reported it
+    timestamp = Column(DateTime, primary_key=True)
+    segment_id = Column(String(40), ForeignKey("road_segment.id", ondelete="CASCADE"), primary_key=True)
+    observation_id = Column(Integer, nullable=False)  # traffic_flow_observation.id
+
+class Road(Base):
+    __tablename__ = "road"
+    
+    # Road catalog, maintained by the flow ETL (see app.db.road_catalog)
+    name = Column(String(128), primary_key=True)
+    first_seen = Column(DateTime, default=datetime.utcnow, nullable=False)
+    last_seen = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+    observations = Column(Integer, nullable=False, default=0)  # Segment reports received, all time
+    segments = Column(Integer, nullable=False, default=0)  # Segments in the latest report
+    speed = Column(Float, nullable=True)  # Mean over the latest report's segments
+    congestion_level = Column(Float, nullable=True, index=True)  # Mean jamFactor, latest report
+    max_congestion_level = Column(Float, nullable=True)
+
+# jamFactor (0-10) histogram bins of flow rollups and baselines, 0.5 wide (see app.db.flow_rollups)
+JAM_BINS = 20
+
+class JamHistogramColumns:
+    """jamFactor histogram: jam_00 .. jam_19 count the reports in each bin."""
+
+for _bin in range(JAM_BINS):
+    setattr(JamHistogramColumns, f"jam_{_bin:02d}", Column(Integer, nullable=False, default=0))
+
+class FlowRollupColumns(JamHistogramColumns):
+    """Aggregates of the flow reports in one time bucket; every column merges by sum, min or max."""
+    
+    resolution = Column(Integer, nullable=False)  # Bucket length in seconds
+    bucket = Column(DateTime, nullable=False)  # Bucket start
+    samples = Column(Integer, nullable=False)  # Segment reports in the bucket
+    speed_sum = Column(Float, nullable=False)
+    speed_min = Column(Float, nullable=False)
+    speed_max = Column(Float, nullable=False)
+    congestion_sum = Column(Float, nullable=False)
+    congestion_min = Column(Float, nullable=False)
+    congestion_max = Column(Float, nullable=False)
+
+class RoadFlowRollup(FlowRollupColumns, Base):
+    __tablename__ = "road_flow_rollup"
+    __table_args__ = (
+        PrimaryKeyConstraint("road_name", "resolution", "bucket"),
+        Index("ix_road_flow_rollup_resolution_bucket", "resolution", "bucket"),
+    )
+    
+    road_name = Column(String(128), nullable=False)
+
+class SegmentFlowRollup(FlowRollupColumns, Base):
+    __tablename__ = "segment_flow_rollup"
+    __table_args__ = (
+        PrimaryKeyConstraint("segment_id", "resolution", "bucket"),
+        Index("ix_segment_flow_rollup_resolution_bucket", "resolution", "bucket"),
+    )
+    
+    # No foreign key: rollups outlive the raw retention that deletes segments
+    segment_id = Column(String(40), nullable=False)
+
+class SegmentBaseline(JamHistogramColumns, Base):
+    """Typical flow of one segment in one local hour of the week, summed over every report (see app.db.flow_baselines)."""
+    __tablename__ = "segment_baseline"
+    __table_args__ = (
+        PrimaryKeyConstraint("slot", "segment_id"),
+    )
+    
+    slot = Column(Integer, nullable=False)  # Local weekday * 24 + hour; Monday 00:00-01:00 is 0
+    segment_id = Column(String(40), nullable=False)
+    samples = Column(Integer, nullable=False)
+    speed_sum = Column(Float, nullable=False)
+    congestion_sum = Column(Float, nullable=False)
+    congestion_sq_sum = Column(Float, nullable=False)  # For the variance
 
 class TrafficIncident(Base):
     __tablename__ = "traffic_incident"
+    __table_args__ = (
+        # Keyset order of /traffic/incidents pages (see app.db.pagination)
+        Index("ix_traffic_incident_timestamp_id", "timestamp", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
-    timestamp = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+    here_id = Column(String(128), nullable=False, unique=True)  # HERE incident id (see incident_identity)
+    timestamp = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)  # Same as last_seen
+    first_seen = Column(DateTime, default=datetime.utcnow, nullable=False)
+    last_seen = Column(DateTime, default=datetime.utcnow, nullable=False)
+    ended_at = Column(DateTime, nullable=True, index=True)  # Set once the incident drops out of the feed
     type = Column(String(64), nullable=False, index=True)
     description = Column(String(256))
     lat = Column(Float, nullable=False)
     lon = Column(Float, nullable=False)
     road_name = Column(String(128), nullable=False, index=True)  # NEW FIELD
+
+class ApiCallUsage(Base):
+    __tablename__ = "api_call_usage"
+    
+    month = Column(String(7), primary_key=True)  # YYYY-MM
+    calls = Column(Integer, nullable=False, default=0)
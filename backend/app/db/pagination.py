@@ -0,0 +1,42 @@
+"""
+Opaque keyset cursors for paging through flow and incident history.
+
+A cursor holds the (timestamp, id) of the last row of a page, the
+snapshot time of the first page and a fingerprint of the query's filters.
+The next page continues strictly after that key, so each page costs an
+index range scan of one page however deep the walk goes (no OFFSET).
+Rows written after the snapshot are left out of every page of the walk,
+so ETL runs during the walk do not shift or repeat rows.
+"""
+import base64
+import hashlib
+from datetime import datetime
+from typing import Any, NamedTuple
+
+import orjson
+
+class Cursor(NamedTuple):
+    snapshot: datetime  # Newest row time the walk can return
+    timestamp: datetime  # Key of the last row returned
+    id: int
+    filters: str  # filters_fingerprint() of the query that issued it
+
+def filters_fingerprint(*filters: Any) -> str:
+    return hashlib.sha1(orjson.dumps(filters)).hexdigest()[:12]
+
+def encode_cursor(cursor: Cursor) -> str:
+    payload = orjson.dumps([cursor.snapshot.isoformat(), cursor.timestamp.isoformat(), cursor.id, cursor.filters])
+    return base64.urlsafe_b64encode(payload).decode("ascii").rstrip("=")
+
+def decode_cursor(token: str, filters: str) -> Cursor:
+    """Parse a cursor issued for the same filters; ValueError otherwise."""
+    try:
+        snapshot, timestamp, row_id, issued_for = orjson.loads(
+            base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        )
+        cursor = Cursor(datetime.fromisoformat(snapshot), datetime.fromisoformat(timestamp), int(row_id), issued_for)
+    except Exception as e:
+        raise ValueError(f"Malformed cursor: {e}")
+    if cursor.filters != filters:
+        raise ValueError("Cursor was issued for different filters")
+    return cursor
@@ -0,0 +1,125 @@
+"""
+Daily range partitions for time-series tables on Postgres.
+
+Tables whose info has a 'partition_by' column are created with
+PARTITION BY RANGE on that column (the column is added to the primary key,
+as Postgres requires). Each day gets its own partition, named
+<table>_pYYYYMMDD, created ahead of ingestion by ensure_partitions().
+Retention drops whole expired partitions instead of deleting rows, so
+there are no long row locks, no WAL per deleted row and nothing to vacuum.
+
+SQLite has no partitioning: the tables are created as plain tables, the
+ensure step is a no-op and retention falls back to DELETE.
+"""
+import re
+import threading
+from datetime import date, datetime, timedelta
+from typing import Iterable, List, Set
+
+from sqlalchemy import Table, text
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateTable
+
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Partitions created ahead of today, so ingestion never has to wait on DDL
+DAYS_AHEAD = 2
+
+_created: Set[str] = set()
+_created_lock = threading.Lock()
+
+@compiles(CreateTable, "postgresql")
+def _create_partitioned_table(element, compiler, **kw):
+    ddl = compiler.visit_create_table(element, **kw)
+    column = element.element.info.get("partition_by")
+    if not column:
+        return ddl
+    def with_partition_column(match):
+        columns = [c.strip() for c in match.group(1).split(",")]
+        if column not in columns:
+            columns.append(column)
+        return f"PRIMARY KEY ({', '.join(columns)})"
+    ddl = re.sub(r"PRIMARY KEY \(([^)]*)\)", with_partition_column, ddl, count=1)
+    return f"{ddl.rstrip()} PARTITION BY RANGE ({column})\n\n"
+
+def partition_name(table: Table, day: date) -> str:
+    return f"{table.name}_p{day:%Y%m%d}"
+
+def is_partitioned(db: Session, table: Table) -> bool:
+    """True if table exists as a partitioned table on Postgres."""
+    if db.get_bind().dialect.name != "postgresql":
+        return False
+    return bool(db.execute(
+        text("SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = :name"),
+        {"name": table.name}
+    ).first())
+
+def partition_ddl(table: Table, day: date) -> str:
+    return (
+        f"CREATE TABLE IF NOT EXISTS {partition_name(table, day)} PARTITION OF {table.name} "
+        f"FOR VALUES FROM ('{day.isoformat()}') TO ('{(day + timedelta(days=1)).isoformat()}')"
+    )
+
+def create_partitions(db: Session, table: Table, days: Iterable[date]) -> List[str]:
+    """Create daily partitions in the session's own transaction (migrations)."""
+    names = []
+    for day in sorted(set(days)):
+        db.execute(text(partition_ddl(table, day)))
+        names.append(partition_name(table, day))
+    return names
+
+def ensure_partitions(db: Session, table: Table, timestamps: Iterable[datetime] = ()) -> List[str]:
+    """
+    Create the daily partitions covering timestamps and the next DAYS_AHEAD days.
+
+    The DDL runs on its own autocommit connection, so call this before the
+    session writes to tables the partitions reference (e.g. road_segment).
+    Returns the partitions created by this call.
+    """
+    if not is_partitioned(db, table):
+        return []
+    today = datetime.utcnow().date()
+    days = {today + timedelta(days=offset) for offset in range(DAYS_AHEAD + 1)}
+    days.update(timestamp.date() for timestamp in timestamps)
+    created = []
+    with _created_lock:
+        missing = sorted(day for day in days if partition_name(table, day) not in _created)
+        if not missing:
+            return []
+        with db.get_bind().connect() as conn:
+            conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+            for day in missing:
+                conn.execute(text(partition_ddl(table, day)))
+                _created.add(partition_name(table, day))
+                created.append(partition_name(table, day))
+    logger.info(f"Ensured {table.name} partitions: {created}")
+    return created
+
+def list_partitions(db: Session, table: Table) -> List[str]:
+    return [row[0] for row in db.execute(
+        text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = :name ORDER BY c.relname"
+        ),
+        {"name": table.name}
+    )]
+
+def drop_expired_partitions(db: Session, table: Table, cutoff: datetime) -> List[str]:
+    """Drop partitions whose whole day lies before cutoff. Runs in the session's transaction."""
+    dropped = []
+    pattern = re.compile(rf"^{re.escape(table.name)}_p(\d{{8}})$")
+    for name in list_partitions(db, table):
+        match = pattern.match(name)
+        if not match:
+            continue
+        day = datetime.strptime(match.group(1), "%Y%m%d")
+        if day + timedelta(days=1) <= cutoff:
+            db.execute(text(f"DROP TABLE {name}"))
+            dropped.append(name)
+    with _created_lock:
+        _created.difference_update(dropped)
+    return dropped
@@ -0,0 +1,107 @@
+"""
+Road catalog: one row per road name with its latest flow.
+
+/traffic/roads used to list names with a DISTINCT over the flow history in
+the window, so its cost grew with the history kept. The flow ETL now
+upserts the road table once per batch instead: last_seen, a running count
+of segment reports and the mean / worst congestion of the batch's
+segments on that road. Reading the catalog is a scan of the road table
+alone, whatever the retention.
+
+Databases that already hold flow data can seed the catalog with:
+    python -m app.db.road_catalog
+"""
+from collections import defaultdict
+from typing import Any, Dict, List
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.db.bulk import upsert
+from app.db.flow_queries import flow_at
+from app.db.models import FlowRefresh, Road, RoadSegment, TrafficFlowObservation
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+UPDATE_COLUMNS = ("last_seen", "segments", "speed", "congestion_level", "max_congestion_level")
+
+def catalog_rows(segments: List[Dict[str, Any]], observations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Aggregate one flow batch (split_rows output, every reported segment) per road name."""
+    names = {segment['id']: segment['road_name'] for segment in segments}
+    by_road = defaultdict(list)
+    for observation in observations:
+        by_road[names[observation['segment_id']]].append(observation)
+    rows = []
+    # Sorted, so concurrent loaders lock catalog rows in the same order
+    for name in sorted(by_road):
+        reports = by_road[name]
+        timestamp = max(report['timestamp'] for report in reports)
+        congestion = [report['congestion_level'] for report in reports]
+        rows.append(dict(
+            name=name,
+            first_seen=timestamp,
+            last_seen=timestamp,
+            observations=len(reports),
+            segments=len(reports),
+            speed=sum(report['speed'] for report in reports) / len(reports),
+            congestion_level=sum(congestion) / len(congestion),
+            max_congestion_level=max(congestion)
+        ))
+    return rows
+
+def update_road_catalog(db: Session, segments: List[Dict[str, Any]], observations: List[Dict[str, Any]]) -> int:
+    """Upsert the roads reported by a flow batch, in the session's transaction."""
+    rows = catalog_rows(segments, observations)
+    upsert(
+        db, Road.__table__, rows, index_elements=['name'],
+        update_columns=UPDATE_COLUMNS, increment_columns=['observations']
+    )
+    return len(rows)
+
+def rebuild_road_catalog(db: Session) -> int:
+    """
+    Recreate the catalog from stored flow: latest values from the newest
+    refresh, counts from the stored observations (with change-only storage
+    that undercounts the reports received, which were not all kept).
+    """
+    db.query(Road).delete(synchronize_session=False)
+    stats = db.query(
+        RoadSegment.road_name,
+        func.min(TrafficFlowObservation.timestamp),
+        func.max(TrafficFlowObservation.timestamp),
+        func.count(TrafficFlowObservation.id)
+    ).join(TrafficFlowObservation, TrafficFlowObservation.segment_id == RoadSegment.id)\
+        .group_by(RoadSegment.road_name)\
+        .all()
+    latest_refresh = db.query(func.max(FlowRefresh.timestamp)).scalar()
+    current = []
+    if latest_refresh is not None:
+        for row in flow_at(db, latest_refresh, reported_only=True):
+            current.append(dict(
+                id=row.segment_id, road_name=row.road_name, segment_id=row.segment_id,
+                timestamp=latest_refresh, speed=row.speed, congestion_level=row.congestion_level
+            ))
+    latest = {row['name']: row for row in catalog_rows(current, current)}
+    rows = []
+    for name, first_seen, last_seen, count in stats:
+        row = dict(name=name, first_seen=first_seen, last_seen=last_seen, observations=count,
+                   segments=0, speed=None, congestion_level=None, max_congestion_level=None)
+        if name in latest:
+            row.update({column: latest[name][column] for column in UPDATE_COLUMNS})
+        rows.append(row)
+    upsert(db, Road.__table__, rows, index_elements=['name'], update_columns=UPDATE_COLUMNS)
+    logger.info(f"Rebuilt road catalog: {len(rows)} roads, {len(latest)} with current flow")
+    return len(rows)
+
+if __name__ == "__main__":
+    from app.db.models import Base
+    from app.db.session import SessionLocal, engine
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        count = rebuild_road_catalog(db)
+        db.commit()
+    finally:
+        db.close()
+    print(f"✅ Road catalog rebuilt with {count} roads.")
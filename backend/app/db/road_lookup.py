@@ -1,37 +1,182 @@
 import json
-from shapely.geometry import LineString, Point
+import threading
+import numpy as np
 from rtree import index
 import os
 
-ROADS_FILE = os.path.join(os.path.dirname(__file__), 'sf_roads.json')
+SNAPSHOT_DIR = os.path.join(os.path.dirname(__file__), 'sf_roads_snapshot')
 
 class RoadLookup:
-    def __init__(self, roads_file=ROADS_FILE):
-        with open(roads_file) as f:
-            self.roads = json.load(f)
-        self.road_geoms = []
-        self.idx = index.Index()
-        for i, road in enumerate(self.roads):
-            line = LineString(road['geometry'])
-            self.road_geoms.append((road, line))
-            self.idx.insert(i, line.bounds)
-
-    def find_nearest_road(self, lat, lon, max_results=5):
-        pt = Point(lon, lat)
-        nearest = list(self.idx.nearest(pt.bounds, max_results))
-        min_dist = float('inf')
-        best_road = None
-        for i in nearest:
-            road, line = self.road_geoms[i]
-            dist = line.distance(pt)
-            if dist < min_dist:
-                min_dist = dist
-                best_road = road
-        return best_road['name'] if best_road else None
+    """
+    Nearest-road lookups over a compiled road network snapshot.
+
+    The snapshot (see build_road_snapshot.py) is memory-mapped, so startup
+    does no JSON parsing and allocates no per-road or per-vertex Python
+    objects; pages are shared with any other process mapping the same files.
+    Instances are read-only and safe to share between threads; use
+    get_road_lookup() rather than constructing one per consumer.
+    """
+
+    def __init__(self, snapshot_dir=SNAPSHOT_DIR):
+        if not os.path.exists(os.path.join(snapshot_dir, 'offsets.npy')):
+            raise FileNotFoundError(
+                f"Road snapshot not found at {snapshot_dir}. "
+                f"Build it with: PYTHONPATH=backend python3 -m app.db.build_road_snapshot"
+            )
+        self.snapshot_dir = snapshot_dir
+        self.coords = np.load(os.path.join(snapshot_dir, 'coords.npy'), mmap_mode='r')
+        self.offsets = np.load(os.path.join(snapshot_dir, 'offsets.npy'), mmap_mode='r')
+        self.name_ids = np.load(os.path.join(snapshot_dir, 'name_ids.npy'), mmap_mode='r')
+        self.osm_ids = np.load(os.path.join(snapshot_dir, 'osm_ids.npy'), mmap_mode='r')
+        with open(os.path.join(snapshot_dir, 'names.json')) as f:
+            self.name_table = np.array(json.load(f), dtype=object)
+        self.idx = index.Index(os.path.join(snapshot_dir, 'rtree'))
+        # libspatialindex keeps a page buffer per index, so serialize queries
+        self._idx_lock = threading.Lock()
+
+    @property
+    def num_roads(self):
+        return len(self.offsets) - 1
+
+    @property
+    def extent(self):
+        """(west, south, east, north) of the road network."""
+        return tuple(self.idx.bounds)
+
+    def within_extent(self, lats, lons):
+        """Boolean mask of the points inside the network's extent."""
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        west, south, east, north = self.extent
+        return (lons >= west) & (lons <= east) & (lats >= south) & (lats <= north)
+
+    def road_name(self, road_idx):
+        return self.name_table[self.name_ids[road_idx]]
+
+    def road_coords(self, road_idx):
+        """[lon, lat] vertices of one road, as a read-only view into the snapshot."""
+        return self.coords[self.offsets[road_idx]:self.offsets[road_idx + 1]]
+
+    def _distances(self, point_ids, road_ids, xs, ys):
+        """Exact point-to-polyline distance for each (point, road) pair."""
+        starts = self.offsets[road_ids]
+        n_segments = self.offsets[road_ids + 1] - starts - 1
+        pair = np.repeat(np.arange(len(road_ids)), n_segments)
+        seg_start = np.repeat(starts - np.cumsum(n_segments) + n_segments, n_segments) + np.arange(n_segments.sum())
+        a = self.coords[seg_start]
+        b = self.coords[seg_start + 1]
+        px = xs[point_ids][pair]
+        py = ys[point_ids][pair]
+        dx = b[:, 0] - a[:, 0]
+        dy = b[:, 1] - a[:, 1]
+        length_sq = dx * dx + dy * dy
+        with np.errstate(invalid='ignore', divide='ignore'):
+            t = ((px - a[:, 0]) * dx + (py - a[:, 1]) * dy) / length_sq
+        t = np.where(length_sq > 0, np.clip(t, 0.0, 1.0), 0.0)
+        ex = px - (a[:, 0] + t * dx)
+        ey = py - (a[:, 1] + t * dy)
+        seg_dist = np.sqrt(ex * ex + ey * ey)
+        pair_starts = np.cumsum(n_segments) - n_segments
+        return np.minimum.reduceat(seg_dist, pair_starts) if len(seg_dist) else seg_dist
+
+    def _best_per_point(self, point_ids, road_ids, dists):
+        """Reduce (point, road, distance) triples to the closest road per point."""
+        order = np.lexsort((road_ids, dists, point_ids))
+        point_ids, road_ids, dists = point_ids[order], road_ids[order], dists[order]
+        first = np.ones(len(point_ids), dtype=bool)
+        first[1:] = point_ids[1:] != point_ids[:-1]
+        return point_ids[first], road_ids[first], dists[first]
+
+    def match_many(self, lats, lons, max_distance=None):
+        """Map-match many points to their nearest roads in one batched query.
+
+        Args:
+            lats: Array-like of latitudes
+            lons: Array-like of longitudes
+            max_distance: Optional search radius in degrees, one for all
+                points or one per point (inf for none); points with no road
+                inside it come back unmatched
+
+        Returns:
+            Tuple of (road_idx, names, distances) NumPy arrays aligned with the
+            input. Unmatched points get road_idx -1, name None and distance
+            inf. Ties resolve to the lowest road index.
+        """
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        road_idx = np.full(len(lats), -1, dtype=np.int64)
+        names = np.full(len(lats), None, dtype=object)
+        distances = np.full(len(lats), np.inf)
+        if len(lats) == 0 or self.num_roads == 0:
+            return road_idx, names, distances
+
+        # Pass 1: the road with the nearest bounding box gives an upper bound
+        # on each point's true nearest distance
+        pts = np.column_stack([lons, lats])
+        with self._idx_lock:
+            ids, counts = self.idx.nearest_v(pts, pts, num_results=1)
+        ids = ids.astype(np.int64)
+        point_ids = np.repeat(np.arange(len(pts)), counts.astype(np.int64))
+        _, _, bound = self._best_per_point(
+            point_ids, ids, self._distances(point_ids, ids, lons, lats)
+        )
+        if max_distance is not None:
+            max_distance = np.broadcast_to(np.asarray(max_distance, dtype=float), lats.shape)
+            bound = np.minimum(bound, max_distance)
+
+        # Pass 2: every road whose bounds touch that radius is a candidate
+        with self._idx_lock:
+            ids, counts = self.idx.intersection_v(pts - bound[:, None], pts + bound[:, None])
+        ids = ids.astype(np.int64)
+        point_ids = np.repeat(np.arange(len(pts)), counts.astype(np.int64))
+        dists = self._distances(point_ids, ids, lons, lats)
+        if max_distance is not None:
+            keep = dists <= max_distance[point_ids]
+            point_ids, ids, dists = point_ids[keep], ids[keep], dists[keep]
+        point_ids, ids, dists = self._best_per_point(point_ids, ids, dists)
+
+        road_idx[point_ids] = ids
+        names[point_ids] = self.name_table[self.name_ids[ids]]
+        distances[point_ids] = dists
+        return road_idx, names, distances
+
+    def find_nearest_road(self, lat, lon):
+        """Name of the road whose geometry is exactly closest to (lat, lon)."""
+        _, names, _ = self.match_many([lat], [lon])
+        return names[0]
+
+    def nearest_road_index(self, lon, lat):
+        """Index of the road whose geometry is exactly closest to (lon, lat)."""
+        road_idx, _, _ = self.match_many([lat], [lon])
+        return int(road_idx[0]) if road_idx[0] >= 0 else None
+
+_registry_lock = threading.Lock()
+_shared_lookups = {}
+
+def get_road_lookup(snapshot_dir=SNAPSHOT_DIR):
+    """
+    Process-wide RoadLookup registry.
+
+    The road network is loaded lazily on first use and then shared by every
+    ETL instance in the process. Because RoadLookup memory-maps the snapshot
+    read-only, all uvicorn workers on the host share the same physical pages,
+    so adding workers costs almost no extra memory for geometry. If the
+    snapshot has not been built yet, the first caller builds it from
+    sf_roads.json (other workers wait on a file lock).
+    """
+    with _registry_lock:
+        lookup = _shared_lookups.get(snapshot_dir)
+        if lookup is None:
+            from app.db.build_road_snapshot import ensure_snapshot, ROADS_FILE
+            roads_file = os.path.join(os.path.dirname(snapshot_dir), os.path.basename(ROADS_FILE))
+            ensure_snapshot(roads_file, snapshot_dir)
+            lookup = RoadLookup(snapshot_dir)
+            _shared_lookups[snapshot_dir] = lookup
+        return lookup
 
 # Example usage:
 if __name__ == '__main__':
     lookup = RoadLookup()
     # Example: San Francisco City Hall
     lat, lon = 37.7793, -122.4193
-    print('Nearest road:', lookup.find_nearest_road(lat, lon)) 
\ No newline at end of file
+    print('Nearest road:', lookup.find_nearest_road(lat, lon))
@@ -0,0 +1,187 @@
+"""
+In-memory road-name search.
+
+A leading-wildcard ILIKE ('%main%') cannot use the b-tree index on
+road_segment.road_name, so every name search scanned the table. This index
+keeps every known road name (the OSM names of the road snapshot plus the
+names stored on road_segment, which fall back to HERE descriptions) in a
+trigram posting list, and answers case-insensitive substring queries by
+intersecting the postings of the query's trigrams and verifying the few
+survivors. Queries shorter than a trigram use a sorted prefix list.
+
+The matching names then filter road_segment with an indexed IN (...), and
+rank for autocomplete: exact, prefix, word prefix, then anywhere.
+"""
+import bisect
+import re
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.db.models import RoadSegment
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+NGRAM = 3
+
+# Queries matching more names than this are barely selective; they keep the
+# ILIKE scan rather than sending a huge IN list
+MAX_FILTER_NAMES = 1000
+
+SYNC_OVERLAP = timedelta(minutes=10)
+
+def normalize(name: str) -> str:
+    return re.sub(r"\s+", " ", name).strip().lower()
+
+def ngrams(text: str) -> Set[str]:
+    return {text[i:i + NGRAM] for i in range(len(text) - NGRAM + 1)}
+
+class RoadNameIndex:
+    """
+    Trigram index over road names for substring search and autocomplete.
+
+    Thread-safe: searches and additions share one lock, and additions only
+    ever add names, so a search sees either the old or the new catalog.
+    """
+
+    def __init__(self, names: Iterable[str] = ()):
+        self._lock = threading.Lock()
+        self._names: List[str] = []  # Display names, by name id
+        self._normalized: List[str] = []
+        self._ids: Dict[str, int] = {}  # Display name -> name id
+        self._postings: Dict[str, Set[int]] = {}  # Trigram -> name ids
+        self._sorted: List[tuple] = []  # (normalized, name id), for short prefix queries
+        # (row count, newest first_seen) of road_segment at the last sync()
+        self._synced: Optional[Tuple[int, datetime]] = None
+        self.add(names)
+
+    def __len__(self):
+        return len(self._names)
+
+    def add(self, names: Iterable[str]) -> int:
+        """Index names not seen before; returns how many were new."""
+        added = []
+        with self._lock:
+            for name in names:
+                if not name or name in self._ids:
+                    continue
+                name_id = len(self._names)
+                normalized = normalize(name)
+                self._names.append(name)
+                self._normalized.append(normalized)
+                self._ids[name] = name_id
+                for gram in ngrams(normalized):
+                    self._postings.setdefault(gram, set()).add(name_id)
+                added.append((normalized, name_id))
+            if added:
+                self._sorted = sorted(self._sorted + added)
+        return len(added)
+
+    def _candidates(self, query: str) -> List[int]:
+        if len(query) < NGRAM:
+            # Too short for a trigram: names starting with it from the sorted
+            # list, then a plain scan for it anywhere else in a name
+            start = bisect.bisect_left(self._sorted, (query,))
+            ids = []
+            for normalized, name_id in self._sorted[start:]:
+                if not normalized.startswith(query):
+                    break
+                ids.append(name_id)
+            seen = set(ids)
+            ids.extend(
+                name_id for name_id, normalized in enumerate(self._normalized)
+                if name_id not in seen and query in normalized
+            )
+            return ids
+        postings = []
+        for gram in ngrams(query):
+            posting = self._postings.get(gram)
+            if not posting:
+                return []
+            postings.append(posting)
+        postings.sort(key=len)  # Intersect from the rarest trigram
+        ids = set(postings[0])
+        for posting in postings[1:]:
+            ids &= posting
+            if not ids:
+                return []
+        # Trigrams can all occur without the query occurring as a whole
+        return [name_id for name_id in ids if query in self._normalized[name_id]]
+
+    def _rank(self, query: str, name_id: int):
+        normalized = self._normalized[name_id]
+        if normalized == query:
+            kind = 0
+        elif normalized.startswith(query):
+            kind = 1
+        elif f" {query}" in normalized:
+            kind = 2
+        else:
+            kind = 3
+        return kind, len(normalized), normalized
+
+    def matches(self, query: str) -> List[str]:
+        """Every name containing query, case-insensitively (unordered)."""
+        query = normalize(query)
+        if not query:
+            return []
+        with self._lock:
+            return [self._names[name_id] for name_id in self._candidates(query)]
+
+    def search(self, query: str, limit: int = 10) -> List[str]:
+        """Best `limit` names containing query, for autocomplete."""
+        query = normalize(query)
+        if not query:
+            return []
+        with self._lock:
+            ids = sorted(self._candidates(query), key=lambda name_id: self._rank(query, name_id))
+            return [self._names[name_id] for name_id in ids[:limit]]
+
+    def sync(self, db: Session) -> int:
+        """Add road_segment names stored since the last sync (new segments only)."""
+        count, latest = db.query(func.count(RoadSegment.id), func.max(RoadSegment.first_seen)).one()
+        if latest is None or (count, latest) == self._synced:
+            return 0
+        query = db.query(RoadSegment.road_name).distinct()
+        if self._synced is not None:
+            # Tiles commit out of order, so look back a little past the last sync
+            query = query.filter(RoadSegment.first_seen > self._synced[1] - SYNC_OVERLAP)
+        # Fetch before add() takes the lock (the fetch may yield to the event loop)
+        added = self.add([name for (name,) in query])
+        self._synced = (count, latest)
+        if added:
+            logger.info(f"Road name index: added {added} names, {len(self)} total")
+        return added
+
+_index_lock = threading.Lock()
+_index: Optional[RoadNameIndex] = None
+
+def get_road_name_index(db: Session) -> RoadNameIndex:
+    """
+    Process-wide road-name index, built on first use from the road snapshot
+    and road_segment, and topped up with names of newly stored segments.
+    """
+    global _index
+    with _index_lock:
+        if _index is None:
+            from app.db.road_lookup import get_road_lookup
+            try:
+                catalog = get_road_lookup().name_table.tolist()
+            except Exception as e:
+                logger.warning(f"Road snapshot unavailable, indexing stored road names only: {e}")
+                catalog = []
+            _index = RoadNameIndex(catalog)
+        index = _index
+    index.sync(db)
+    return index
+
+def road_name_filter(db: Session, road_name: str, column=RoadSegment.road_name):
+    """Filter clause for rows whose name column (road_segment's by default) contains road_name (case-insensitive)."""
+    names = get_road_name_index(db).matches(road_name)
+    if len(names) > MAX_FILTER_NAMES:
+        return column.ilike(f"%{road_name}%")
+    return column.in_(names)
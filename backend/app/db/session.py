@@ -1,16 +1,130 @@
-from sqlalchemy import create_engine
+import threading
+import time
+from typing import Any, Dict
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from app.config import settings
+from app.db.spatial import add_sqlite_functions
 
 # Read the DB URL from config.py (which reads from .env)
 SQLALCHEMY_DATABASE_URL = settings.DATABASE_URL
 
+# asyncio driver used by the API for each database the app supports
+ASYNC_DRIVERS = {"postgresql": "asyncpg", "sqlite": "aiosqlite"}
+
+def async_database_url(database_url: str) -> URL:
+    """DATABASE_URL with its driver swapped for the asyncio one."""
+    url = make_url(database_url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No asyncio driver configured for {backend} databases")
+    return url.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}")
+
+def pool_options(database_url: str) -> Dict[str, Any]:
+    """Explicit pool sizing; in-memory SQLite keeps SQLAlchemy's single shared connection."""
+    url = make_url(database_url)
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        return {}
+    return dict(
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE
+    )
+
+class PoolMetrics:
+    """
+    Counters for one engine's connection pool, fed by pool events.
+
+    status() adds the pool's live numbers: connections open and idle,
+    checked out and in overflow. held_seconds is the total time
+    connections spent checked out, so held_seconds / checkouts is the
+    average time a request holds one.
+    """
+
+    def __init__(self, name: str, engine):
+        self.name = name
+        self.pool = engine.pool
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.checkouts = 0
+        self.peak_checked_out = 0
+        self.held_seconds = 0.0
+        self.max_held_seconds = 0.0
+        event.listen(engine, "connect", self._on_connect)
+        event.listen(engine, "checkout", self._on_checkout)
+        event.listen(engine, "checkin", self._on_checkin)
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connects += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        connection_record.info["checked_out_at"] = time.perf_counter()
+        with self._lock:
+            self.checkouts += 1
+            self.peak_checked_out = max(self.peak_checked_out, self.pool.checkedout())
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        started = connection_record.info.pop("checked_out_at", None)
+        if started is None:
+            return
+        held = time.perf_counter() - started
+        with self._lock:
+            self.held_seconds += held
+            self.max_held_seconds = max(self.max_held_seconds, held)
+
+    def status(self) -> Dict[str, Any]:
+        pool = self.pool
+        status = {"pool": type(pool).__name__}
+        if hasattr(pool, "size"):
+            status.update(
+                size=pool.size(),
+                max_overflow=getattr(pool, "_max_overflow", 0),
+                idle=pool.checkedin(),
+                checked_out=pool.checkedout(),
+                overflow=pool.overflow()
+            )
+        with self._lock:
+            status.update(
+                connects=self.connects,
+                checkouts=self.checkouts,
+                peak_checked_out=self.peak_checked_out,
+                held_seconds=round(self.held_seconds, 3),
+                max_held_seconds=round(self.max_held_seconds, 3)
+            )
+        return status
+
 # Set echo=True to see generated SQL queries (for debugging)
-engine = create_engine(SQLALCHEMY_DATABASE_URL, echo=False)
+# Synchronous engine: ETL, cleanup, NDJSON exports and the scripts
+engine = create_engine(SQLALCHEMY_DATABASE_URL, echo=False, **pool_options(SQLALCHEMY_DATABASE_URL))
 print(f"[DEBUG] session.py loaded. engine: {engine}")
 
+# Asyncio engine for the API's request handlers, so a slow query waits on
+# the pool instead of blocking the event loop
+async_engine = create_async_engine(
+    async_database_url(SQLALCHEMY_DATABASE_URL), echo=False, **pool_options(SQLALCHEMY_DATABASE_URL)
+)
+
+if engine.dialect.name == "sqlite":
+    # segment_intersects(), the exact test of the road segment bbox filter
+    event.listen(engine, "connect", add_sqlite_functions)
+    event.listen(async_engine.sync_engine, "connect", add_sqlite_functions)
+
 # SessionLocal is the class you'll use to create DB sessions
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+pool_metrics = {
+    "sync": PoolMetrics("sync", engine),
+    "async": PoolMetrics("async", async_engine.sync_engine)
+}
+
+def pool_status() -> Dict[str, Dict[str, Any]]:
+    return {name: metrics.status() for name, metrics in pool_metrics.items()}
 
 def get_db():
     """Dependency to get database session."""
@@ -19,3 +133,14 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    """
+    Dependency to get an asyncio database session.
+
+    The query helpers are written against Session; run them with
+    `await db.run_sync(helper, *args)`, which executes them on this
+    session's connection without blocking the event loop.
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
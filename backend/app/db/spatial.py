@@ -0,0 +1,319 @@
+"""
+Spatial indexes for the bbox filters of /traffic/flow and /traffic/incidents.
+
+Road segments are found through their extent (min/max lon/lat of the
+geometry), so a long segment crossing the viewport is returned even when
+its first point lies outside it. The candidates are then rechecked on the
+polyline itself, so a diagonal segment whose extent only overlaps a
+corner of the bbox is left out. Incidents are matched on their point.
+
+Backends, picked per database:
+- postgis: GiST expression indexes on ST_MakeEnvelope / ST_MakePoint,
+  used when the postgis extension is installed; ST_Intersects rechecks.
+- gist: the same on Postgres' built-in box / point types, for servers
+  without PostGIS (e.g. the postgres:15 image in docker-compose); the
+  segment_intersects() SQL function rechecks.
+- rtree: SQLite R*Tree virtual tables kept in sync by triggers. They are
+  keyed by rowid; road_segment has a string primary key, so rebuild
+  them (below) after a VACUUM, which may renumber its rowids. Rechecked
+  by segment_intersects(), a Python function added to each connection.
+- none: plain range predicates (SQLite without the R*Tree tables), with
+  the same recheck.
+
+Install or rebuild with:
+    python -m app.db.spatial
+"""
+import json
+import threading
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.utils.geo import geometry_bounds, polyline_intersects_bounds
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+Bounds = Tuple[float, float, float, float]  # west, south, east, north
+
+BOUNDS_COLUMNS = ("min_lon", "min_lat", "max_lon", "max_lat")
+
+_backends: Dict[str, str] = {}
+_backends_lock = threading.Lock()
+
+SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS road_segment_rtree USING rtree(id, min_lon, max_lon, min_lat, max_lat)",
+    """CREATE TRIGGER IF NOT EXISTS road_segment_rtree_insert AFTER INSERT ON road_segment
+       WHEN new.min_lon IS NOT NULL BEGIN
+         INSERT OR REPLACE INTO road_segment_rtree VALUES (new.rowid, new.min_lon, new.max_lon, new.min_lat, new.max_lat);
+       END""",
+    # Update triggers delete and reinsert: under an upsert's ON CONFLICT DO UPDATE the
+    # outer statement's conflict policy overrides OR REPLACE inside the trigger
+    """CREATE TRIGGER IF NOT EXISTS road_segment_rtree_update AFTER UPDATE OF min_lon, min_lat, max_lon, max_lat ON road_segment
+       WHEN new.min_lon IS NOT NULL BEGIN
+         DELETE FROM road_segment_rtree WHERE id = new.rowid;
+         INSERT INTO road_segment_rtree VALUES (new.rowid, new.min_lon, new.max_lon, new.min_lat, new.max_lat);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS road_segment_rtree_delete AFTER DELETE ON road_segment BEGIN
+         DELETE FROM road_segment_rtree WHERE id = old.rowid;
+       END""",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS traffic_incident_rtree USING rtree(id, min_lon, max_lon, min_lat, max_lat)",
+    """CREATE TRIGGER IF NOT EXISTS traffic_incident_rtree_insert AFTER INSERT ON traffic_incident BEGIN
+         INSERT OR REPLACE INTO traffic_incident_rtree VALUES (new.id, new.lon, new.lon, new.lat, new.lat);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS traffic_incident_rtree_update AFTER UPDATE OF lat, lon ON traffic_incident BEGIN
+         DELETE FROM traffic_incident_rtree WHERE id = new.id;
+         INSERT INTO traffic_incident_rtree VALUES (new.id, new.lon, new.lon, new.lat, new.lat);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS traffic_incident_rtree_delete AFTER DELETE ON traffic_incident BEGIN
+         DELETE FROM traffic_incident_rtree WHERE id = old.id;
+       END""",
+]
+
+# Per R*Tree: the rows it should index, and how to fill it from them
+SQLITE_REBUILDS = [
+    (
+        "road_segment_rtree",
+        "SELECT count(*) FROM road_segment WHERE min_lon IS NOT NULL",
+        """INSERT INTO road_segment_rtree
+           SELECT rowid, min_lon, max_lon, min_lat, max_lat FROM road_segment WHERE min_lon IS NOT NULL"""
+    ),
+    (
+        "traffic_incident_rtree",
+        "SELECT count(*) FROM traffic_incident",
+        "INSERT INTO traffic_incident_rtree SELECT id, lon, lon, lat, lat FROM traffic_incident"
+    ),
+]
+
+POSTGIS_DDL = [
+    """CREATE INDEX IF NOT EXISTS ix_road_segment_extent_postgis ON road_segment
+       USING gist (ST_MakeEnvelope(min_lon, min_lat, max_lon, max_lat, 4326))""",
+    """CREATE INDEX IF NOT EXISTS ix_traffic_incident_location_postgis ON traffic_incident
+       USING gist (ST_SetSRID(ST_MakePoint(lon, lat), 4326))""",
+]
+
+# app.utils.geo.polyline_intersects_bounds() in PL/pgSQL
+SEGMENT_INTERSECTS_DDL = """
+CREATE OR REPLACE FUNCTION segment_intersects(
+    geometry json, lat float8, lon float8, w float8, s float8, e float8, n float8
+) RETURNS boolean LANGUAGE plpgsql IMMUTABLE AS $$
+DECLARE
+    points json := geometry;
+    x0 float8; y0 float8; x1 float8; y1 float8; t0 float8; t1 float8;
+    p float8[]; q float8[];
+BEGIN
+    IF json_typeof(points) IS DISTINCT FROM 'array' THEN
+        points := '[]';
+    END IF;
+    IF json_array_length(points) = 0 THEN
+        points := json_build_array(json_build_array(lon, lat));
+    END IF;
+    x1 := (points->0->>0)::float8;
+    y1 := (points->0->>1)::float8;
+    IF json_array_length(points) = 1 THEN
+        RETURN x1 BETWEEN w AND e AND y1 BETWEEN s AND n;
+    END IF;
+    FOR i IN 1 .. json_array_length(points) - 1 LOOP
+        x0 := x1;
+        y0 := y1;
+        x1 := (points->i->>0)::float8;
+        y1 := (points->i->>1)::float8;
+        p := ARRAY[x0 - x1, x1 - x0, y0 - y1, y1 - y0];
+        q := ARRAY[x0 - w, e - x0, y0 - s, n - y0];
+        t0 := 0;
+        t1 := 1;
+        FOR k IN 1 .. 4 LOOP
+            IF p[k] = 0 THEN
+                IF q[k] < 0 THEN
+                    t0 := 2;
+                END IF;
+            ELSIF p[k] < 0 THEN
+                t0 := greatest(t0, q[k] / p[k]);
+            ELSE
+                t1 := least(t1, q[k] / p[k]);
+            END IF;
+        END LOOP;
+        IF t0 <= t1 THEN
+            RETURN true;
+        END IF;
+    END LOOP;
+    RETURN false;
+END
+$$"""
+
+GIST_DDL = [
+    """CREATE INDEX IF NOT EXISTS ix_road_segment_extent_gist ON road_segment
+       USING gist (box(point(min_lon, min_lat), point(max_lon, max_lat)))""",
+    "CREATE INDEX IF NOT EXISTS ix_traffic_incident_location_gist ON traffic_incident USING gist (point(lon, lat))",
+    SEGMENT_INTERSECTS_DDL,
+]
+
+def _segment_intersects(geometry: Optional[str], lat: float, lon: float,
+                        west: float, south: float, east: float, north: float) -> int:
+    return int(polyline_intersects_bounds(json.loads(geometry) if geometry else None, lat, lon, (west, south, east, north)))
+
+def add_sqlite_functions(dbapi_connection, connection_record):
+    """Connect hook adding segment_intersects() to a SQLite connection (see app.db.session)."""
+    dbapi_connection.create_function("segment_intersects", 7, _segment_intersects, deterministic=True)
+
+def _detect_backend(db: Session) -> str:
+    if db.get_bind().dialect.name == "postgresql":
+        has_postgis = db.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'postgis'")).first()
+        return "postgis" if has_postgis else "gist"
+    has_rtree = db.execute(
+        text("SELECT 1 FROM sqlite_master WHERE name = 'road_segment_rtree'")
+    ).first()
+    return "rtree" if has_rtree else "none"
+
+def spatial_backend(db: Session) -> str:
+    """The spatial backend of the session's database (cached per database URL)."""
+    key = str(db.get_bind().url)
+    with _backends_lock:
+        if key in _backends:
+            return _backends[key]
+    # Detect outside the lock: under AsyncSession.run_sync the query yields to
+    # the event loop, and another request blocking on the lock would stall it
+    backend = _detect_backend(db)
+    with _backends_lock:
+        return _backends.setdefault(key, backend)
+
+def _bbox_params(bounds: Bounds) -> Dict[str, float]:
+    west, south, east, north = bounds
+    return {"bbox_w": west, "bbox_s": south, "bbox_e": east, "bbox_n": north}
+
+def segment_bbox_filter(db: Session, bounds: Bounds):
+    """Filter clause for road_segment rows whose geometry (or point) intersects bounds."""
+    backend = spatial_backend(db)
+    overlaps = (
+        "road_segment.max_lon >= :bbox_w AND road_segment.min_lon <= :bbox_e "
+        "AND road_segment.max_lat >= :bbox_s AND road_segment.min_lat <= :bbox_n"
+    )
+    # Only evaluated on the candidates the extent test lets through
+    intersects = (
+        "segment_intersects(road_segment.geometry, road_segment.lat, road_segment.lon, "
+        ":bbox_w, :bbox_s, :bbox_e, :bbox_n)"
+    )
+    if backend == "postgis":
+        # Without two points the segment is its extent, which the index test already matched exactly
+        clause = (
+            "ST_MakeEnvelope(road_segment.min_lon, road_segment.min_lat, road_segment.max_lon, road_segment.max_lat, 4326) "
+            "&& ST_MakeEnvelope(:bbox_w, :bbox_s, :bbox_e, :bbox_n, 4326) AND CASE "
+            "WHEN coalesce(json_typeof(road_segment.geometry), 'null') <> 'array' THEN true "
+            "WHEN json_array_length(road_segment.geometry) < 2 THEN true "
+            "ELSE ST_Intersects(ST_SetSRID(ST_GeomFromGeoJSON(json_build_object("
+            "'type', 'LineString', 'coordinates', road_segment.geometry)::text), 4326), "
+            "ST_MakeEnvelope(:bbox_w, :bbox_s, :bbox_e, :bbox_n, 4326)) END"
+        )
+    elif backend == "gist":
+        clause = (
+            "box(point(road_segment.min_lon, road_segment.min_lat), point(road_segment.max_lon, road_segment.max_lat)) "
+            "&& box(point(:bbox_w, :bbox_s), point(:bbox_e, :bbox_n)) AND " + intersects
+        )
+    elif backend == "rtree":
+        # The R*Tree stores 32-bit floats rounded outwards; the exact tests drop the extras
+        clause = (
+            "road_segment.rowid IN (SELECT id FROM road_segment_rtree WHERE max_lon >= :bbox_w "
+            "AND min_lon <= :bbox_e AND max_lat >= :bbox_s AND min_lat <= :bbox_n) AND " + overlaps + " AND " + intersects
+        )
+    else:
+        clause = overlaps + " AND " + intersects
+    return text(clause).bindparams(**_bbox_params(bounds))
+
+def incident_bbox_filter(db: Session, bounds: Bounds):
+    """Filter clause for traffic_incident rows inside bounds."""
+    backend = spatial_backend(db)
+    inside = (
+        "traffic_incident.lon >= :bbox_w AND traffic_incident.lon <= :bbox_e "
+        "AND traffic_incident.lat >= :bbox_s AND traffic_incident.lat <= :bbox_n"
+    )
+    if backend == "postgis":
+        clause = (
+            "ST_SetSRID(ST_MakePoint(traffic_incident.lon, traffic_incident.lat), 4326) "
+            "&& ST_MakeEnvelope(:bbox_w, :bbox_s, :bbox_e, :bbox_n, 4326)"
+        )
+    elif backend == "gist":
+        clause = "point(traffic_incident.lon, traffic_incident.lat) <@ box(point(:bbox_w, :bbox_s), point(:bbox_e, :bbox_n))"
+    elif backend == "rtree":
+        clause = (
+            "traffic_incident.id IN (SELECT id FROM traffic_incident_rtree WHERE max_lon >= :bbox_w "
+            "AND min_lon <= :bbox_e AND max_lat >= :bbox_s AND min_lat <= :bbox_n) AND " + inside
+        )
+    else:
+        clause = inside
+    return text(clause).bindparams(**_bbox_params(bounds))
+
+def _backfill_bounds(conn):
+    """Add and fill the extent columns of road_segment rows written before they existed."""
+    columns = {column["name"] for column in inspect(conn).get_columns("road_segment")}
+    for column in BOUNDS_COLUMNS:
+        if column not in columns:
+            conn.execute(text(f"ALTER TABLE road_segment ADD COLUMN {column} FLOAT"))
+    rows = conn.execute(text("SELECT id, geometry, lat, lon FROM road_segment WHERE min_lon IS NULL")).all()
+    updates = []
+    for segment_id, geometry, lat, lon in rows:
+        if isinstance(geometry, str):
+            geometry = json.loads(geometry)
+        min_lon, min_lat, max_lon, max_lat = geometry_bounds(geometry, lat, lon)
+        updates.append(dict(id=segment_id, min_lon=min_lon, min_lat=min_lat, max_lon=max_lon, max_lat=max_lat))
+    if updates:
+        conn.execute(
+            text(
+                "UPDATE road_segment SET min_lon = :min_lon, min_lat = :min_lat, "
+                "max_lon = :max_lon, max_lat = :max_lat WHERE id = :id"
+            ),
+            updates
+        )
+    return len(updates)
+
+def _rebuild_rtrees(conn, force: bool) -> int:
+    """Refill R*Trees whose row count differs from their table's (rows written before the triggers existed)."""
+    rebuilt = 0
+    for rtree, count_rows, fill in SQLITE_REBUILDS:
+        if not force and conn.execute(text(f"SELECT count(*) FROM {rtree}")).scalar() == conn.execute(text(count_rows)).scalar():
+            continue
+        conn.execute(text(f"DELETE FROM {rtree}"))
+        conn.execute(text(fill))
+        rebuilt += 1
+    return rebuilt
+
+def install(engine: Engine, rebuild: bool = False) -> str:
+    """
+    Create the spatial indexes for the engine's database; returns the backend.
+    
+    SQLite R*Trees are refilled only when they are out of step with their
+    table, so a startup with the indexes in place does no O(rows) work;
+    rebuild=True refills them regardless.
+    """
+    from app.db.models import Base
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        backfilled = _backfill_bounds(conn)
+        if engine.dialect.name == "postgresql":
+            available = conn.execute(text("SELECT 1 FROM pg_available_extensions WHERE name = 'postgis'")).first()
+            backend = "gist"
+            if available:
+                try:
+                    with conn.begin_nested():
+                        conn.execute(text("CREATE EXTENSION IF NOT EXISTS postgis"))
+                    backend = "postgis"
+                except Exception as e:
+                    logger.warning(f"Could not enable PostGIS, using built-in GiST boxes: {e}")
+            for statement in POSTGIS_DDL if backend == "postgis" else GIST_DDL:
+                conn.execute(text(statement))
+        else:
+            backend = "rtree"
+            for statement in SQLITE_DDL:
+                conn.execute(text(statement))
+            rebuilt = _rebuild_rtrees(conn, rebuild)
+            if rebuilt:
+                logger.info(f"Rebuilt {rebuilt} SQLite R*Tree indexes")
+    with _backends_lock:
+        _backends[str(engine.url)] = backend
+    logger.info(f"Spatial indexes installed ({backend}); backfilled extents of {backfilled} segments")
+    return backend
+
+if __name__ == "__main__":
+    from app.db.session import engine
+    print(f"✅ Spatial indexes installed ({install(engine, rebuild=True)}).")
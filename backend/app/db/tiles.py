@@ -0,0 +1,131 @@
+"""
+Vector tiles of current flow and active incidents.
+
+A tile z/x/y (XYZ scheme, Web Mercator) holds two layers:
+- flow: each segment's value at the latest refresh, as a LineString with
+  road_name, speed and congestion_level.
+- incidents: active incidents as Points with type and description.
+
+Geometry is projected to tile coordinates, clipped to the tile plus a small
+buffer and simplified with a fixed tolerance in tile units, so segments get
+coarser as the zoom goes down and those shorter than the tolerance drop
+out. Rendering is lazy; the API caches rendered tiles per ETL generation.
+"""
+import math
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+import numpy as np
+import shapely
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.db.flow_queries import flow_at
+from app.db.models import FlowRefresh, TrafficIncident
+from app.db.spatial import Bounds, incident_bbox_filter
+from app.utils.mvt import EXTENT, LINESTRING, POINT, Layer, encode_tile, line_commands, point_commands
+
+MAX_ZOOM = 22
+
+# Geometry kept past each tile edge (tile units) so strokes join across tiles
+BUFFER = 64
+
+# Douglas-Peucker tolerance and minimum segment length in tile units:
+# 4/4096 is half a pixel on a 512 px tile
+SIMPLIFY_TOLERANCE = 4.0
+
+def tile_bounds(z: int, x: int, y: int) -> Bounds:
+    """(west, south, east, north) of a tile in degrees."""
+    n = 2 ** z
+    def lat(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+    return x / n * 360.0 - 180.0, lat(y + 1), (x + 1) / n * 360.0 - 180.0, lat(y)
+
+def valid_tile(z: int, x: int, y: int) -> bool:
+    return 0 <= z <= MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+def project(lons: np.ndarray, lats: np.ndarray, z: int, x: int, y: int) -> np.ndarray:
+    """Lon/lat arrays to float tile coordinates (0..EXTENT, y down)."""
+    n = 2 ** z
+    lats = np.clip(lats, -85.0511, 85.0511)
+    px = ((lons + 180.0) / 360.0 * n - x) * EXTENT
+    rad = np.radians(lats)
+    py = ((1.0 - np.log(np.tan(rad) + 1.0 / np.cos(rad)) / math.pi) / 2.0 * n - y) * EXTENT
+    return np.column_stack([px, py])
+
+def _parts(geometry) -> List[np.ndarray]:
+    """Integer coordinate arrays of a clipped, simplified (multi)linestring."""
+    if geometry is None or geometry.is_empty:
+        return []
+    lines = geometry.geoms if hasattr(geometry, "geoms") else [geometry]
+    parts = []
+    for line in lines:
+        if line.geom_type != "LineString":
+            continue
+        coords = np.rint(shapely.get_coordinates(line)).astype(np.int64)
+        # Rounding can collapse neighbours onto the same tile unit
+        keep = np.ones(len(coords), dtype=bool)
+        keep[1:] = np.any(coords[1:] != coords[:-1], axis=1)
+        coords = coords[keep]
+        if len(coords) >= 2:
+            parts.append(coords)
+    return parts
+
+def flow_layer(db: Session, z: int, x: int, y: int, at: Optional[datetime]) -> Layer:
+    layer = Layer("flow")
+    if at is None:
+        return layer
+    west, south, east, north = tile_bounds(z, x, y)
+    pad_x = (east - west) * BUFFER / EXTENT
+    pad_y = (north - south) * BUFFER / EXTENT
+    rows = flow_at(db, at, bounds=(west - pad_x, south - pad_y, east + pad_x, north + pad_y))
+    lines, kept = [], []
+    for row in rows:
+        if not row.geometry or len(row.geometry) < 2:
+            continue
+        coords = np.asarray(row.geometry, dtype=float)
+        lines.append(shapely.linestrings(project(coords[:, 0], coords[:, 1], z, x, y)))
+        kept.append(row)
+    if not lines:
+        return layer
+    clipped = shapely.clip_by_rect(np.array(lines, dtype=object), -BUFFER, -BUFFER, EXTENT + BUFFER, EXTENT + BUFFER)
+    simplified = shapely.simplify(clipped, SIMPLIFY_TOLERANCE, preserve_topology=False)
+    # Segments shorter than the tolerance would not be visible at this zoom
+    visible = shapely.length(simplified) >= SIMPLIFY_TOLERANCE
+    for row, geometry, show in zip(kept, simplified, visible):
+        if not show:
+            continue
+        # Rounded values repeat across features, so the layer's value table stays small
+        layer.add(LINESTRING, line_commands(_parts(geometry)), {
+            "road_name": row.road_name,
+            "speed": round(row.speed, 1),
+            "congestion_level": round(row.congestion_level, 1)
+        }, feature_id=row.id)
+    return layer
+
+def incident_layer(db: Session, z: int, x: int, y: int) -> Layer:
+    layer = Layer("incidents")
+    rows = db.execute(
+        select(TrafficIncident.id, TrafficIncident.type, TrafficIncident.description,
+               TrafficIncident.road_name, TrafficIncident.lat, TrafficIncident.lon)
+        .where(incident_bbox_filter(db, tile_bounds(z, x, y)), TrafficIncident.ended_at.is_(None))
+    ).all()
+    if not rows:
+        return layer
+    points = np.rint(project(
+        np.array([row.lon for row in rows]), np.array([row.lat for row in rows]), z, x, y
+    )).astype(np.int64)
+    for row, (px, py) in zip(rows, points):
+        layer.add(POINT, point_commands([(int(px), int(py))]), {
+            "type": row.type,
+            "description": row.description,
+            "road_name": row.road_name
+        }, feature_id=row.id)
+    return layer
+
+def render_tile(db: Session, z: int, x: int, y: int) -> Tuple[bytes, int, int]:
+    """Encoded tile plus its flow and incident feature counts."""
+    at = db.query(func.max(FlowRefresh.timestamp)).scalar()
+    flow = flow_layer(db, z, x, y, at)
+    incidents = incident_layer(db, z, x, y)
+    return encode_tile([flow, incidents]), len(flow), len(incidents)
@@ -1,6 +1,8 @@
+import asyncio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.api.routes import router as traffic_router
+from app.api.routes import router as traffic_router, restore_refresh_state, start_change_tracking
+from app.db.session import async_engine
 from app.utils.logger import get_logger
 
 logger = get_logger(__name__)
@@ -19,11 +21,27 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Data-Age", "X-Data-Updated", "X-Refresh-State", "ETag"],
 )
 
 # Include the traffic routes
 app.include_router(traffic_router, prefix="/api/v1", tags=["traffic"])
 
+@app.on_event("startup")
+async def track_changes():
+    """Record the current data, so the first ETL run pushes only its own changes to /stream."""
+    await start_change_tracking()
+
+@app.on_event("startup")
+async def restore_refresh_times():
+    """Resume from the last stored refresh rather than refreshing every region at startup."""
+    await asyncio.to_thread(restore_refresh_state)
+
+@app.on_event("shutdown")
+async def close_database():
+    """Close the API's pooled database connections."""
+    await async_engine.dispose()
+
 @app.get("/")
 async def root():
     """Root endpoint with API information."""
@@ -32,8 +50,12 @@ async def root():
         "version": "1.0.0",
         "endpoints": {
             "traffic_flow": "/api/v1/traffic/flow",
+            "traffic_flow_aggregate": "/api/v1/traffic/flow/aggregate",
+            "traffic_flow_anomalies": "/api/v1/traffic/flow/anomalies",
             "traffic_incidents": "/api/v1/traffic/incidents", 
             "road_names": "/api/v1/traffic/roads",
+            "traffic_tiles": "/api/v1/traffic/tiles/{z}/{x}/{y}.mvt",
+            "stream": "/api/v1/stream",
             "health": "/api/v1/health",
             "etl_status": "/api/v1/etl/status",
             "etl_trigger": "/api/v1/etl/trigger",
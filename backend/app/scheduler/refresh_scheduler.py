@@ -0,0 +1,300 @@
+import calendar
+import math
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from app.db.bulk import increment
+from app.db.models import ApiCallUsage
+from app.db.session import SessionLocal
+from app.utils.geo import flow_identity
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+ENDPOINTS = ("flow", "incidents")
+
+# Refresh interval bounds, whatever the budget allows; with no demand at
+# all, regions are refreshed at the longest interval
+MIN_REFRESH_MINUTES = 5
+MAX_REFRESH_HOURS = 5
+# Fraction of the monthly budget held back for manual triggers and retries
+BUDGET_RESERVE = 0.1
+# Every worker adds its calls to api_call_usage; decisions read the shared
+# total back when the copy in memory is older than this
+USAGE_SYNC_SECONDS = 5
+# Request demand decays with this half-life
+DEMAND_HALF_LIFE_MINUTES = 60
+# Decayed request count (over all regions) at which the full budget rate is
+# spent; less demand spends proportionally less
+BUSY_DEMAND = 30.0
+# Weight given to the newest change-rate observation
+CHANGE_RATE_SMOOTHING = 0.3
+# A segment counts as changed when its jamFactor moves at least this much
+JAM_FACTOR_CHANGE_THRESHOLD = 1.0
+
+try:
+    LOCAL_TZ = ZoneInfo("America/Los_Angeles")
+except ZoneInfoNotFoundError:
+    LOCAL_TZ = timezone(timedelta(hours=-8))
+
+def time_of_day_factor(now: datetime) -> float:
+    """Weekday rush hours refresh more often, nights less (now is naive UTC)."""
+    local = now.replace(tzinfo=timezone.utc).astimezone(LOCAL_TZ)
+    if local.weekday() < 5 and (7 <= local.hour < 10 or 16 <= local.hour < 19):
+        return 2.0
+    if 0 <= local.hour < 5:
+        return 0.25
+    return 1.0
+
+def _weekly_mean_time_of_day_factor() -> float:
+    start = datetime(2024, 1, 1)
+    return sum(time_of_day_factor(start + timedelta(hours=hour)) for hour in range(7 * 24)) / (7 * 24)
+
+# Scaling the call rate by time_of_day_factor / this keeps its weekly total
+MEAN_TIME_OF_DAY_FACTOR = _weekly_mean_time_of_day_factor()
+
+def bboxes_intersect(a: str, b: str) -> bool:
+    aw, as_, ae, an = map(float, a.split(','))
+    bw, bs, be, bn = map(float, b.split(','))
+    return aw <= be and bw <= ae and as_ <= bn and bs <= an
+
+class RefreshScheduler:
+    """
+    Decide when each (region, endpoint) pair is refreshed from the HERE API.
+
+    The monthly call budget minus calls already spent this month, by every
+    worker (see api_call_usage), is spread over the rest of the month as an
+    allowed call rate. The rate spent now is
+    that rate shaped by the time of day (its weekly mean unchanged) and
+    scaled by total API demand: busy rush hours may spend up to twice it,
+    nights a quarter, and with no demand only the MAX_REFRESH_HOURS
+    refreshes run. Budget left unspent raises the allowed rate for the rest
+    of the month. The rate spent now is divided between (region, endpoint)
+    pairs by weight, and each pair's refresh interval is the inverse of its
+    share. Weights grow with recent API demand for the region and with how
+    much the data changed between refreshes.
+    """
+
+    def __init__(self, regions: Dict[str, str], monthly_budget: int):
+        self.regions = regions
+        self.monthly_budget = monthly_budget
+        self._lock = threading.Lock()
+        self._usage_month: Optional[str] = None
+        self._usage_synced: Optional[datetime] = None
+        self._calls_spent = 0
+        self._demand = {region: 0.0 for region in regions}
+        self._demand_updated = datetime.utcnow()
+        self._change_rate = {(r, e): 0.5 for r in regions for e in ENDPOINTS}
+        self._last_refresh: Dict[Tuple[str, str], datetime] = {}
+        self._previous_snapshot: Dict[Tuple[str, str], Any] = {}
+
+    # Call accounting
+
+    def _sync_usage(self, now: datetime):
+        """Read this month's spent calls, by all workers, back from the database (blocking)."""
+        month = now.strftime("%Y-%m")
+        if (
+            month == self._usage_month and self._usage_synced is not None
+            and (now - self._usage_synced).total_seconds() < USAGE_SYNC_SECONDS
+        ):
+            return
+        if month != self._usage_month:
+            self._usage_month = month
+            self._calls_spent = 0
+        db = SessionLocal()
+        try:
+            usage = db.get(ApiCallUsage, month)
+            self._calls_spent = usage.calls if usage else 0
+            self._usage_synced = now
+        except Exception as e:
+            logger.warning(f"Could not read API call usage, keeping {self._calls_spent}: {e}")
+        finally:
+            db.close()
+
+    def record_calls(self, calls: int):
+        """Add calls spent against the HERE API to this month's total, shared by all workers (blocking)."""
+        if calls <= 0:
+            return
+        now = datetime.utcnow()
+        month = now.strftime("%Y-%m")
+        db = SessionLocal()
+        try:
+            total = increment(db, ApiCallUsage.__table__, {"month": month}, "calls", calls)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"Could not persist API call usage: {e}")
+            total = None
+        finally:
+            db.close()
+        with self._lock:
+            if total is not None:
+                # The shared total, including every other worker's calls
+                self._usage_month = month
+                self._calls_spent = total
+                self._usage_synced = now
+            elif month == self._usage_month:
+                self._calls_spent += calls
+
+    # Signals
+
+    def _decay_demand(self, now: datetime):
+        elapsed = (now - self._demand_updated).total_seconds() / 60
+        if elapsed <= 0:
+            return
+        decay = 0.5 ** (elapsed / DEMAND_HALF_LIFE_MINUTES)
+        for region in self._demand:
+            self._demand[region] *= decay
+        self._demand_updated = now
+
+    def record_demand(self, bbox: Optional[str] = None):
+        """Count an API request against every region its bbox touches (all if no bbox)."""
+        with self._lock:
+            self._decay_demand(datetime.utcnow())
+            for region, region_bbox in self.regions.items():
+                try:
+                    if bbox is None or bboxes_intersect(bbox, region_bbox):
+                        self._demand[region] += 1
+                except ValueError:
+                    self._demand[region] += 1
+
+    def observe_tile(self, region: str, endpoint: str, payload: Optional[Dict[str, Any]]):
+        """Update the change rate of (region, endpoint) from a freshly fetched payload."""
+        if not payload:
+            return
+        results = payload.get('results', [])
+        if endpoint == "flow":
+            snapshot = {
+                segment_id: r.get('currentFlow', {}).get('jamFactor', 0.0)
+                for segment_id, r in ((flow_identity(r), r) for r in results)
+                if segment_id is not None
+            }
+        else:
+            snapshot = {str(r.get('incidentDetails', {}).get('id')) for r in results}
+        key = (region, endpoint)
+        with self._lock:
+            previous = self._previous_snapshot.get(key)
+            self._previous_snapshot[key] = snapshot
+            if previous is None:
+                return
+            if endpoint == "flow":
+                keys = set(snapshot) | set(previous)
+                changed = sum(
+                    1 for k in keys
+                    if k not in snapshot or k not in previous
+                    or abs(snapshot[k] - previous[k]) >= JAM_FACTOR_CHANGE_THRESHOLD
+                )
+            else:
+                keys = snapshot | previous
+                changed = len(snapshot ^ previous)
+            rate = changed / len(keys) if keys else 0.0
+            self._change_rate[key] = (
+                CHANGE_RATE_SMOOTHING * rate + (1 - CHANGE_RATE_SMOOTHING) * self._change_rate[key]
+            )
+
+    def record_refresh(self, jobs: List[Tuple[str, str]], when: Optional[datetime] = None):
+        when = when or datetime.utcnow()
+        with self._lock:
+            for job in jobs:
+                self._last_refresh[job] = when
+
+    # Decisions
+
+    def _weight(self, region: str, endpoint: str, now: datetime) -> float:
+        demand_factor = 1.0 + math.log1p(self._demand[region])
+        change_factor = 0.5 + 2.0 * self._change_rate[(region, endpoint)]
+        return demand_factor * change_factor
+
+    def _allowed_calls_per_second(self, now: datetime) -> float:
+        days_in_month = calendar.monthrange(now.year, now.month)[1]
+        month_end = datetime(now.year, now.month, days_in_month) + timedelta(days=1)
+        seconds_left = max((month_end - now).total_seconds(), 1.0)
+        remaining = self.monthly_budget * (1 - BUDGET_RESERVE) - self._calls_spent
+        return max(remaining, 0.0) / seconds_left
+
+    def _activity(self) -> float:
+        """Share of the budget rate that current demand calls for: 0 when idle, 1 when busy."""
+        return min(sum(self._demand.values()) / BUSY_DEMAND, 1.0)
+
+    def _call_rate(self, allowed: float, now: datetime) -> float:
+        """Calls per second to spend now out of the allowed rate."""
+        return allowed * time_of_day_factor(now) / MEAN_TIME_OF_DAY_FACTOR * self._activity()
+
+    def _intervals(self, now: datetime) -> Dict[Tuple[str, str], float]:
+        """Refresh interval in seconds for every (region, endpoint); inf if out of budget."""
+        self._sync_usage(now)
+        self._decay_demand(now)
+        weights = {(r, e): self._weight(r, e, now) for r in self.regions for e in ENDPOINTS}
+        total = sum(weights.values())
+        allowed = self._allowed_calls_per_second(now)
+        rate = self._call_rate(allowed, now)
+        intervals = {}
+        for job, weight in weights.items():
+            if allowed <= 0 or total <= 0:
+                intervals[job] = math.inf
+                continue
+            interval = total / (weight * rate) if rate > 0 else math.inf
+            intervals[job] = min(max(interval, MIN_REFRESH_MINUTES * 60), MAX_REFRESH_HOURS * 3600)
+        return intervals
+
+    def due_jobs(self, now: Optional[datetime] = None) -> List[Tuple[str, str]]:
+        """(region, endpoint) pairs whose refresh interval has elapsed."""
+        now = now or datetime.utcnow()
+        with self._lock:
+            intervals = self._intervals(now)
+            return [
+                job for job, interval in intervals.items()
+                if interval != math.inf and (
+                    job not in self._last_refresh
+                    or (now - self._last_refresh[job]).total_seconds() >= interval
+                )
+            ]
+
+    def all_jobs(self) -> List[Tuple[str, str]]:
+        return [(r, e) for r in self.regions for e in ENDPOINTS]
+
+    def seconds_until_next_due(self, now: Optional[datetime] = None) -> float:
+        now = now or datetime.utcnow()
+        with self._lock:
+            intervals = self._intervals(now)
+            waits = [
+                0.0 if job not in self._last_refresh
+                else interval - (now - self._last_refresh[job]).total_seconds()
+                for job, interval in intervals.items()
+            ]
+        return max(min(waits), 0.0) if waits else math.inf
+
+    def status(self) -> Dict[str, Any]:
+        """Current budget and per-(region, endpoint) decisions for /etl/status."""
+        now = datetime.utcnow()
+        with self._lock:
+            intervals = self._intervals(now)
+            allowed = self._allowed_calls_per_second(now)
+            jobs = []
+            for (region, endpoint), interval in intervals.items():
+                last = self._last_refresh.get((region, endpoint))
+                next_due = None
+                if interval != math.inf:
+                    next_due = (last + timedelta(seconds=interval)).isoformat() if last else now.isoformat()
+                jobs.append({
+                    "region": region,
+                    "endpoint": endpoint,
+                    "interval_minutes": round(interval / 60, 1) if interval != math.inf else None,
+                    "last_refresh": last.isoformat() if last else None,
+                    "next_due": next_due,
+                    "demand": round(self._demand[region], 2),
+                    "change_rate": round(self._change_rate[(region, endpoint)], 3),
+                })
+            return {
+                "month": self._usage_month,
+                "monthly_budget": self.monthly_budget,
+                "calls_spent": self._calls_spent,
+                "budget_reserve": BUDGET_RESERVE,
+                "allowed_calls_per_hour": round(allowed * 3600, 1),
+                "calls_per_hour_now": round(self._call_rate(allowed, now) * 3600, 1),
+                "time_of_day_factor": time_of_day_factor(now),
+                "demand_activity": round(self._activity(), 3),
+                "jobs": jobs,
+            }
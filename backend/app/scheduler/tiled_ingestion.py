@@ -0,0 +1,117 @@
+import asyncio
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.db.session import SessionLocal
+from app.scheduler.traffic_flow import TrafficFlowETL
+from app.scheduler.traffic_incidents import TrafficIncidentsETL, incident_identity
+from app.utils.api_client import AsyncHereAPIClient
+from app.utils.geo import flow_identity
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+def merge_results(payloads: List[Optional[Dict[str, Any]]], identity) -> Dict[str, Any]:
+    """Merge per-tile payloads into one, keeping the first copy of each result (all of those without a key)."""
+    seen = set()
+    merged = []
+    duplicates = 0
+    for payload in payloads:
+        for result in (payload or {}).get('results', []):
+            key = identity(result)
+            if key is None:
+                merged.append(result)  # Left to the transform, which skips it
+                continue
+            if key in seen:
+                duplicates += 1
+                continue
+            seen.add(key)
+            merged.append(result)
+    logger.info(f"Merged {len(merged)} results from {len(payloads)} tiles ({duplicates} duplicates dropped)")
+    return {'results': merged}
+
+class TiledIngestion:
+    """
+    Ingest traffic for many bounding boxes in one refresh.
+
+    Every (tile, endpoint) request is fetched concurrently through one
+    AsyncHereAPIClient, which enforces the concurrency and rate limits.
+    Flow segments and incidents that appear in overlapping tiles are
+    deduplicated, and the merged result is loaded in a single transaction.
+    """
+
+    def __init__(self, flow_etl: TrafficFlowETL, incidents_etl: TrafficIncidentsETL):
+        self.flow_etl = flow_etl
+        self.incidents_etl = incidents_etl
+
+    async def extract(
+        self,
+        api_client: AsyncHereAPIClient,
+        flow_tiles: Dict[str, str],
+        incident_tiles: Dict[str, str],
+        on_tile: Optional[Callable[[str, str, Optional[Dict[str, Any]]], None]] = None
+    ) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """
+        Fetch flow and incidents for the given tiles concurrently and merge them.
+        
+        on_tile(name, endpoint, payload) is called with each raw tile payload
+        before merging, e.g. to track how fast a region's data changes. The
+        merged incidents payload lists the tiles that answered under 'bboxes',
+        the area in which missing incidents can be marked ended.
+        """
+        flow_payloads, incident_payloads = await asyncio.gather(
+            asyncio.gather(*[self.flow_etl.extract_async(api_client, bbox) for bbox in flow_tiles.values()]),
+            asyncio.gather(*[self.incidents_etl.extract_async(api_client, bbox) for bbox in incident_tiles.values()]),
+        )
+        for endpoint, names, payloads in (("flow", flow_tiles, flow_payloads), ("incidents", incident_tiles, incident_payloads)):
+            for name, payload in zip(names, payloads):
+                if payload is None:
+                    logger.warning(f"Tile '{name}' returned no {endpoint} data; continuing with the other tiles")
+                if on_tile:
+                    on_tile(name, endpoint, payload)
+        incidents_raw = merge_results(incident_payloads, incident_identity)
+        incidents_raw['bboxes'] = [
+            bbox for bbox, payload in zip(incident_tiles.values(), incident_payloads) if payload is not None
+        ]
+        return merge_results(flow_payloads, flow_identity), incidents_raw
+
+    def process(self, flow_raw: Dict[str, Any], incidents_raw: Dict[str, Any]) -> Tuple[int, int]:
+        """Transform the merged payloads and load both in one transaction."""
+        traffic_flows = self.flow_etl.transform(flow_raw) if flow_raw['results'] else []
+        traffic_incidents = self.incidents_etl.transform(incidents_raw) if incidents_raw['results'] else []
+        # Only end missing incidents when the feed was transformed successfully
+        incident_bboxes = incidents_raw.get('bboxes') if traffic_incidents or not incidents_raw['results'] else None
+        if not traffic_flows and not traffic_incidents and not incident_bboxes:
+            return 0, 0
+
+        db = SessionLocal()
+        try:
+            flow_count = self.flow_etl.load(traffic_flows, db=db)
+            incident_count = self.incidents_etl.load(traffic_incidents, db=db, bboxes=incident_bboxes)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error loading tiled ingestion: {str(e)}")
+            raise
+        finally:
+            db.close()
+
+        logger.info(f"Tiled ingestion loaded {flow_count} flow and {incident_count} incident records")
+        return flow_count, incident_count
+
+    async def run_async(
+        self,
+        flow_tiles: Dict[str, str],
+        incident_tiles: Optional[Dict[str, str]] = None,
+        api_client: Optional[AsyncHereAPIClient] = None,
+        on_tile: Optional[Callable[[str, str, Optional[Dict[str, Any]]], None]] = None
+    ) -> Tuple[int, int]:
+        """Run the tiled pipeline (incidents default to the flow tiles); opens its own client unless one is given."""
+        if incident_tiles is None:
+            incident_tiles = flow_tiles
+        logger.info(f"Starting tiled ingestion: flow for {list(flow_tiles)}, incidents for {list(incident_tiles)}")
+        if api_client is None:
+            async with AsyncHereAPIClient() as api_client:
+                flow_raw, incidents_raw = await self.extract(api_client, flow_tiles, incident_tiles, on_tile)
+        else:
+            flow_raw, incidents_raw = await self.extract(api_client, flow_tiles, incident_tiles, on_tile)
+        return await asyncio.to_thread(self.process, flow_raw, incidents_raw)
@@ -1,26 +1,47 @@
+import asyncio
 from datetime import datetime
 from typing import List, Dict, Any, Optional
 from sqlalchemy.orm import Session
 
 from app.db.session import SessionLocal
-from app.db.models import TrafficFlow
-from app.utils.api_client import HereAPIClient
+from app.db.models import FlowRefresh, FlowRefreshSegment, RoadSegment, TrafficFlowObservation
+from app.db.bulk import bulk_load, insert_ignore
+from app.db.flow_queries import keyframe_window, latest_observations
+from app.db.partitions import ensure_partitions
+from app.db.road_catalog import update_road_catalog
+from app.db.flow_rollups import update_flow_rollups
+from app.db.flow_baselines import update_flow_baselines
+from app.config import settings
+from app.utils.api_client import HereAPIClient, AsyncHereAPIClient
 from app.utils.logger import get_logger
-from app.utils.geo import calculate_midpoint
-from app.db.road_lookup import RoadLookup
-from shapely.geometry import LineString, Point
+from app.utils.geo import geometry_bounds, shape_fingerprint
+from app.db.road_lookup import RoadLookup, get_road_lookup
+import numpy as np
 
 logger = get_logger(__name__)
 
+# Outside the road snapshot's extent, only trust an OSM match this close
+# (degrees, ~50 m); farther points keep the HERE description rather than
+# take the name of the nearest road in another city
+OSM_MATCH_MAX_DISTANCE = 0.0005
+
 class TrafficFlowETL:
     """ETL pipeline for traffic flow data from HERE API."""
     
     def __init__(self):
         self.api_client = HereAPIClient()
-        self.road_lookup = RoadLookup()
-        # Load all OSM roads for geometry extension
-        self.osm_roads = self.road_lookup.roads
-        self.osm_lines = [LineString(road['geometry']) for road in self.osm_roads]
+        self._road_lookup = None
+    
+    @property
+    def road_lookup(self) -> RoadLookup:
+        """Shared road network, loaded on first use."""
+        if self._road_lookup is None:
+            self._road_lookup = get_road_lookup()
+        return self._road_lookup
+    
+    @road_lookup.setter
+    def road_lookup(self, lookup: RoadLookup):
+        self._road_lookup = lookup
     
     def extract(self, bbox: str = "-118.5,34.0,-118.2,34.2") -> Optional[Dict[str, Any]]:
         """Extract traffic flow data from HERE API."""
@@ -34,45 +55,63 @@ class TrafficFlowETL:
         logger.info(f"Successfully extracted traffic flow data")
         return data
     
-    def extend_congestion_geometry(self, geometry: list, extend_points: int = 3) -> list:
+    async def extract_async(self, api_client: AsyncHereAPIClient, bbox: str) -> Optional[Dict[str, Any]]:
+        """Extract traffic flow data through a shared async client."""
+        logger.info("Starting traffic flow data extraction (async)")
+        data = await api_client.get_traffic_flow(bbox)
+        
+        if not data:
+            logger.error("Failed to extract traffic flow data")
+            return None
+        
+        return data
+    
+    def match_roads(self, lats, lons):
+        """
+        match_many() as transform() uses it: inside the road network's extent
+        every point takes its nearest road, as before regions were added;
+        outside it only roads within OSM_MATCH_MAX_DISTANCE match.
+        """
+        inside = self.road_lookup.within_extent(lats, lons)
+        return self.road_lookup.match_many(lats, lons, max_distance=np.where(inside, np.inf, OSM_MATCH_MAX_DISTANCE))
+    
+    def extend_congestion_geometry(self, geometry: list, extend_points: int = 3, road_idx: Optional[int] = None) -> list:
         if not geometry or len(geometry) < 2:
             return geometry
-        # Use the midpoint to find the nearest OSM road
-        mid_idx = len(geometry) // 2
-        mid_point = Point(geometry[mid_idx])
-        min_dist = float('inf')
-        best_road = None
-        best_line = None
-        for road, line in zip(self.osm_roads, self.osm_lines):
-            dist = line.distance(mid_point)
-            if dist < min_dist:
-                min_dist = dist
-                best_road = road
-                best_line = line
-        if not best_line:
+        # Use the midpoint to find the nearest OSM road, unless the caller
+        # already matched it in a batch
+        if road_idx is None:
+            mid_idx = len(geometry) // 2
+            mid_lon, mid_lat = geometry[mid_idx]
+            road_idx = self.road_lookup.nearest_road_index(mid_lon, mid_lat)
+        if road_idx is None or road_idx < 0:
             return geometry
-        # Find closest indices on the OSM road
-        coords = list(best_line.coords)
+        # Find closest vertex indices on the OSM road in one vectorized pass
+        coords = self.road_lookup.road_coords(road_idx)
         def closest_idx(pt):
-            return min(range(len(coords)), key=lambda i: Point(coords[i]).distance(Point(pt)))
+            dx = coords[:, 0] - pt[0]
+            dy = coords[:, 1] - pt[1]
+            return int(np.argmin(np.sqrt(dx * dx + dy * dy)))
         start_idx = closest_idx(geometry[0])
         end_idx = closest_idx(geometry[-1])
         # Extend indices
         new_start = max(0, start_idx - extend_points)
         new_end = min(len(coords) - 1, end_idx + extend_points)
-        extended_coords = coords[new_start:new_end+1]
+        extended_coords = [tuple(pt) for pt in coords[new_start:new_end+1].tolist()]
         return extended_coords
     
-    def transform(self, raw_data: Dict[str, Any]) -> List[TrafficFlow]:
-        """Transform raw API data into TrafficFlow model instances (HERE API v7)."""
+    def transform(self, raw_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Transform raw API data into plain traffic flow row dicts for bulk loading (HERE API v7)."""
         logger.info("Starting traffic flow data transformation (v7)")
         traffic_flows = []
         try:
             results = raw_data.get('results', [])
+            timestamp = datetime.utcnow()  # One observation time for the whole batch
             # Debug: print first 2 raw results
             for i, result in enumerate(results[:2]):
                 logger.info(f"RAW API RESULT {i+1}: {result}")
-            for idx, result in enumerate(results):
+            records = []
+            for result in results:
                 location = result.get('location', {})
                 current_flow = result.get('currentFlow', {})
                 road_name = location.get('description', 'Unknown Road')
@@ -81,6 +120,11 @@ class TrafficFlowETL:
                 # Extract coordinates from location.shape.links[0].points[0]
                 lat, lon = 37.7749, -122.4194  # San Francisco fallback
                 try:
+                    # Shapes are the segments' identity: results without one would all share a segment
+                    segment_id = shape_fingerprint(location)
+                    if segment_id is None:
+                        logger.warning(f"Skipping flow result without a shape: {road_name}")
+                        continue
                     shape = location.get('shape', {})
                     links = shape.get('links', [])
                     if links and len(links) > 0:
@@ -95,23 +139,32 @@ class TrafficFlowETL:
                     else:
                         geometry = None
                 except Exception as e:
-                    logger.warning(f"Error extracting coordinates: {e}")
-                    geometry = None
-                # NEW: Lookup road name using OSM data
-                matched_road_name = self.road_lookup.find_nearest_road(lat, lon)
-                if matched_road_name:
-                    road_name = matched_road_name
+                    logger.warning(f"Skipping flow result with a malformed shape ({road_name}): {e}")
+                    continue
+                records.append((road_name, speed, jam_factor, lat, lon, geometry, segment_id))
+            # Map-match every first point (road name) and every midpoint
+            # (geometry extension) in two batched queries
+            _, matched_names, _ = self.match_roads([r[3] for r in records], [r[4] for r in records])
+            extendable = [i for i, r in enumerate(records) if r[5] and len(r[5]) >= 2]
+            midpoints = [records[i][5][len(records[i][5]) // 2] for i in extendable]
+            mid_road_idx, _, _ = self.match_roads([pt[1] for pt in midpoints], [pt[0] for pt in midpoints])
+            extend_road = dict(zip(extendable, mid_road_idx.tolist()))
+            for idx, (road_name, speed, jam_factor, lat, lon, geometry, segment_id) in enumerate(records):
+                # Lookup road name using OSM data
+                if matched_names[idx]:
+                    road_name = matched_names[idx]
                 # Extend congestion geometry if possible
-                if geometry and len(geometry) >= 2:
-                    geometry = self.extend_congestion_geometry(geometry, extend_points=3)
-                traffic_flow = TrafficFlow(
+                if idx in extend_road:
+                    geometry = self.extend_congestion_geometry(geometry, extend_points=3, road_idx=extend_road[idx])
+                traffic_flow = dict(
+                    segment_id=segment_id,
                     speed=speed,
                     congestion_level=jam_factor,
                     road_name=road_name,
                     lat=lat,
                     lon=lon,
                     geometry=geometry,
-                    timestamp=datetime.utcnow()
+                    timestamp=timestamp
                 )
                 # Debug: print first 2 transformed records
                 if idx < 2:
@@ -123,64 +176,104 @@ class TrafficFlowETL:
             logger.error(f"Error transforming traffic flow data (v7): {str(e)}")
             return []
     
-    def _create_traffic_flow(self, cf: Dict[str, Any], tmc: Dict[str, Any], shape: List[str]) -> Optional[TrafficFlow]:
-        """Create a TrafficFlow instance from extracted data."""
-        try:
-            # Extract speed and congestion level
-            speed = cf.get('SU', 0.0)  # Speed Uncongested
-            congestion_level = cf.get('JF', 0.0)  # Jam Factor
-            
-            # Extract road name
-            road_name = tmc.get('DE', 'Unknown Road')
-            
-            # Calculate coordinates from shape
-            lat, lon = self._extract_coordinates(shape)
-            
-            # Create TrafficFlow instance
-            traffic_flow = TrafficFlow(
-                speed=speed,
-                congestion_level=congestion_level,
-                road_name=road_name,
-                lat=lat,
-                lon=lon,
-                timestamp=datetime.utcnow()
-            )
-            
-            return traffic_flow
-            
-        except Exception as e:
-            logger.error(f"Error creating traffic flow record: {str(e)}")
-            return None
+    def split_rows(self, traffic_flows: List[Dict[str, Any]]):
+        """Split transformed rows into road_segment rows and observation rows (one of each per segment)."""
+        segments = {}
+        observations = {}
+        for row in traffic_flows:
+            if row['segment_id'] not in segments:
+                min_lon, min_lat, max_lon, max_lat = geometry_bounds(row['geometry'], row['lat'], row['lon'])
+                segments[row['segment_id']] = dict(
+                    id=row['segment_id'],
+                    road_name=row['road_name'],
+                    lat=row['lat'],
+                    lon=row['lon'],
+                    geometry=row['geometry'],
+                    min_lon=min_lon,
+                    min_lat=min_lat,
+                    max_lon=max_lon,
+                    max_lat=max_lat,
+                    first_seen=row['timestamp']
+                )
+            observations.setdefault(row['segment_id'], dict(
+                segment_id=row['segment_id'],
+                timestamp=row['timestamp'],
+                speed=row['speed'],
+                congestion_level=row['congestion_level']
+            ))
+        return list(segments.values()), list(observations.values())
     
-    def _extract_coordinates(self, shape: List[str]) -> tuple[float, float]:
-        """Extract latitude and longitude from shape data."""
-        if not shape:
-            # Default to Los Angeles coordinates if no shape data
-            return 34.0522, -118.2437
+    def changed_observations(self, db: Session, observations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Keep observations that differ from their segment's last stored one.
         
-        try:
-            # Take the first coordinate pair from the shape
-            coord_str = shape[0]
-            lat_str, lon_str = coord_str.split(',')
-            
-            lat = float(lat_str)
-            lon = float(lon_str)
-            
-            return lat, lon
-            
-        except (ValueError, IndexError) as e:
-            logger.warning(f"Could not parse coordinates from shape {shape}: {str(e)}")
-            # Default to Los Angeles coordinates
-            return 34.0522, -118.2437
+        A change is a speed or jamFactor move of at least FLOW_SPEED_DELTA /
+        FLOW_JAM_FACTOR_DELTA; unchanged segments are still written once per
+        FLOW_KEYFRAME_MINUTES so readers can tell them from vanished ones.
+        """
+        latest = latest_observations(db, [o['segment_id'] for o in observations])
+        keyframe = keyframe_window()
+        changed = []
+        for observation in observations:
+            last = latest.get(observation['segment_id'])
+            if (
+                last is None
+                or observation['timestamp'] - last[0] >= keyframe
+                or abs(observation['speed'] - last[1]) >= settings.FLOW_SPEED_DELTA
+                or abs(observation['congestion_level'] - last[2]) >= settings.FLOW_JAM_FACTOR_DELTA
+            ):
+                changed.append(observation)
+        return changed
+    
+    def _write(self, db: Session, traffic_flows: List[Dict[str, Any]]) -> int:
+        if not traffic_flows:
+            return 0
+        # Partition DDL runs on its own connection, before this session locks road_segment
+        refreshed_at = traffic_flows[0]['timestamp']
+        ensure_partitions(db, TrafficFlowObservation.__table__, [refreshed_at])
+        ensure_partitions(db, FlowRefreshSegment.__table__, [refreshed_at])
+        segments, observations = self.split_rows(traffic_flows)
+        # Geometry and name are stored once per segment; known segments are skipped
+        insert_ignore(db, RoadSegment.__table__, segments, index_elements=['id'])
+        reported = len(observations)
+        # The catalog, rollups and baselines track every report, not only the stored changes
+        update_road_catalog(db, segments, observations)
+        update_flow_rollups(db, segments, observations)
+        update_flow_baselines(db, observations)
+        if settings.FLOW_DELTA_INGESTION:
+            observations = self.changed_observations(db, observations)
+        # COPY FROM STDIN on Postgres, batched executemany elsewhere
+        bulk_load(db, TrafficFlowObservation.__table__, observations, use_copy=True)
+        # What the batch reported and the observation now in effect for each, so
+        # history reads neither carry other segments into it nor rebuild it
+        current = latest_observations(db, [segment['id'] for segment in segments])
+        insert_ignore(db, FlowRefreshSegment.__table__, [
+            dict(timestamp=refreshed_at, segment_id=segment_id, observation_id=latest[3])
+            for segment_id, latest in current.items()
+        ], index_elements=['timestamp', 'segment_id'])
+        insert_ignore(db, FlowRefresh.__table__, [dict(
+            timestamp=refreshed_at,
+            segments=reported,
+            written=len(observations)
+        )], index_elements=['timestamp'])
+        logger.info(f"Stored {len(observations)} of {reported} flow observations")
+        return len(traffic_flows)
     
-    def load(self, traffic_flows: List[TrafficFlow]) -> int:
-        """Load traffic flow data into the database."""
+    def load(self, traffic_flows: List[Dict[str, Any]], db: Optional[Session] = None) -> int:
+        """
+        Bulk load traffic flow rows into road_segment and traffic_flow_observation.
+        
+        If db is given the caller owns the transaction: rows are written but
+        not committed, and errors propagate so the caller can roll back.
+        """
         logger.info(f"Starting to load {len(traffic_flows)} traffic flow records")
         
+        if db is not None:
+            return self._write(db, traffic_flows)
+        
         db = SessionLocal()
         try:
-            # Add all records to the session
-            db.add_all(traffic_flows)
+            self._write(db, traffic_flows)
             db.commit()
             
             logger.info(f"Successfully loaded {len(traffic_flows)} traffic flow records")
@@ -202,6 +295,18 @@ class TrafficFlowETL:
         if not raw_data:
             return 0
         
+        return self.process(raw_data)
+    
+    async def run_async(self, bbox: str, api_client: AsyncHereAPIClient) -> int:
+        """Run the pipeline with async extraction; transform and load run on a worker thread."""
+        logger.info("Starting traffic flow ETL pipeline (async)")
+        raw_data = await self.extract_async(api_client, bbox)
+        if not raw_data:
+            return 0
+        return await asyncio.to_thread(self.process, raw_data)
+    
+    def process(self, raw_data: Dict[str, Any]) -> int:
+        """Transform and load an extracted payload."""
         # Transform
         traffic_flows = self.transform(raw_data)
         if not traffic_flows:
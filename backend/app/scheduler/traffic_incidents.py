@@ -1,23 +1,51 @@
+import asyncio
 from datetime import datetime
 from typing import List, Dict, Any, Optional
+from sqlalchemy import and_, or_, update
 from sqlalchemy.orm import Session
 import re
 
 from app.db.session import SessionLocal
 from app.db.models import TrafficIncident
-from app.utils.api_client import HereAPIClient
+from app.db.bulk import upsert
+from app.utils.api_client import HereAPIClient, AsyncHereAPIClient
+from app.utils.geo import shape_fingerprint
 from app.utils.logger import get_logger
-from app.db.road_lookup import RoadLookup
-from shapely.geometry import LineString, Point  # For distance calculation
+from app.db.road_lookup import RoadLookup, get_road_lookup
 
 logger = get_logger(__name__)
 
+# Columns refreshed when an incident is seen again; first_seen keeps its insert value
+UPSERT_COLUMNS = ['timestamp', 'last_seen', 'ended_at', 'type', 'description', 'lat', 'lon', 'road_name']
+
+def incident_identity(result: Dict[str, Any]) -> Optional[str]:
+    """Stable key for a HERE incident: its incident id, else its shape and type; None with neither."""
+    details = result.get('incidentDetails', {})
+    if details.get('id'):
+        return str(details['id'])
+    try:
+        fingerprint = shape_fingerprint(result.get('location', {}))
+    except (KeyError, TypeError):
+        return None
+    return f"{fingerprint}:{details.get('type')}" if fingerprint else None
+
 class TrafficIncidentsETL:
     """ETL pipeline for traffic incidents data from HERE API."""
     
     def __init__(self):
         self.api_client = HereAPIClient()
-        self.road_lookup = RoadLookup()
+        self._road_lookup = None
+    
+    @property
+    def road_lookup(self) -> RoadLookup:
+        """Shared road network, loaded on first use."""
+        if self._road_lookup is None:
+            self._road_lookup = get_road_lookup()
+        return self._road_lookup
+    
+    @road_lookup.setter
+    def road_lookup(self, lookup: RoadLookup):
+        self._road_lookup = lookup
     
     def extract(self, bbox: str = "-118.5,34.0,-118.2,34.2") -> Optional[Dict[str, Any]]:
         """Extract traffic incidents data from HERE API."""
@@ -31,13 +59,26 @@ class TrafficIncidentsETL:
         logger.info(f"Successfully extracted traffic incidents data")
         return data
     
-    def transform(self, raw_data: Dict[str, Any]) -> List[TrafficIncident]:
-        """Transform raw API data into TrafficIncident model instances (HERE API v7)."""
+    async def extract_async(self, api_client: AsyncHereAPIClient, bbox: str) -> Optional[Dict[str, Any]]:
+        """Extract traffic incidents data through a shared async client."""
+        logger.info("Starting traffic incidents data extraction (async)")
+        data = await api_client.get_traffic_incidents(bbox)
+        
+        if not data:
+            logger.error("Failed to extract traffic incidents data")
+            return None
+        
+        return data
+    
+    def transform(self, raw_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Transform raw API data into plain traffic incident row dicts for bulk loading (HERE API v7)."""
         logger.info("Starting traffic incidents data transformation (v7)")
         traffic_incidents = []
         try:
             results = raw_data.get('results', [])
-            for idx, result in enumerate(results):
+            timestamp = datetime.utcnow()  # One observation time for the whole batch
+            records = []
+            for result in results:
                 location = result.get('location', {})
                 incident_details = result.get('incidentDetails', {})
                 
@@ -48,7 +89,6 @@ class TrafficIncidentsETL:
                 
                 # Extract coordinates from location.shape.links[0].points[0]
                 lat, lon = 37.7749, -122.4194  # San Francisco fallback
-                here_road_name = location.get('description', 'Unknown Road')
                 try:
                     shape = location.get('shape', {})
                     links = shape.get('links', [])
@@ -60,21 +100,19 @@ class TrafficIncidentsETL:
                             lon = first_point.get('lng', -118.2437)
                 except Exception as e:
                     logger.warning(f"Error extracting coordinates: {e}")
-                
-                # Lookup road name using OSM data
-                road, line = None, None
-                pt = Point(lon, lat)
-                nearest = list(self.road_lookup.idx.nearest(pt.bounds, 5))
-                min_dist = float('inf')
-                best_road = None
-                for i in nearest:
-                    candidate_road, candidate_line = self.road_lookup.road_geoms[i]
-                    dist = candidate_line.distance(pt)
-                    if dist < min_dist:
-                        min_dist = dist
-                        best_road = candidate_road
-                        line = candidate_line
-                osm_name = best_road['name'] if best_road else 'Unknown Road'
+                here_id = incident_identity(result)
+                if here_id is None:
+                    logger.warning(f"Skipping incident without an id or a shape: {description}")
+                    continue
+                records.append((here_id, location, incident_type, description, lat, lon))
+            
+            # Lookup road names using OSM data in one batched query
+            _, osm_names, distances = self.road_lookup.match_many(
+                [r[4] for r in records], [r[5] for r in records]
+            )
+            for idx, (here_id, location, incident_type, description, lat, lon) in enumerate(records):
+                osm_name = osm_names[idx] or 'Unknown Road'
+                min_dist = float(distances[idx])
                 here_road_name = location.get('description', 'Unknown Road')
                 # Try to extract intersection from description
                 intersection = None
@@ -97,14 +135,17 @@ class TrafficIncidentsETL:
                 if min_dist > 0.0005:
                     logger.warning(f"Incident at ({lat}, {lon}) is more than ~50m from nearest road!")
                     print(f"WARNING: Incident at ({lat}, {lon}) is more than ~50m from nearest road!")
-                # If TrafficIncident model does not have road_name, add as a comment for schema update
-                traffic_incident = TrafficIncident(
+                traffic_incident = dict(
+                    here_id=here_id,
                     type=incident_type,
                     description=description,
                     lat=lat,
                     lon=lon,
                     road_name=road_name,  # Now supported by schema
-                    timestamp=datetime.utcnow()
+                    timestamp=timestamp,
+                    first_seen=timestamp,
+                    last_seen=timestamp,
+                    ended_at=None
                 )
                 traffic_incidents.append(traffic_incident)
             logger.info(f"Transformed {len(traffic_incidents)} traffic incident records (v7)")
@@ -113,18 +154,65 @@ class TrafficIncidentsETL:
             logger.error(f"Error transforming traffic incidents data (v7): {str(e)}")
             return []
     
-    def load(self, traffic_incidents: List[TrafficIncident]) -> int:
-        """Load traffic incidents data into the database."""
+    def mark_ended(self, db: Session, bboxes: List[str], seen_at: datetime) -> int:
+        """End active incidents inside the fetched bboxes that the feed no longer reports."""
+        areas = []
+        for bbox in bboxes:
+            west, south, east, north = map(float, bbox.split(','))
+            areas.append(and_(
+                TrafficIncident.lon >= west,
+                TrafficIncident.lon <= east,
+                TrafficIncident.lat >= south,
+                TrafficIncident.lat <= north
+            ))
+        if not areas:
+            return 0
+        result = db.execute(
+            update(TrafficIncident)
+            .where(TrafficIncident.ended_at.is_(None), TrafficIncident.last_seen < seen_at, or_(*areas))
+            .values(ended_at=seen_at)
+        )
+        return result.rowcount
+    
+    def _write(self, db: Session, traffic_incidents: List[Dict[str, Any]], bboxes: Optional[List[str]]) -> int:
+        # One row per HERE incident; Postgres rejects a batch that updates a row twice
+        rows = list({row['here_id']: row for row in traffic_incidents}.values())
+        upsert(db, TrafficIncident.__table__, rows, index_elements=['here_id'], update_columns=UPSERT_COLUMNS)
+        if bboxes:
+            seen_at = rows[0]['timestamp'] if rows else datetime.utcnow()
+            ended = self.mark_ended(db, bboxes, seen_at)
+            logger.info(f"Marked {ended} traffic incidents as ended")
+        return len(rows)
+    
+    def load(
+        self,
+        traffic_incidents: List[Dict[str, Any]],
+        db: Optional[Session] = None,
+        bboxes: Optional[List[str]] = None
+    ) -> int:
+        """
+        Upsert traffic incident rows by HERE incident id.
+        
+        Known incidents get their last_seen and details updated in place.
+        If bboxes (the areas the feed was fetched for) are given, active
+        incidents inside them that were not reported are marked ended.
+        
+        If db is given the caller owns the transaction: rows are written but
+        not committed, and errors propagate so the caller can roll back.
+        """
         logger.info(f"Starting to load {len(traffic_incidents)} traffic incident records")
         
+        if db is not None:
+            return self._write(db, traffic_incidents, bboxes)
+        
         db = SessionLocal()
         try:
-            # Add all records to the session
-            db.add_all(traffic_incidents)
+            # Batched INSERT ... ON CONFLICT DO UPDATE, no ORM objects
+            loaded = self._write(db, traffic_incidents, bboxes)
             db.commit()
             
-            logger.info(f"Successfully loaded {len(traffic_incidents)} traffic incident records")
-            return len(traffic_incidents)
+            logger.info(f"Successfully loaded {loaded} traffic incident records")
+            return loaded
             
         except Exception as e:
             db.rollback()
@@ -142,13 +230,25 @@ class TrafficIncidentsETL:
         if not raw_data:
             return 0
         
+        return self.process(raw_data, [bbox])
+    
+    async def run_async(self, bbox: str, api_client: AsyncHereAPIClient) -> int:
+        """Run the pipeline with async extraction; transform and load run on a worker thread."""
+        logger.info("Starting traffic incidents ETL pipeline (async)")
+        raw_data = await self.extract_async(api_client, bbox)
+        if not raw_data:
+            return 0
+        return await asyncio.to_thread(self.process, raw_data, [bbox])
+    
+    def process(self, raw_data: Dict[str, Any], bboxes: Optional[List[str]] = None) -> int:
+        """Transform and load an extracted payload fetched for bboxes."""
         # Transform
         traffic_incidents = self.transform(raw_data)
-        if not traffic_incidents:
-            return 0
+        if not traffic_incidents and (raw_data.get('results') or not bboxes):
+            return 0  # Nothing to load, or the transform failed
         
-        # Load
-        loaded_count = self.load(traffic_incidents)
+        # Load (an empty feed still ends the incidents inside bboxes)
+        loaded_count = self.load(traffic_incidents, bboxes=bboxes)
         
         logger.info(f"Traffic incidents ETL pipeline completed. Loaded {loaded_count} records")
         return loaded_count
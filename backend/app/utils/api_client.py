@@ -1,3 +1,5 @@
+import asyncio
+import httpx
 import requests
 from typing import Dict, Any, Optional
 from app.config import settings
@@ -15,6 +17,7 @@ class HereAPIClient:
         self.session.headers.update({
             'User-Agent': 'Floficient/1.0'
         })
+        self.calls_made = 0  # Requests sent, for API budget accounting
     
     def _make_request(self, endpoint: str, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """Make a request to the HERE API with error handling."""
@@ -24,6 +27,7 @@ class HereAPIClient:
             logger.info(f"Making request to: {endpoint}")
             logger.info(f"URL: {url}")
             logger.info(f"Params: {params}")
+            self.calls_made += 1
             response = self.session.get(url, params=params, timeout=20)
             if response.status_code == 200:
                 return response.json()
@@ -37,15 +41,92 @@ class HereAPIClient:
 
     def get_traffic_flow(self, bbox: str) -> Optional[Dict[str, Any]]:
         # bbox should be in the format: west,south,east,north (comma-separated)
-        params = {
-            "in": f"bbox:{bbox}",
-            "locationReferencing": "shape"
-        }
-        return self._make_request("flow", params)
+        return self._make_request("flow", _bbox_params(bbox))
 
     def get_traffic_incidents(self, bbox: str) -> Optional[Dict[str, Any]]:
-        params = {
-            "in": f"bbox:{bbox}",
-            "locationReferencing": "shape"
-        }
-        return self._make_request("incidents", params) 
\ No newline at end of file
+        return self._make_request("incidents", _bbox_params(bbox))
+
+class AsyncHereAPIClient:
+    """
+    Async HERE API v7 client for concurrent extraction.
+
+    Use as an async context manager. All requests share one pooled httpx
+    connection set with keep-alive, at most max_concurrency of them are in
+    flight at once and starts are spaced to requests_per_second, so many
+    flow/incident calls can be awaited together.
+    """
+    
+    def __init__(self, max_concurrency: Optional[int] = None, requests_per_second: Optional[float] = None):
+        self.api_key = settings.HERE_API_KEY
+        self.base_url = "https://data.traffic.hereapi.com/v7"
+        self.max_concurrency = max_concurrency or settings.HERE_MAX_CONCURRENCY
+        self.requests_per_second = (
+            settings.HERE_REQUESTS_PER_SECOND if requests_per_second is None else requests_per_second
+        )
+        self.client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._rate_lock: Optional[asyncio.Lock] = None
+        self._next_slot = 0.0
+        self.calls_made = 0  # Requests sent, for API budget accounting
+    
+    async def __aenter__(self) -> "AsyncHereAPIClient":
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers={'User-Agent': 'Floficient/1.0'},
+            timeout=20,
+            limits=httpx.Limits(
+                max_connections=self.max_concurrency,
+                max_keepalive_connections=self.max_concurrency
+            )
+        )
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._rate_lock = asyncio.Lock()
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        await self.client.aclose()
+        self.client = None
+    
+    async def _throttle(self):
+        """Space request starts at least 1/requests_per_second apart."""
+        if not self.requests_per_second:
+            return
+        async with self._rate_lock:
+            loop = asyncio.get_running_loop()
+            wait = self._next_slot - loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._next_slot = max(loop.time(), self._next_slot) + 1.0 / self.requests_per_second
+    
+    async def _make_request(self, endpoint: str, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Make a request to the HERE API with error handling."""
+        params['apiKey'] = self.api_key
+        async with self._semaphore:
+            await self._throttle()
+            try:
+                logger.info(f"Making async request to: {endpoint} ({params['in']})")
+                self.calls_made += 1
+                response = await self.client.get(f"/{endpoint}", params=params)
+                if response.status_code == 200:
+                    return response.json()
+                else:
+                    logger.error(f"{response.status_code} {response.reason_phrase} - API key might be invalid or request format incorrect")
+                    logger.error(f"Response: {response.text}")
+                    return None
+            except Exception as e:
+                logger.error(f"Exception during API request: {e}")
+                return None
+    
+    async def get_traffic_flow(self, bbox: str) -> Optional[Dict[str, Any]]:
+        return await self._make_request("flow", _bbox_params(bbox))
+    
+    async def get_traffic_incidents(self, bbox: str) -> Optional[Dict[str, Any]]:
+        return await self._make_request("incidents", _bbox_params(bbox))
+
+def _bbox_params(bbox: str) -> Dict[str, Any]:
+    """Query params for a west,south,east,north bbox with shape referencing."""
+    return {
+        "in": f"bbox:{bbox}",
+        "locationReferencing": "shape"
+    }
+ 
\ No newline at end of file
@@ -0,0 +1,134 @@
+import asyncio
+import threading
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+import orjson
+
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+Bounds = Tuple[float, float, float, float]
+
+class Section(NamedTuple):
+    """A list in a message: items encoded once, each with its (west, south, east, north)."""
+    name: str
+    items: List[bytes]
+    bounds: np.ndarray  # Shape (len(items), 4)
+
+class SpatialMessage:
+    """
+    One JSON object of header fields and sections, cut to each subscriber's bbox.
+
+    Items are encoded once; render() only selects the ones a bbox
+    intersects (one vectorized test per section) and joins their bytes.
+    """
+
+    def __init__(self, event: str, header: Dict[str, Any], sections: Sequence[Section]):
+        self.event = event
+        self.header = orjson.dumps(dict(header, type=event))
+        self.sections = sections
+
+    def render(self, bounds: Optional[Bounds]) -> Optional[bytes]:
+        """The message as seen from bounds (everything if None); None when no item falls in it."""
+        parts = []
+        selected_total = 0
+        for section in self.sections:
+            if bounds is None:
+                selected = section.items
+            else:
+                west, south, east, north = bounds
+                extent = section.bounds
+                inside = (extent[:, 0] <= east) & (extent[:, 2] >= west) & (extent[:, 1] <= north) & (extent[:, 3] >= south)
+                selected = [section.items[index] for index in np.flatnonzero(inside)]
+            selected_total += len(selected)
+            parts.append(b'"' + section.name.encode() + b'":[' + b",".join(selected) + b"]")
+        if not selected_total:
+            return None
+        return self.header[:-1] + b"," + b",".join(parts) + b"}"
+
+class Subscriber:
+    """One connected stream client: its bbox (None for everything) and its pending (event, body) pairs."""
+
+    def __init__(self, bounds: Optional[Bounds], queue_size: int):
+        self.bounds = bounds
+        self.queue: "asyncio.Queue[Tuple[str, bytes]]" = asyncio.Queue(queue_size)
+
+class Broadcaster:
+    """
+    Fan messages out to every connected stream client.
+
+    publish() is called from the ETL's worker thread. It renders the
+    message there, once per distinct subscriber bbox, and hands the bodies
+    to the event loop, which only enqueues them; the loop does no encoding
+    however many clients are connected. A client whose queue is full is
+    far behind: its queue is replaced by a single `resync` event, after
+    which it should reload from the GET endpoints.
+    """
+
+    def __init__(self, queue_size: int = 16):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscribers: "set[Subscriber]" = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.published = 0
+        self.delivered = 0
+        self.resyncs = 0
+
+    @property
+    def clients(self) -> int:
+        return len(self._subscribers)
+
+    def subscribe(self, bounds: Optional[Bounds]) -> Subscriber:
+        """Register a client; call from the event loop that will serve it."""
+        subscriber = Subscriber(bounds, self.queue_size)
+        with self._lock:
+            self._loop = asyncio.get_running_loop()
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish(self, message: SpatialMessage) -> int:
+        """Send message to each subscriber it has items for; returns how many. Any thread."""
+        with self._lock:
+            subscribers = list(self._subscribers)
+            loop = self._loop
+        if not subscribers or loop is None or loop.is_closed():
+            return 0
+        rendered = {}
+        deliveries = []
+        for subscriber in subscribers:
+            bounds = subscriber.bounds
+            if bounds not in rendered:
+                rendered[bounds] = message.render(bounds)
+            if rendered[bounds] is not None:
+                deliveries.append((subscriber, rendered[bounds]))
+        loop.call_soon_threadsafe(self._deliver, message.event, deliveries)
+        with self._lock:
+            self.published += 1
+        logger.info(f"Broadcast {message.event} to {len(deliveries)} of {len(subscribers)} clients ({len(rendered)} distinct bboxes)")
+        return len(deliveries)
+
+    def _deliver(self, event: str, deliveries: List[Tuple[Subscriber, bytes]]):
+        for subscriber, body in deliveries:
+            try:
+                subscriber.queue.put_nowait((event, body))
+            except asyncio.QueueFull:
+                while not subscriber.queue.empty():
+                    subscriber.queue.get_nowait()
+                subscriber.queue.put_nowait(("resync", b'{"type":"resync"}'))
+                self.resyncs += 1
+        self.delivered += len(deliveries)
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "clients": len(self._subscribers),
+                "published": self.published,
+                "delivered": self.delivered,
+                "resyncs": self.resyncs
+            }
@@ -1,4 +1,5 @@
-from typing import List, Tuple
+import hashlib
+from typing import Any, Dict, List, Optional, Tuple
 
 def calculate_midpoint(coordinates: List[str]) -> Tuple[float, float]:
     """
@@ -26,3 +27,80 @@ def calculate_midpoint(coordinates: List[str]) -> Tuple[float, float]:
         
     except (ValueError, IndexError):
         return 34.0522, -118.2437  # Default to Los Angeles
+
+def shape_fingerprint(location: Dict[str, Any], precision: int = 5) -> Optional[str]:
+    """
+    Stable fingerprint of a HERE location shape.
+    
+    Args:
+        location: HERE v7 location object with shape.links[].points[]
+        precision: Decimal places kept per coordinate (5 is ~1 m)
+    
+    Returns:
+        Hex digest identifying the shape; identical segments returned by
+        overlapping bounding boxes get the same fingerprint. None if the
+        shape has no points, since all such shapes would share one digest
+    
+    Raises:
+        KeyError, TypeError: a point without numeric lat/lng
+    """
+    links = location.get('shape', {}).get('links', [])
+    parts = [
+        f"{round(pt['lat'], precision)},{round(pt['lng'], precision)}"
+        for link in links
+        for pt in link.get('points', [])
+    ]
+    if not parts:
+        return None
+    return hashlib.sha1(";".join(parts).encode()).hexdigest()
+
+def flow_identity(result: Dict[str, Any]) -> Optional[str]:
+    """Segment id of a HERE flow result: its shape fingerprint; None without a usable shape."""
+    try:
+        return shape_fingerprint(result.get('location', {}))
+    except (KeyError, TypeError):
+        return None
+
+def geometry_bounds(geometry: Optional[List[List[float]]], lat: float, lon: float) -> Tuple[float, float, float, float]:
+    """
+    Bounding box of a [lon, lat] polyline, or of the point if it has none.
+    
+    Returns:
+        Tuple of (min_lon, min_lat, max_lon, max_lat)
+    """
+    if not geometry:
+        return lon, lat, lon, lat
+    lons = [pt[0] for pt in geometry]
+    lats = [pt[1] for pt in geometry]
+    return min(lons), min(lats), max(lons), max(lats)
+
+def polyline_intersects_bounds(
+    geometry: Optional[List[List[float]]],
+    lat: float,
+    lon: float,
+    bounds: Tuple[float, float, float, float]
+) -> bool:
+    """
+    Whether a [lon, lat] polyline, or the point if it has none, touches the
+    closed box bounds (west, south, east, north).
+    """
+    west, south, east, north = bounds
+    points = geometry or [[lon, lat]]
+    if len(points) == 1:
+        x, y = points[0][0], points[0][1]
+        return west <= x <= east and south <= y <= north
+    for start, end in zip(points, points[1:]):
+        x0, y0, dx, dy = start[0], start[1], end[0] - start[0], end[1] - start[1]
+        # Liang-Barsky: narrow the edge's parameter range [0, 1] to each side of the box
+        t0, t1 = 0.0, 1.0
+        for p, q in ((-dx, x0 - west), (dx, east - x0), (-dy, y0 - south), (dy, north - y0)):
+            if p == 0:
+                if q < 0:
+                    t0 = 2.0  # Parallel to this side and outside it
+            elif p < 0:
+                t0 = max(t0, q / p)
+            else:
+                t1 = min(t1, q / p)
+        if t0 <= t1:
+            return True
+    return False
@@ -0,0 +1,135 @@
+"""
+Minimal Mapbox Vector Tile (v2.1) encoder.
+
+Writes the protobuf wire format by hand: tiles here only ever hold
+LineString and Point layers with a few scalar properties, which does not
+justify a protobuf or mapbox-vector-tile dependency. Geometry must already
+be in integer tile coordinates (0..extent, y down).
+See https://github.com/mapbox/vector-tile-spec/tree/master/2.1
+"""
+import math
+import struct
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+EXTENT = 4096
+
+# Geometry types and commands
+POINT = 1
+LINESTRING = 2
+MOVE_TO = 1
+LINE_TO = 2
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+def _zigzag(value: int) -> int:
+    return (value << 1) ^ (value >> 63)
+
+def _key(field: int, wire_type: int) -> bytes:
+    return _varint((field << 3) | wire_type)
+
+def _bytes_field(field: int, payload: bytes) -> bytes:
+    return _key(field, 2) + _varint(len(payload)) + payload
+
+def _packed(field: int, values: Iterable[int]) -> bytes:
+    return _bytes_field(field, b"".join(_varint(value) for value in values))
+
+def _value(value: Any) -> bytes:
+    """Encode a property value as a vector_tile.Tile.Value message."""
+    if isinstance(value, bool):
+        return _key(7, 0) + _varint(int(value))
+    if isinstance(value, int):
+        return _key(6, 0) + _varint(_zigzag(value)) if value < 0 else _key(5, 0) + _varint(value)
+    if isinstance(value, float):
+        return _key(3, 1) + struct.pack("<d", value)
+    return _bytes_field(1, str(value).encode("utf-8"))
+
+def line_commands(parts: Sequence[np.ndarray]) -> List[int]:
+    """Command integers for a (multi)linestring given as integer coordinate arrays."""
+    commands = []
+    cursor = (0, 0)
+    for part in parts:
+        if len(part) < 2:
+            continue
+        commands.append((MOVE_TO & 0x7) | (1 << 3))
+        x, y = int(part[0][0]), int(part[0][1])
+        commands += [_zigzag(x - cursor[0]), _zigzag(y - cursor[1])]
+        cursor = (x, y)
+        commands.append((LINE_TO & 0x7) | ((len(part) - 1) << 3))
+        for px, py in part[1:]:
+            px, py = int(px), int(py)
+            commands += [_zigzag(px - cursor[0]), _zigzag(py - cursor[1])]
+            cursor = (px, py)
+    return commands
+
+def point_commands(points: Sequence[Tuple[int, int]]) -> List[int]:
+    commands = [(MOVE_TO & 0x7) | (len(points) << 3)]
+    cursor = (0, 0)
+    for x, y in points:
+        commands += [_zigzag(x - cursor[0]), _zigzag(y - cursor[1])]
+        cursor = (x, y)
+    return commands
+
+class Layer:
+    """One tile layer; add features, then encode()."""
+
+    def __init__(self, name: str, extent: int = EXTENT):
+        self.name = name
+        self.extent = extent
+        self._keys: Dict[str, int] = {}
+        self._values: Dict[Tuple[type, Any], int] = {}
+        self._features: List[bytes] = []
+
+    def __len__(self):
+        return len(self._features)
+
+    def _tags(self, properties: Dict[str, Any]) -> List[int]:
+        tags = []
+        for key, value in properties.items():
+            if value is None:
+                continue
+            if isinstance(value, float) and not math.isfinite(value):
+                continue
+            tags.append(self._keys.setdefault(key, len(self._keys)))
+            tags.append(self._values.setdefault((type(value), value), len(self._values)))
+        return tags
+
+    def add(self, geometry_type: int, commands: List[int], properties: Dict[str, Any],
+            feature_id: Optional[int] = None):
+        if not commands:
+            return
+        feature = b""
+        if feature_id is not None:
+            feature += _key(1, 0) + _varint(feature_id)
+        tags = self._tags(properties)
+        if tags:
+            feature += _packed(2, tags)
+        feature += _key(3, 0) + _varint(geometry_type)
+        feature += _packed(4, commands)
+        self._features.append(feature)
+
+    def encode(self) -> bytes:
+        layer = _key(15, 0) + _varint(2)
+        layer += _bytes_field(1, self.name.encode("utf-8"))
+        for feature in self._features:
+            layer += _bytes_field(2, feature)
+        for key in self._keys:
+            layer += _bytes_field(3, key.encode("utf-8"))
+        for (_, value) in self._values:
+            layer += _bytes_field(4, _value(value))
+        layer += _key(5, 0) + _varint(self.extent)
+        return layer
+
+def encode_tile(layers: Iterable[Layer]) -> bytes:
+    """Serialize layers into a vector tile; empty layers are left out."""
+    return b"".join(_bytes_field(3, layer.encode()) for layer in layers if len(layer))
@@ -0,0 +1,98 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Hashable, Optional, Tuple
+
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+class CachedResponse:
+    """A rendered response body with its strong ETag."""
+
+    __slots__ = ("generation", "body", "media_type", "etag")
+
+    def __init__(self, generation: int, body: bytes, media_type: str = "application/json"):
+        self.generation = generation
+        self.body = body
+        self.media_type = media_type
+        self.etag = f'"{hashlib.sha1(body).hexdigest()}"'
+
+class ResponseCache:
+    """
+    Rendered GET responses, valid for one ETL generation.
+
+    Between refreshes the stored data does not change, so a response can be
+    served again byte for byte. Every entry is tagged with the generation
+    that was current when its request started reading the database;
+    invalidate() bumps the generation and drops every entry under the lock,
+    so a response built from pre-refresh data can never be stored as
+    current. Entries are evicted least recently used once the bodies exceed
+    max_bytes.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, CachedResponse]" = OrderedDict()
+        self._bytes = 0
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, key: Hashable) -> Tuple[int, Optional[CachedResponse]]:
+        """(current generation, entry or None); build misses against that generation."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return self._generation, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._generation, entry
+
+    def put(self, key: Hashable, generation: int, body: bytes, media_type: str = "application/json") -> CachedResponse:
+        """Store body for key unless the generation moved on while it was built."""
+        entry = CachedResponse(generation, body, media_type)
+        if len(body) > self.max_bytes:
+            return entry
+        with self._lock:
+            if generation != self._generation:
+                return entry
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old.body)
+            self._entries[key] = entry
+            self._bytes += len(body)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted.body)
+                self.evictions += 1
+        return entry
+
+    def invalidate(self) -> int:
+        """Start a new generation (data changed); returns it."""
+        with self._lock:
+            self._generation += 1
+            dropped = len(self._entries)
+            self._entries.clear()
+            self._bytes = 0
+        logger.info(f"Response cache generation {self._generation}, dropped {dropped} entries")
+        return self._generation
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "generation": self._generation,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
@@ -0,0 +1,59 @@
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+class SingleFlight:
+    """
+    Run at most one job per key at a time and share its result.
+
+    The first caller for a key starts the job on a worker thread; every caller
+    that arrives while it is running gets the same concurrent.futures.Future.
+    Because the shared result is a thread-safe Future rather than an asyncio
+    object, it can be awaited from any event loop (the API loop) and waited
+    on from plain threads (the timer threads) alike.
+    """
+
+    def __init__(self, max_workers: int = 4):
+        self._lock = threading.Lock()
+        self._in_flight: Dict[str, Future] = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="single-flight")
+
+    def submit(self, key: str, fn: Callable[..., Any], *args: Any) -> Future:
+        """Start fn for key unless it is already running; return the shared future."""
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                logger.info(f"Joining in-flight '{key}' job")
+                return future
+            future = self._executor.submit(fn, *args)
+            self._in_flight[key] = future
+        future.add_done_callback(lambda done: self._finish(key, done))
+        return future
+
+    def _finish(self, key: str, future: Future):
+        with self._lock:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+    def in_progress(self, key: str) -> bool:
+        with self._lock:
+            return key in self._in_flight
+
+    async def run(self, key: str, fn: Callable[..., Any], *args: Any, timeout: Optional[float] = None) -> Any:
+        """
+        Start or join the job for key and await its result.
+
+        Raises asyncio.TimeoutError if timeout (seconds) expires first; the job
+        itself keeps running for the other waiters.
+        """
+        future = asyncio.wrap_future(self.submit(key, fn, *args))
+        return await asyncio.wait_for(asyncio.shield(future), timeout)
+
+    def run_sync(self, key: str, fn: Callable[..., Any], *args: Any, timeout: Optional[float] = None) -> Any:
+        """Blocking variant of run() for callers outside an event loop."""
+        return self.submit(key, fn, *args).result(timeout)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Before/after benchmark for TrafficFlowETL.extend_congestion_geometry
+
+Usage:
+    PYTHONPATH=backend python3 backend/bench/bench_extend_geometry.py flow_payload.json [sf_roads.json]
+
+flow_payload.json is a recorded response from the HERE v7 /flow endpoint
+(e.g. saved from test_api_response.py).
+"""
+import json
+import sys
+import tempfile
+import time
+import os
+
+from shapely.geometry import LineString, Point
+
+from app.db.road_lookup import RoadLookup
+from app.db.build_road_snapshot import build_snapshot, ROADS_FILE
+from app.scheduler.traffic_flow import TrafficFlowETL
+
+
+def legacy_extend_congestion_geometry(osm_roads, osm_lines, geometry, extend_points=3):
+    """The original linear-scan implementation, kept here for comparison."""
+    if not geometry or len(geometry) < 2:
+        return geometry
+    mid_idx = len(geometry) // 2
+    mid_point = Point(geometry[mid_idx])
+    min_dist = float('inf')
+    best_line = None
+    for road, line in zip(osm_roads, osm_lines):
+        dist = line.distance(mid_point)
+        if dist < min_dist:
+            min_dist = dist
+            best_line = line
+    if not best_line:
+        return geometry
+    coords = list(best_line.coords)
+    def closest_idx(pt):
+        return min(range(len(coords)), key=lambda i: Point(coords[i]).distance(Point(pt)))
+    start_idx = closest_idx(geometry[0])
+    end_idx = closest_idx(geometry[-1])
+    new_start = max(0, start_idx - extend_points)
+    new_end = min(len(coords) - 1, end_idx + extend_points)
+    return coords[new_start:new_end+1]
+
+
+def load_geometries(payload_file):
+    with open(payload_file) as f:
+        results = json.load(f).get('results', [])
+    geometries = []
+    for result in results:
+        links = result.get('location', {}).get('shape', {}).get('links', [])
+        if links and links[0].get('points'):
+            geometries.append([[pt['lng'], pt['lat']] for pt in links[0]['points']])
+    return geometries
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    payload_file = sys.argv[1]
+    roads_file = sys.argv[2] if len(sys.argv) > 2 else ROADS_FILE
+
+    geometries = load_geometries(payload_file)
+    with open(roads_file) as f:
+        osm_roads = json.load(f)
+    snapshot_dir = build_snapshot(roads_file, os.path.join(tempfile.mkdtemp(), 'snapshot'))
+    etl = TrafficFlowETL.__new__(TrafficFlowETL)
+    etl.road_lookup = RoadLookup(snapshot_dir)
+    osm_lines = [LineString(road['geometry']) for road in osm_roads]
+    print(f"📊 {len(geometries)} flow segments, {len(osm_roads)} OSM roads")
+
+    start = time.perf_counter()
+    before = [legacy_extend_congestion_geometry(osm_roads, osm_lines, g) for g in geometries]
+    legacy_secs = time.perf_counter() - start
+
+    start = time.perf_counter()
+    # Same path as TrafficFlowETL.transform: one batched midpoint match, then extend
+    midpoints = [g[len(g) // 2] for g in geometries]
+    road_idx, _, _ = etl.match_roads([pt[1] for pt in midpoints], [pt[0] for pt in midpoints])
+    after = [etl.extend_congestion_geometry(g, road_idx=int(i)) for g, i in zip(geometries, road_idx)]
+    indexed_secs = time.perf_counter() - start
+
+    mismatches = sum(1 for a, b in zip(before, after) if list(map(tuple, a)) != list(map(tuple, b)))
+    print(f"   linear scan: {legacy_secs:.2f}s ({legacy_secs / len(geometries) * 1000:.2f} ms/segment)")
+    print(f"   indexed:     {indexed_secs:.2f}s ({indexed_secs / len(geometries) * 1000:.3f} ms/segment)")
+    print(f"   speedup:     {legacy_secs / indexed_secs:.0f}x")
+    print(f"   mismatches:  {mismatches}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Tests run against a throwaway SQLite database; settings are read at import,
+so the environment is set before anything from app is imported.
+"""
+import json
+import os
+import tempfile
+
+_database_dir = tempfile.mkdtemp(prefix="traffic-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_database_dir, 'test.db')}"
+os.environ.setdefault("HERE_API_KEY", "test")
+
+import pytest
+
+from app.db import road_lookup
+from app.db.build_road_snapshot import build_snapshot
+from app.db.init_db import init_db
+from app.db.models import Base
+from app.db.session import SessionLocal, engine
+from app.scheduler.traffic_flow import TrafficFlowETL
+from app.scheduler.traffic_incidents import TrafficIncidentsETL
+from tests.payloads import ROADS, flow_payload
+
+init_db()
+
+# Every get_road_lookup() in the tests gets the small network of tests.payloads
+_roads_file = os.path.join(_database_dir, "roads.json")
+with open(_roads_file, "w") as f:
+    json.dump(ROADS, f)
+road_lookup._shared_lookups[road_lookup.SNAPSHOT_DIR] = road_lookup.RoadLookup(
+    build_snapshot(_roads_file, os.path.join(_database_dir, "roads_snapshot"))
+)
+
+@pytest.fixture
+def db():
+    """A session on an empty database."""
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.rollback()
+        session.close()
+        with engine.begin() as conn:
+            for table in reversed(Base.metadata.sorted_tables):
+                conn.execute(table.delete())
+
+@pytest.fixture
+def load_flow(db):
+    """load_flow(at, jam_factors): one refresh of tests.payloads.flow_payload as of `at`; its segment ids."""
+    etl = TrafficFlowETL()
+    def load(at, jam_factors):
+        rows = etl.transform(flow_payload(jam_factors))
+        for row in rows:
+            row["timestamp"] = at
+        etl.load(rows, db)
+        db.commit()
+        return [row["segment_id"] for row in rows]
+    return load
+
+@pytest.fixture
+def load_incidents(db):
+    """load_incidents(results, bboxes=None): one incident feed, fetched for bboxes; its rows."""
+    etl = TrafficIncidentsETL()
+    def load(results, bboxes=None):
+        rows = etl.transform({"results": results})
+        etl.load(rows, db, bboxes=bboxes)
+        db.commit()
+        return rows
+    return load
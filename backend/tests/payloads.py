@@ -0,0 +1,60 @@
+"""Small road network and HERE v7 payload builders shared by the tests."""
+from typing import List, Optional, Sequence, Tuple
+
+Point = Tuple[float, float]  # lon, lat
+
+def _line(start: Point, end: Point, vertices: int = 11) -> List[List[float]]:
+    return [
+        [start[0] + (end[0] - start[0]) * step / (vertices - 1), start[1] + (end[1] - start[1]) * step / (vertices - 1)]
+        for step in range(vertices)
+    ]
+
+# Extent: -122.46 .. -122.40 lon, 37.74 .. 37.78 lat
+ROADS = [
+    {"osm_id": 1, "name": "Market Street", "geometry": _line((-122.45, 37.75), (-122.40, 37.75))},
+    {"osm_id": 2, "name": "Valencia Street", "geometry": _line((-122.42, 37.74), (-122.42, 37.78))},
+    {"osm_id": 3, "name": "Geary Boulevard", "geometry": _line((-122.46, 37.78), (-122.41, 37.78))},
+]
+
+def flow_result(
+    points: Sequence[Point],
+    jam_factor: float = 2.0,
+    speed: float = 10.0,
+    description: str = "HERE road"
+) -> dict:
+    return {
+        "location": {
+            "description": description,
+            "length": 100,
+            "shape": {"links": [{"points": [{"lat": lat, "lng": lon} for lon, lat in points], "length": 100}]}
+        },
+        "currentFlow": {"speed": speed, "freeFlow": 15.0, "jamFactor": jam_factor, "confidence": 0.9, "traversability": "open"}
+    }
+
+def market_segments(count: int) -> List[List[Point]]:
+    """Geometries of count consecutive short segments along Market Street."""
+    return [[(-122.45 + 0.001 * index, 37.7501), (-122.4495 + 0.001 * index, 37.7501)] for index in range(count)]
+
+def flow_payload(jam_factors: Sequence[float], speeds: Optional[Sequence[float]] = None) -> dict:
+    """One Market Street segment per jamFactor, in the same order every time."""
+    speeds = speeds or [10.0] * len(jam_factors)
+    return {"results": [
+        flow_result(points, jam_factor, speed)
+        for points, jam_factor, speed in zip(market_segments(len(jam_factors)), jam_factors, speeds)
+    ]}
+
+def incident_result(here_id: str, point: Point, incident_type: str = "accident") -> dict:
+    lon, lat = point
+    return {
+        "location": {"description": "Market St", "shape": {"links": [{"points": [{"lat": lat, "lng": lon}]}]}},
+        "incidentDetails": {
+            "id": here_id,
+            "originalId": f"original-{here_id}",
+            "type": incident_type,
+            "description": {"value": f"{incident_type} on Market St"},
+            "startTime": "2026-10-14T00:00:00Z",
+            "endTime": "2026-10-15T00:00:00Z",
+            "criticality": "major",
+            "roadClosed": False
+        }
+    }
@@ -0,0 +1,45 @@
+import asyncio
+
+import numpy as np
+import orjson
+
+from app.utils.broadcast import Broadcaster, Section, SpatialMessage
+
+MARKET = (-122.45, 37.75, -122.40, 37.75)
+OAKLAND = (-122.30, 37.80, -122.30, 37.80)
+
+def message():
+    return SpatialMessage("delta", {"generation": 3}, [
+        Section("segments", [b'"market"', b'"oakland"'], np.array([MARKET, OAKLAND])),
+        Section("ended_incidents", [], np.empty((0, 4)))
+    ])
+
+def test_render_cuts_sections_to_the_bbox():
+    assert orjson.loads(message().render(None)) == {
+        "generation": 3, "type": "delta", "segments": ["market", "oakland"], "ended_incidents": []
+    }
+    assert orjson.loads(message().render((-122.43, 37.70, -122.42, 37.80)))["segments"] == ["market"]
+    assert message().render((-121.0, 36.0, -120.0, 37.0)) is None
+
+def test_publish_delivers_per_bbox_and_resyncs_slow_clients():
+    async def run():
+        broadcaster = Broadcaster(queue_size=2)
+        everything = broadcaster.subscribe(None)
+        sf = broadcaster.subscribe((-122.52, 37.70, -122.35, 37.83))
+        elsewhere = broadcaster.subscribe((-121.0, 36.0, -120.0, 37.0))
+        assert broadcaster.publish(message()) == 2
+        await asyncio.sleep(0)
+        event, body = sf.queue.get_nowait()
+        assert event == "delta" and orjson.loads(body)["segments"] == ["market"]
+        assert elsewhere.queue.empty()
+
+        # A third message overflows the queue of the client that read nothing
+        broadcaster.publish(message())
+        broadcaster.publish(message())
+        await asyncio.sleep(0)
+        assert everything.queue.qsize() == 1 and everything.queue.get_nowait()[0] == "resync"
+        assert sf.queue.qsize() == 2
+
+        broadcaster.unsubscribe(everything)
+        assert broadcaster.status() == {"clients": 2, "published": 3, "delivered": 6, "resyncs": 1}
+    asyncio.run(run())
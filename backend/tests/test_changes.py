@@ -0,0 +1,42 @@
+from datetime import datetime
+
+from app.db.changes import ChangeTracker
+from tests.payloads import incident_result
+
+BBOX = "-122.46,37.74,-122.40,37.78"
+
+def test_first_collect_only_records_the_current_state(db, load_flow):
+    tracker = ChangeTracker()
+    load_flow(datetime.utcnow(), [2.0, 2.0])
+    assert tracker.collect(db) is None
+    changes = tracker.collect(db)
+    assert (changes.segments, changes.incidents, changes.ended) == ([], [], [])
+
+def test_collect_returns_segments_whose_value_changed(db, load_flow):
+    tracker = ChangeTracker()
+    segments = load_flow(datetime.utcnow(), [2.0, 2.0])
+    tracker.collect(db)
+
+    load_flow(datetime.utcnow(), [2.0, 6.0])
+    changes = tracker.collect(db)
+    assert [(row.segment_id, row.congestion_level) for row in changes.segments] == [(segments[1], 6.0)]
+
+    # A run that refreshed twice and ended where the last push left off
+    load_flow(datetime.utcnow(), [2.0, 2.0])
+    load_flow(datetime.utcnow(), [2.0, 6.0])
+    assert tracker.collect(db).segments == []
+
+def test_collect_returns_new_and_ended_incidents(db, load_incidents):
+    tracker = ChangeTracker()
+    tracker.collect(db)
+
+    load_incidents([incident_result("a", (-122.43, 37.7501)), incident_result("b", (-122.42, 37.76))], [BBOX])
+    changes = tracker.collect(db)
+    assert sorted(row.here_id for row in changes.incidents) == ["a", "b"]
+    assert changes.ended == []
+
+    # Seen again is not new; missing from the feed is ended
+    load_incidents([incident_result("a", (-122.43, 37.7501))], [BBOX])
+    changes = tracker.collect(db)
+    assert changes.incidents == []
+    assert [row.lat for row in changes.ended] == [37.76]
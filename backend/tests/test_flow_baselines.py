@@ -0,0 +1,22 @@
+from datetime import datetime, timedelta
+
+from app.db.flow_baselines import score_flow
+from app.db.flow_queries import flow_at
+
+# Five minute refreshes inside one hour-of-week slot
+START = datetime(2026, 10, 14, 8, 0)
+
+def test_only_values_reported_in_the_slot_are_left_out_of_it(db, load_flow):
+    for minutes in range(0, 20, 5):
+        segments = load_flow(START + timedelta(minutes=minutes), [2.0, 2.0])
+    # Reports only the first segment; the second one's value is carried forward
+    at = START + timedelta(minutes=20)
+    load_flow(at, [6.0])
+    rows = {row.segment_id: row for row in flow_at(db, at)}
+    assert rows[segments[0]].reported and not rows[segments[1]].reported
+
+    reported, carried = score_flow(db, [(at, rows[segment_id]) for segment_id in segments])
+    # Scored against the four earlier reports, without its own
+    assert reported["congestion_baseline"] == 2.0 and reported["anomaly_score"] > 0
+    # All four reports of the slot are other reports: enough to score
+    assert carried["congestion_baseline"] == 2.0 and carried["anomaly_score"] == 0.0
@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta
+
+from app.api.routes import flow_record
+from app.db.flow_queries import flow_at, recent_flow
+from app.db.models import FlowRefresh, FlowRefreshSegment, TrafficFlowObservation
+
+START = datetime(2026, 10, 14, 8, 0)
+
+def values_at(db, at):
+    return {row.segment_id: row.congestion_level for row in flow_at(db, at)}
+
+def test_only_changes_are_stored_and_reads_carry_them_forward(db, load_flow):
+    segments = load_flow(START, [2.0, 2.0, 2.0])
+    load_flow(START + timedelta(minutes=5), [2.0, 6.0, 2.0])
+    # Below FLOW_JAM_FACTOR_DELTA: not a change
+    load_flow(START + timedelta(minutes=10), [2.0, 6.0, 2.2])
+
+    assert db.query(TrafficFlowObservation).count() == 4
+    assert [row.written for row in db.query(FlowRefresh).order_by(FlowRefresh.timestamp)] == [3, 1, 0]
+
+    results = recent_flow(db, 100)
+    assert len(results) == 9
+    assert [refreshed_at for refreshed_at, _ in results[::3]] == [
+        START + timedelta(minutes=10), START + timedelta(minutes=5), START
+    ]
+    assert values_at(db, START + timedelta(minutes=10)) == dict(zip(segments, [2.0, 6.0, 2.0]))
+    assert values_at(db, START + timedelta(minutes=4)) == dict(zip(segments, [2.0, 2.0, 2.0]))
+
+def test_keyframes_rewrite_unchanged_segments_and_expire_vanished_ones(db, load_flow):
+    segments = load_flow(START, [2.0, 2.0])
+    load_flow(START + timedelta(minutes=30), [2.0, 6.0])
+    # An hour after the first refresh: only the first segment is due for a keyframe
+    load_flow(START + timedelta(minutes=60), [2.0, 6.0])
+    assert db.query(TrafficFlowObservation).count() == 4
+
+    # The second segment is no longer reported; its last row ages out
+    load_flow(START + timedelta(minutes=100), [2.0])
+    assert values_at(db, START + timedelta(minutes=80)) == dict(zip(segments, [2.0, 6.0]))
+    assert values_at(db, START + timedelta(minutes=100)) == {segments[0]: 2.0}
+
+def test_history_only_holds_the_segments_each_refresh_reported(db, load_flow):
+    segments = load_flow(START, [2.0, 2.0, 2.0])
+    # A refresh that reports only the first segment, as one of another region would
+    load_flow(START + timedelta(minutes=5), [6.0])
+    history = [(refreshed_at, row.segment_id, row.congestion_level) for refreshed_at, row in recent_flow(db, 100)]
+    assert history[0] == (START + timedelta(minutes=5), segments[0], 6.0)
+    assert len(history) == 4
+    # The current value of every segment is still its latest report
+    assert values_at(db, START + timedelta(minutes=5)) == dict(zip(segments, [6.0, 2.0, 2.0]))
+
+def test_refreshes_point_at_the_observation_in_effect(db, load_flow):
+    segments = load_flow(START, [2.0, 2.0])
+    load_flow(START + timedelta(minutes=5), [2.0, 6.0])
+    stored = {(row.segment_id, row.timestamp): row.id for row in db.query(TrafficFlowObservation)}
+    reported = {(row.timestamp, row.segment_id): row.observation_id for row in db.query(FlowRefreshSegment)}
+    # Unchanged: still the first refresh's row; changed: the new one
+    assert reported[START + timedelta(minutes=5), segments[0]] == stored[segments[0], START]
+    assert reported[START + timedelta(minutes=5), segments[1]] == stored[segments[1], START + timedelta(minutes=5)]
+
+def test_record_ids_stay_unique_across_refreshes(db, load_flow):
+    load_flow(START, [2.0, 2.0])
+    load_flow(START + timedelta(minutes=5), [2.0, 2.0])
+    records = [flow_record(refreshed_at, row, {}) for refreshed_at, row in recent_flow(db, 100)]
+    assert len(records) == 4
+    assert len({record["id"] for record in records}) == 4
+    assert records[0]["id"] == f"{records[0]['timestamp']}/{records[0]['segment_id']}"
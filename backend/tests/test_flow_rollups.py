@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.db.flow_rollups import (
+    JAM_COLUMNS, aggregate_flow, bucket_start, histogram_percentile, jam_bin, rollup_rows, update_flow_rollups
+)
+
+NOW = datetime(2026, 10, 14, 12, 0)
+
+def observations(values, timestamp=NOW, road_name="Market Street"):
+    segments = [{"id": f"seg{index}", "road_name": road_name} for index in range(len(values))]
+    rows = [
+        {"segment_id": f"seg{index}", "timestamp": timestamp, "speed": 10.0 + index, "congestion_level": value}
+        for index, value in enumerate(values)
+    ]
+    return segments, rows
+
+def test_one_populated_bin_stays_within_observed_range():
+    histogram = [0] * len(JAM_COLUMNS)
+    histogram[jam_bin(9.0)] = 3
+    for percentile in (0, 50, 95, 100):
+        assert histogram_percentile(histogram, percentile, 9.0, 9.0) == 9.0
+    # Unclamped, the 95th percentile lands near the top of the bin
+    assert histogram_percentile(histogram, 95) == pytest.approx(9.475, abs=0.01)
+
+def test_percentiles_interpolate_within_bins():
+    histogram = [0] * len(JAM_COLUMNS)
+    histogram[0] = 50
+    histogram[jam_bin(5.0)] = 50
+    assert histogram_percentile(histogram, 50, 0.0, 5.0) == 0.5
+    assert histogram_percentile(histogram, 75, 0.0, 5.0) == 5.0
+    assert histogram_percentile([0] * len(JAM_COLUMNS), 50) is None
+
+def test_bucket_start():
+    assert bucket_start(datetime(2026, 10, 14, 12, 7, 31), 300) == datetime(2026, 10, 14, 12, 5)
+    assert bucket_start(datetime(2026, 10, 14, 12, 7, 31), 3600) == datetime(2026, 10, 14, 12, 0)
+
+def test_rollup_rows_group_per_key_and_bucket():
+    _, rows = observations([1.0, 3.0, 9.0])
+    rolled = rollup_rows(rows, "road_name", lambda observation: "Market Street", (300, 3600))
+    assert [(row["resolution"], row["samples"]) for row in rolled] == [(300, 3), (3600, 3)]
+    assert rolled[0]["congestion_min"] == 1.0 and rolled[0]["congestion_max"] == 9.0
+    assert rolled[0]["congestion_sum"] == 13.0
+
+def test_aggregate_merges_loads_and_clamps_percentiles(db):
+    for minutes, values in ((0, [9.0, 9.0]), (2, [9.0])):
+        segments, rows = observations(values, NOW + timedelta(minutes=minutes))
+        update_flow_rollups(db, segments, rows)
+    db.commit()
+    result = aggregate_flow(db, 300, NOW)
+    summary = result["summary"]
+    assert summary["samples"] == 3
+    assert summary["congestion_mean"] == 9.0
+    assert summary["congestion_p95"] <= summary["congestion_max"] == 9.0
+    assert len(result["buckets"]) == 1
+    assert aggregate_flow(db, 3600, NOW, segment_id="seg0")["summary"]["samples"] == 2
+    assert aggregate_flow(db, 300, NOW + timedelta(hours=1))["summary"] is None
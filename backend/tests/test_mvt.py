@@ -0,0 +1,54 @@
+from datetime import datetime
+
+import numpy as np
+
+from app.db.tiles import project, render_tile, tile_bounds, valid_tile
+from app.utils.mvt import LINESTRING, POINT, Layer, encode_tile, line_commands, point_commands
+from tests.payloads import incident_result
+
+# Market Street (tests.payloads.ROADS) lies in this tile
+MARKET_TILE = (10, 163, 395)
+
+def test_commands_match_the_spec_examples():
+    # Examples 4.3.5.1 and 4.3.5.2 of the vector tile specification
+    assert point_commands([(25, 17)]) == [9, 50, 34]
+    assert line_commands([np.array([[2, 2], [2, 10], [10, 10]])]) == [9, 4, 4, 18, 0, 16, 16, 0]
+    # Each part moves from the end of the previous one; single points are dropped
+    assert line_commands([np.array([[2, 2], [2, 10]]), np.array([[5, 5]]), np.array([[1, 1], [3, 5]])]) == [
+        9, 4, 4, 10, 0, 16, 9, 1, 17, 10, 4, 8
+    ]
+
+def test_layer_encoding_shares_keys_and_values():
+    layer = Layer("incidents")
+    layer.add(POINT, point_commands([(25, 17)]), {"type": "accident", "speed": 1.5}, feature_id=7)
+    layer.add(POINT, point_commands([(1, 1)]), {"type": "accident", "road_name": None})
+    layer.add(LINESTRING, [], {"type": "empty geometry"})
+    assert len(layer) == 2
+    assert layer._keys == {"type": 0, "speed": 1}
+    assert len(layer._values) == 2
+
+    encoded = layer.encode()
+    # Layer version (field 15) 2, then its name (field 1)
+    assert encoded.startswith(b"\x78\x02\x0a\x09incidents")
+    # Tile.layers is field 3; empty layers are left out
+    tile = encode_tile([layer, Layer("flow")])
+    assert tile[0] == 0x1A and tile.endswith(encoded)
+    assert b"flow" not in tile
+    assert encode_tile([Layer("flow")]) == b""
+
+def test_tiles_and_projection():
+    assert valid_tile(*MARKET_TILE)
+    assert not valid_tile(2, 4, 0)
+    west, south, east, north = tile_bounds(*MARKET_TILE)
+    assert west < -122.45 and east > -122.40 and south < 37.75 < north
+    corners = project(np.array([west, east]), np.array([north, south]), *MARKET_TILE)
+    np.testing.assert_allclose(corners, [[0, 0], [4096, 4096]], atol=1e-6)
+
+def test_render_tile_holds_current_flow_and_active_incidents(db, load_flow, load_incidents):
+    load_flow(datetime(2026, 10, 14, 8, 0), [2.0, 6.0])
+    load_incidents([incident_result("a", (-122.43, 37.7501)), incident_result("b", (-122.42, 37.76))])
+
+    tile, flow_features, incident_features = render_tile(db, *MARKET_TILE)
+    assert (flow_features, incident_features) == (2, 2)
+    assert b"Market Street" in tile and b"accident" in tile
+    assert render_tile(db, 10, 0, 0) == (b"", 0, 0)
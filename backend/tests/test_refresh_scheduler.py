@@ -0,0 +1,76 @@
+import math
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.scheduler.refresh_scheduler import (
+    BUSY_DEMAND, MAX_REFRESH_HOURS, MIN_REFRESH_MINUTES, USAGE_SYNC_SECONDS, RefreshScheduler, time_of_day_factor
+)
+
+REGIONS = {
+    "San Francisco": "-122.52,37.70,-122.35,37.83",
+    "Oakland": "-122.35,37.70,-122.11,37.89",
+}
+# Tuesday 18:00 and Wednesday 03:00 Pacific (daylight time)
+RUSH_HOUR = datetime(2026, 10, 14, 1, 0)
+NIGHT = datetime(2026, 10, 14, 10, 0)
+
+def scheduler(demand: float, budget: int = 250000) -> RefreshScheduler:
+    """A scheduler with nothing spent and demand per region, decayed as of now."""
+    refresh = RefreshScheduler(REGIONS, budget)
+    refresh._usage_month = "2026-10"
+    refresh._usage_synced = datetime.max  # Never read back from the database
+    refresh._demand = {region: demand for region in REGIONS}
+    return refresh
+
+def shortest_interval(refresh: RefreshScheduler, now: datetime) -> float:
+    refresh._demand_updated = now
+    return min(refresh._intervals(now).values())
+
+def test_time_of_day_factor():
+    assert time_of_day_factor(RUSH_HOUR) == 2.0
+    assert time_of_day_factor(NIGHT) == 0.25
+
+def test_nights_refresh_less_often_than_rush_hours():
+    assert shortest_interval(scheduler(1.0), NIGHT) > shortest_interval(scheduler(1.0), RUSH_HOUR)
+
+def test_more_demand_refreshes_more_often():
+    quiet = shortest_interval(scheduler(0.5), NIGHT)
+    busy = shortest_interval(scheduler(5.0), NIGHT)
+    assert busy < quiet
+
+def test_intervals_stay_within_bounds():
+    assert shortest_interval(scheduler(BUSY_DEMAND), RUSH_HOUR) == MIN_REFRESH_MINUTES * 60
+    assert shortest_interval(scheduler(0.0), RUSH_HOUR) == MAX_REFRESH_HOURS * 3600
+
+def test_no_budget_left_stops_refreshes():
+    refresh = scheduler(BUSY_DEMAND, budget=1000)
+    refresh._calls_spent = 1000
+    assert all(interval == math.inf for interval in refresh._intervals(RUSH_HOUR).values())
+
+def test_busy_week_spends_the_allowed_rate():
+    refresh = scheduler(BUSY_DEMAND)
+    allowed = refresh._allowed_calls_per_second(RUSH_HOUR)
+    hours = [RUSH_HOUR + timedelta(hours=hour) for hour in range(7 * 24)]
+    mean_rate = sum(refresh._call_rate(allowed, now) for now in hours) / len(hours)
+    assert mean_rate == pytest.approx(allowed)
+
+def test_due_jobs_follow_last_refresh():
+    refresh = scheduler(1.0)
+    refresh._demand_updated = NIGHT
+    assert len(refresh.due_jobs(NIGHT)) == len(refresh.all_jobs())
+    refresh.record_refresh(refresh.all_jobs(), NIGHT)
+    assert refresh.due_jobs(NIGHT + timedelta(minutes=MIN_REFRESH_MINUTES - 1)) == []
+
+def test_workers_share_the_monthly_call_count(db):
+    first, second = RefreshScheduler(REGIONS, 1000), RefreshScheduler(REGIONS, 1000)
+    first.record_calls(400)
+    second.record_calls(500)
+    assert second._calls_spent == 900
+
+    # The other worker's calls count once its copy is read back
+    later = datetime.utcnow() + timedelta(seconds=USAGE_SYNC_SECONDS)
+    first._intervals(later)
+    assert first._calls_spent == 900
+    first.record_calls(100)
+    assert all(interval == math.inf for interval in first._intervals(later).values())
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from app.db.road_lookup import get_road_lookup
+from app.scheduler.traffic_flow import TrafficFlowETL
+from tests.payloads import flow_result
+
+@pytest.fixture
+def lookup():
+    return get_road_lookup()
+
+@pytest.fixture
+def flow_etl():
+    etl = TrafficFlowETL.__new__(TrafficFlowETL)
+    etl._road_lookup = None
+    return etl
+
+def test_match_many_finds_the_exactly_nearest_road(lookup):
+    road_idx, names, distances = lookup.match_many([37.7502, 37.7600, 37.7795], [-122.4300, -122.4201, -122.4400])
+    assert names.tolist() == ["Market Street", "Valencia Street", "Geary Boulevard"]
+    assert distances == pytest.approx([0.0002, 0.0001, 0.0005])
+    assert lookup.find_nearest_road(37.7502, -122.43) == "Market Street"
+
+def test_max_distance_leaves_far_points_unmatched(lookup):
+    road_idx, names, distances = lookup.match_many([37.7502, 37.7650], [-122.43, -122.44], max_distance=0.001)
+    assert names.tolist() == ["Market Street", None]
+    assert road_idx[1] == -1 and distances[1] == np.inf
+    # Per-point radii: inf for no limit
+    _, names, _ = lookup.match_many([37.7502, 37.7650], [-122.43, -122.44], max_distance=[0.001, np.inf])
+    assert names.tolist() == ["Market Street", "Market Street"]
+
+def test_cutoff_applies_only_outside_the_network_extent(lookup, flow_etl):
+    assert lookup.extent == pytest.approx((-122.46, 37.74, -122.40, 37.78))
+    # ~170 m from the nearest road, inside the extent: matched, as without regions
+    # ~180 m outside the extent: left to the HERE description; ~20 m outside: matched
+    lats = [37.7650, 37.7516, 37.7502]
+    lons = [-122.44, -122.398, -122.3998]
+    _, names, _ = flow_etl.match_roads(lats, lons)
+    assert names.tolist() == ["Market Street", None, "Market Street"]
+
+def test_transform_names_and_extends_segments(flow_etl):
+    rows = flow_etl.transform({"results": [
+        flow_result([(-122.4305, 37.7501), (-122.4295, 37.7501)], description="Market St"),
+        flow_result([(-122.30, 37.80), (-122.299, 37.80)], description="Oakland road"),
+    ]})
+    inside, outside = rows
+    assert inside["road_name"] == "Market Street"
+    # Extended along Market Street by up to 3 vertices each way
+    assert len(inside["geometry"]) > 2 and all(lat == pytest.approx(37.75) for _, lat in inside["geometry"])
+    assert outside["road_name"] == "Oakland road"
+    assert outside["geometry"] == [[-122.30, 37.80], [-122.299, 37.80]]
+    assert inside["segment_id"] != outside["segment_id"]
+
+def test_transform_skips_results_without_a_usable_shape(flow_etl):
+    shapeless = flow_result([], description="No shape")
+    malformed = flow_result([(-122.4305, 37.7501)], description="Malformed")
+    del malformed["location"]["shape"]["links"][0]["points"][0]["lat"]
+    rows = flow_etl.transform({"results": [
+        shapeless,
+        flow_result([(-122.4305, 37.7501), (-122.4295, 37.7501)], description="Market St"),
+        malformed,
+        dict(shapeless, location={"description": "No location"}),
+    ]})
+    # Only the result with a shape is kept, instead of the batch failing or sharing one segment
+    assert [row["road_name"] for row in rows] == ["Market Street"]
@@ -0,0 +1,156 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import orjson
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api import routes
+from app.db.changes import ChangeTracker
+from app.scheduler.refresh_scheduler import RefreshScheduler
+from tests.payloads import incident_result
+
+START = datetime(2026, 10, 14, 8, 0)
+BBOX = "-122.46,37.74,-122.40,37.78"
+OAKLAND_BBOX = "-122.31,37.79,-122.29,37.81"
+
+@pytest.fixture
+def api(monkeypatch):
+    """app.api.routes with no refresh ever due, so requests never reach the HERE API."""
+    monkeypatch.setattr(routes, "should_run_etl", lambda: False)
+    monkeypatch.setattr(routes, "change_tracker", ChangeTracker())
+    routes.response_cache.invalidate()
+    return routes
+
+@pytest.fixture
+def client(api):
+    app = FastAPI()
+    app.include_router(api.router, prefix="/api/v1")
+    with TestClient(app) as client:
+        yield client
+
+def test_restart_resumes_from_the_last_stored_refresh(db, api, load_flow, monkeypatch):
+    scheduler = RefreshScheduler({"San Francisco": api.SF_BBOX}, 250000)
+    monkeypatch.setattr(api, "refresh_scheduler", scheduler)
+    monkeypatch.setattr(api, "last_etl_time", None)
+    assert len(scheduler.due_jobs()) == 2
+
+    refreshed = datetime.utcnow()
+    load_flow(refreshed, [2.0])
+    api.restore_refresh_state()
+    assert api.last_etl_time == refreshed
+    # No incident was ever stored, so only incidents are still due
+    assert scheduler.due_jobs() == [("San Francisco", "incidents")]
+
+def walk(client, path, first_page, **params):
+    """Every page of a keyset walk, starting from the response of its first page."""
+    pages = [first_page]
+    while pages[-1]["next_cursor"]:
+        response = client.get(path, params=dict(params, cursor=pages[-1]["next_cursor"]))
+        assert response.status_code == 200
+        pages.append(response.json())
+    return pages
+
+def test_flow_pages_walk_every_record_once(db, client, load_flow):
+    load_flow(START, [2.0, 2.0, 2.0])
+    load_flow(START + timedelta(minutes=5), [2.0, 6.0, 2.0])
+    load_flow(START + timedelta(minutes=10), [2.0, 6.0, 2.2])
+
+    first_page = client.get("/api/v1/traffic/flow", params={"limit": 4}).json()
+    # Written after the walk began, so left out of all of its pages
+    load_flow(datetime.utcnow(), [5.0, 5.0, 5.0])
+    pages = walk(client, "/api/v1/traffic/flow", first_page, limit=4)
+
+    assert [len(page["data"]) for page in pages] == [4, 4, 1]
+    records = [record for page in pages for record in page["data"]]
+    assert len({record["id"] for record in records}) == 9
+    assert [record["timestamp"] for record in records] == sorted((record["timestamp"] for record in records), reverse=True)
+    assert records[-1]["timestamp"] == START.isoformat()
+
+    assert client.get("/api/v1/traffic/flow").json()["total"] == 12
+
+def test_cursors_only_continue_their_own_query(db, client, load_flow):
+    load_flow(START, [2.0, 2.0])
+    cursor = client.get("/api/v1/traffic/flow", params={"limit": 1}).json()["next_cursor"]
+    assert client.get("/api/v1/traffic/flow", params={"limit": 1, "cursor": cursor}).status_code == 200
+    assert client.get("/api/v1/traffic/flow", params={"limit": 1, "cursor": cursor, "hours": 2}).status_code == 400
+    assert client.get("/api/v1/traffic/flow", params={"cursor": "not-a-cursor"}).status_code == 400
+    assert client.get("/api/v1/traffic/flow", params={"limit": 1001}).status_code == 422
+
+def test_incident_pages_and_ended_incidents(db, client, load_incidents):
+    load_incidents([
+        incident_result("a", (-122.43, 37.7501)),
+        incident_result("b", (-122.42, 37.76)),
+        incident_result("c", (-122.44, 37.78))
+    ])
+    first_page = client.get("/api/v1/traffic/incidents", params={"limit": 2}).json()
+    pages = walk(client, "/api/v1/traffic/incidents", first_page, limit=2)
+    assert [len(page["data"]) for page in pages] == [2, 1]
+    ids = [record["id"] for page in pages for record in page["data"]]
+    assert ids == sorted(ids, reverse=True)
+
+    load_incidents([incident_result("a", (-122.43, 37.7501))], [BBOX])
+    routes.response_cache.invalidate()
+    assert client.get("/api/v1/traffic/incidents").json()["total"] == 1
+    ended = client.get("/api/v1/traffic/incidents", params={"include_ended": True}).json()["data"]
+    assert sorted(record["ended_at"] is None for record in ended) == [False, False, True]
+
+def test_tiles_are_served_and_revalidated(db, client, load_flow):
+    load_flow(START, [2.0, 6.0])
+    response = client.get("/api/v1/traffic/tiles/10/163/395.mvt")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == routes.MVT_MEDIA_TYPE
+    assert b"Market Street" in response.content
+
+    etag = response.headers["etag"]
+    assert client.get("/api/v1/traffic/tiles/10/163/395.mvt", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/api/v1/traffic/tiles/10/0/0.mvt").content == b""
+    assert client.get("/api/v1/traffic/tiles/2/4/0.mvt").status_code == 404
+
+def test_websocket_stream_sends_deltas_in_its_bbox(db, client, load_flow):
+    load_flow(datetime.utcnow(), [2.0, 2.0])
+    routes.push_changes()  # Records the state clients start from
+
+    with client.websocket_connect(f"/api/v1/stream?bbox={BBOX}") as websocket:
+        hello = websocket.receive_json()
+        assert (hello["type"], hello["bbox"]) == ("hello", BBOX)
+
+        segments = load_flow(datetime.utcnow(), [2.0, 6.0, 3.0])
+        routes.push_changes()
+        delta = websocket.receive_json()
+        assert delta["type"] == "delta" and delta["ended_incidents"] == [] and delta["incidents"] == []
+        changed = {segment["segment_id"]: segment for segment in delta["segments"]}
+        assert set(changed) == set(segments[1:])
+        # Clients already have the geometry of segments they loaded
+        assert "geometry" not in changed[segments[1]] and changed[segments[2]]["geometry"]
+
+        websocket.send_json({"bbox": OAKLAND_BBOX})
+        assert websocket.receive_json()["bbox"] == OAKLAND_BBOX
+        # Nothing changes near Oakland, so the next message is the reply to a bad request
+        load_flow(datetime.utcnow(), [2.0, 2.0, 3.0])
+        routes.push_changes()
+        websocket.send_text("not json")
+        assert websocket.receive_json()["type"] == "error"
+
+def test_event_stream_sends_hello_then_deltas(db, api, load_flow):
+    load_flow(datetime.utcnow(), [2.0, 2.0])
+    api.push_changes()
+
+    async def read_events():
+        response = await api.stream_changes(bbox=None)
+        events = response.body_iterator
+        try:
+            hello = await events.__anext__()
+            load_flow(datetime.utcnow(), [2.0, 6.0])
+            api.push_changes()
+            return hello, await asyncio.wait_for(events.__anext__(), 5)
+        finally:
+            await events.aclose()
+
+    hello, delta = asyncio.run(read_events())
+    assert hello.startswith(b"retry: 5000\nevent: hello\ndata: ")
+    assert delta.startswith(b"event: delta\ndata: ") and delta.endswith(b"\n\n")
+    body = orjson.loads(delta[len(b"event: delta\ndata: "):])
+    assert [segment["congestion_level"] for segment in body["segments"]] == [6.0]
+    assert api.broadcaster.clients == 0
@@ -0,0 +1,37 @@
+from sqlalchemy import select
+
+from app.db.models import RoadSegment
+from app.db.spatial import segment_bbox_filter
+from app.utils.geo import polyline_intersects_bounds
+
+BOUNDS = (0.0, 0.0, 1.0, 1.0)
+
+def test_polyline_intersects_bounds():
+    # Through the box, corner to corner, and along its edge
+    assert polyline_intersects_bounds([[-1, 0.5], [2, 0.5]], 0, 0, BOUNDS)
+    assert polyline_intersects_bounds([[-1, 2], [2, -1]], 0, 0, BOUNDS)
+    assert polyline_intersects_bounds([[1, 1], [2, 1]], 0, 0, BOUNDS)
+    # Extents overlap, the lines pass the corner
+    assert not polyline_intersects_bounds([[1.5, -1], [3, 0.6]], 0, 0, BOUNDS)
+    assert not polyline_intersects_bounds([[-1, 0.5], [0.5, 2]], 0, 0, BOUNDS)
+    # No geometry: the point
+    assert polyline_intersects_bounds(None, 0.5, 0.5, BOUNDS)
+    assert not polyline_intersects_bounds([], 1.5, 0.5, BOUNDS)
+
+def segment(segment_id, geometry, lat, lon):
+    lons, lats = [point[0] for point in geometry or [[lon, lat]]], [point[1] for point in geometry or [[lon, lat]]]
+    return RoadSegment(
+        id=segment_id, road_name="Test Road", lat=lat, lon=lon, geometry=geometry,
+        min_lon=min(lons), min_lat=min(lats), max_lon=max(lons), max_lat=max(lats)
+    )
+
+def test_bbox_filter_rechecks_the_geometry(db):
+    db.add_all([
+        segment("crossing", [[-0.5, 0.5], [1.5, 0.5]], 0.5, -0.5),
+        segment("past the corner", [[0.5, 1.5], [1.5, 0.5]], 1.5, 0.5),
+        segment("point", None, 0.5, 0.5),
+        segment("outside", [[2.0, 2.0], [3.0, 3.0]], 2.0, 2.0),
+    ])
+    db.commit()
+    found = db.execute(select(RoadSegment.id).where(segment_bbox_filter(db, (0.0, 0.0, 0.9, 0.9)))).scalars()
+    assert sorted(found) == ["crossing", "point"]
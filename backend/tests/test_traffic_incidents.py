@@ -0,0 +1,54 @@
+from app.db.models import TrafficIncident
+from app.scheduler.traffic_incidents import TrafficIncidentsETL
+from tests.payloads import incident_result
+
+# The fetched area: the whole road network of tests.payloads
+BBOX = "-122.46,37.74,-122.40,37.78"
+
+MARKET = incident_result("a", (-122.43, 37.7501))
+VALENCIA = incident_result("b", (-122.42, 37.76), "construction")
+OAKLAND = incident_result("c", (-122.30, 37.80))
+
+def incidents(db):
+    db.expire_all()
+    return {row.here_id: row for row in db.query(TrafficIncident)}
+
+def test_upsert_keeps_one_row_per_incident(db, load_incidents):
+    first_seen = load_incidents([MARKET, VALENCIA])[0]["timestamp"]
+    seen_again = load_incidents([MARKET])[0]["timestamp"]
+    current = incidents(db)
+    assert len(current) == 2
+    assert current["a"].first_seen == first_seen
+    assert current["a"].last_seen == seen_again > first_seen
+    assert current["b"].last_seen == first_seen
+    assert current["a"].road_name == "Market Street"
+
+def test_incidents_missing_from_the_feed_end_inside_the_fetched_area(db, load_incidents):
+    load_incidents([MARKET, VALENCIA, OAKLAND], [BBOX])
+    rows = load_incidents([MARKET], [BBOX])
+    current = incidents(db)
+    assert current["b"].ended_at == rows[0]["timestamp"]
+    # Still reported, or outside the area that was fetched
+    assert current["a"].ended_at is None and current["c"].ended_at is None
+
+    # Reported again: active again
+    load_incidents([MARKET, VALENCIA], [BBOX])
+    assert incidents(db)["b"].ended_at is None
+
+def test_without_bboxes_nothing_ends(db, load_incidents):
+    load_incidents([MARKET, VALENCIA], [BBOX])
+    load_incidents([MARKET])
+    assert all(row.ended_at is None for row in incidents(db).values())
+
+def test_an_empty_feed_ends_every_incident_in_the_area(db, load_incidents):
+    load_incidents([MARKET, OAKLAND], [BBOX])
+    TrafficIncidentsETL().process({"results": []}, [BBOX])
+    current = incidents(db)
+    assert current["a"].ended_at is not None and current["c"].ended_at is None
+
+def test_incidents_without_an_id_or_a_shape_are_skipped(db, load_incidents):
+    anonymous = incident_result("", (-122.43, 37.7501))
+    shapeless = dict(incident_result("", (-122.42, 37.76)), location={"description": "Market St"})
+    load_incidents([anonymous, shapeless, VALENCIA])
+    current = incidents(db)
+    assert len(current) == 2 and "b" in current